@@ -22,22 +22,78 @@ load_dotenv()
 MYGEOTAB_USERNAME = os.environ.get('MYGEOTAB_USERNAME')
 MYGEOTAB_PASSWORD = os.environ.get('MYGEOTAB_PASSWORD')
 MYGEOTAB_DATABASE = os.environ.get('MYGEOTAB_DATABASE')
+MYGEOTAB_SERVER   = os.environ.get('MYGEOTAB_SERVER', 'my.geotab.com') # host[:port] of the MyGeotab JSON-RPC API, e.g. a local stand-in
+MYGEOTAB_CA_BUNDLE = os.environ.get('MYGEOTAB_CA_BUNDLE') # certificate bundle to verify MYGEOTAB_SERVER with, e.g. a stand-in's self-signed certificate
 SFTP_HOST          = os.environ.get('SFTP_HOST')
 SFTP_USERNAME      = os.environ.get('SFTP_USERNAME')
 SFTP_KEY           = os.environ.get('SFTP_KEY')
+SFTP_POOL_SIZE     = int(os.environ.get('SFTP_POOL_SIZE', 2)) # SFTP connections kept open per server
+SFTP_IDLE_TIMEOUT  = int(os.environ.get('SFTP_IDLE_TIMEOUT', 10 * 60)) # seconds before an unused SFTP connection is closed
+SFTP_KEEPALIVE     = int(os.environ.get('SFTP_KEEPALIVE', 30)) # seconds between SSH keepalives on open SFTP connections
 FERNET_KEY        = os.environ.get('FERNET_KEY')
 GEOTAB_GROUP      = 'b279F' # Geotab group id for IFTA devices
+DEVICE_CACHE_BACKEND = os.environ.get('DEVICE_CACHE_BACKEND', 'memory') # 'memory', 'redis' (Celery broker) or 'none'
+DEVICE_CACHE_TTL  = int(os.environ.get('DEVICE_CACHE_TTL', 60 * 60)) # seconds before the device to VIN map is refreshed
+GEOTAB_FEED_RESULTS_LIMIT = int(os.environ.get('GEOTAB_FEED_RESULTS_LIMIT', 5000)) # records per GetFeed call when streaming
+# Sharded fuel tax detail fetching (run_daily_job --sharded)
+GEOTAB_DEVICES_PER_SHARD = int(os.environ.get('GEOTAB_DEVICES_PER_SHARD', 100)) # per-device Get calls sent in one ExecuteMultiCall
+GEOTAB_FETCH_SLICE_DAYS  = int(os.environ.get('GEOTAB_FETCH_SLICE_DAYS', 1)) # days covered by each shard
+GEOTAB_FETCH_WORKERS     = int(os.environ.get('GEOTAB_FETCH_WORKERS', 4)) # shards fetched at the same time
+GEOTAB_CALLS_PER_MINUTE  = int(os.environ.get('GEOTAB_CALLS_PER_MINUTE', 1000)) # MyGeotab calls allowed per account per minute
+GEOTAB_RATE_BURST_SECONDS = float(os.environ.get('GEOTAB_RATE_BURST_SECONDS', 6)) # seconds of calls that may go out at once
+GEOTAB_FETCH_RETRIES     = int(os.environ.get('GEOTAB_FETCH_RETRIES', 5)) # retries of a throttled or failed shard
+GEOTAB_RETRY_BACKOFF     = float(os.environ.get('GEOTAB_RETRY_BACKOFF', 1.0)) # upper bound in seconds of the first retry delay, doubled for each one after
+IFTA_ENTRY_BATCH_SIZE = int(os.environ.get('IFTA_ENTRY_BATCH_SIZE', 5000)) # rows per transaction when saving to the database
+ENTRY_CACHE_BACKEND = os.environ.get('ENTRY_CACHE_BACKEND', 'redis') # 'redis' (Celery broker) or 'memory', caches /api/entries/ responses
+ENTRY_CACHE_TIMEOUT = int(os.environ.get('ENTRY_CACHE_TIMEOUT', 24 * 60 * 60)) # seconds a cached /api/entries/ page is kept
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Processed report cache settings
+REPORT_CACHE_DIR       = os.environ.get('REPORT_CACHE_DIR', BASE_DIR / 'report_cache')
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+REPORT_CACHE_MAX_AGE   = int(os.environ.get('REPORT_CACHE_MAX_AGE', 24 * 60 * 60)) # seconds a cached report is reused for
+
+# IftaEntry partitioning and archival settings (python manage.py ifta_partitions)
+IFTA_PARTITION_MONTHS_AHEAD = int(os.environ.get('IFTA_PARTITION_MONTHS_AHEAD', 3)) # monthly partitions created ahead of the current month (Postgres)
+IFTA_ENTRY_HOT_MONTHS = int(os.environ.get('IFTA_ENTRY_HOT_MONTHS', 24)) # months of entries kept in the database before --archive moves them out
+IFTA_ARCHIVE_DIR = os.environ.get('IFTA_ARCHIVE_DIR', str(BASE_DIR / 'archive')) # local directory or fsspec URL (e.g. gs://bucket/archive) for archived entries
+
+# Odometer anomaly detection settings (daily_compliance_job.services.anomalies)
+ODOMETER_MAX_MPH = float(os.environ.get('ODOMETER_MAX_MPH', 90)) # fastest speed between two readings before the odometer counts as jumping
+ODOMETER_JUMP_SLACK_MILES = float(os.environ.get('ODOMETER_JUMP_SLACK_MILES', 5)) # miles allowed on top of the speed bound, for readings close in time
+ODOMETER_ROLLBACK_TOLERANCE_MILES = float(os.environ.get('ODOMETER_ROLLBACK_TOLERANCE_MILES', 1)) # odometer decrease ignored as rounding before it counts as a rollback
+ODOMETER_ANOMALY_EMAIL_LIMIT = int(os.environ.get('ODOMETER_ANOMALY_EMAIL_LIMIT', 25)) # anomalies listed in the report email
+
+# Job instrumentation settings
+JOB_PROFILE_DIR   = os.environ.get('JOB_PROFILE_DIR', BASE_DIR / 'profiles') # where run_daily_job --profile writes its profiles
+JOB_RUN_TREND_RUNS = int(os.environ.get('JOB_RUN_TREND_RUNS', 30)) # runs shown in the admin stage duration trend
+
+# Benchmark settings (python manage.py run_benchmarks <suite> --save --compare)
+BENCHMARK_RESULTS_DIR = os.environ.get('BENCHMARK_RESULTS_DIR', BASE_DIR / 'benchmark_results')
+BENCHMARK_REGRESSION_THRESHOLD = float(os.environ.get('BENCHMARK_REGRESSION_THRESHOLD', 0.2)) # fraction slower than the last saved run that fails --compare
+
 EMAIL_BACKEND     = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_CONFIG_TTL  = int(os.environ.get('EMAIL_CONFIG_TTL', 5 * 60)) # seconds the email sender, password and recipients are cached
+EMAIL_ATTACHMENT_COMPRESSION = os.environ.get('EMAIL_ATTACHMENT_COMPRESSION', 'zip') # 'zip', 'gzip' or 'none'
+EMAIL_COMPRESS_THRESHOLD = int(os.environ.get('EMAIL_COMPRESS_THRESHOLD', 1024 * 1024)) # attachments larger than this many bytes are compressed
 
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL) # stores job results for /api/jobs/<job_id>/
+CELERY_RESULT_EXPIRES = 24 * 60 * 60
+CELERY_TASK_TRACK_STARTED = True
+
+# Cache settings
+# Entries are saved by the Celery worker, so the cache is shared through redis for the web process to see the invalidations
+if ENTRY_CACHE_BACKEND == 'redis':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CELERY_BROKER_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 # Celery beat settings
 '''
@@ -53,6 +109,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'daily_compliance_job.tasks.run_daily_job_task',
         'schedule': crontab(hour=12, minute=0), # scheduled to run at 12:00 PM every day
     },
+    'maintain_partitions': {
+        'task': 'daily_compliance_job.tasks.maintain_partitions_task',
+        'schedule': crontab(day_of_month=1, hour=3, minute=0), # 3:00 AM on the first of every month
+    },
 }
 
 # Quick-start development settings - unsuitable for production
@@ -249,4 +309,9 @@ LOGGING = {
     },
 }
 
-django_heroku.settings(locals())
\ No newline at end of file
+django_heroku.settings(locals())
+
+# django_heroku replaces LOGGING, so the job stage timings are added to its configuration as one JSON object per line
+LOGGING['formatters']['json'] = {'format': '%(message)s'}
+LOGGING['handlers']['json_console'] = {'level': 'INFO', 'class': 'logging.StreamHandler', 'formatter': 'json'}
+LOGGING['loggers']['daily_compliance_job.services.instrumentation'] = {'handlers': ['json_console'], 'level': 'INFO', 'propagate': False}
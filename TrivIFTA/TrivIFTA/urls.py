@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, re_path
-from daily_compliance_job.views import run_job, get_entries_by_date, get_config
+from daily_compliance_job.views import run_job, get_job_status, get_entries, get_config, get_quarter_mileage_view
 from django.views.generic import TemplateView
 
 
@@ -24,6 +24,9 @@ urlpatterns = [
     path('api/config/', get_config),
     path("admin/", admin.site.urls),
     path('api/run-job/', run_job),
-    path('api/entries/<str:date>/', get_entries_by_date),
+    path('api/jobs/<str:job_id>/', get_job_status),
+    path('api/entries/', get_entries),
+    path('api/entries/<str:date>/', get_entries),
+    path('api/mileage/<str:quarter>/', get_quarter_mileage_view),
     re_path('.*', TemplateView.as_view(template_name='index.html')),
 ]
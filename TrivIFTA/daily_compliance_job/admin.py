@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib import admin
+from django.conf import settings
 from django.contrib import messages
-from .models import EmailRecipient, EmailSender
+from .models import ArchivedMonth, DailyMileage, EmailRecipient, EmailSender, FeedVersion, JobRun, QuarterlyMileage, VinDayFingerprint
 from django.core.exceptions import ValidationError
 
 @admin.register(EmailRecipient)
@@ -23,4 +24,83 @@ class EmailSenderAdmin(admin.ModelAdmin):
         try:
             super().save_model(request, obj, form, change)
         except ValidationError as e:
-            messages.error(request, e.message)
\ No newline at end of file
+            messages.error(request, e.message)
+
+@admin.register(FeedVersion)
+class FeedVersionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'version', 'updated_at')
+    search_fields = ('name',)
+
+@admin.register(ArchivedMonth)
+class ArchivedMonthAdmin(admin.ModelAdmin):
+    list_display = ('month', 'rows', 'path', 'archived_at')
+    readonly_fields = [field.name for field in ArchivedMonth._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    # months are only unarchived by reloading them (manage.py ifta_partitions --reload)
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(QuarterlyMileage)
+class QuarterlyMileageAdmin(admin.ModelAdmin):
+    list_display = ('year', 'quarter', 'jurisdiction', 'miles', 'updated_at')
+    list_filter = ('year', 'quarter', 'jurisdiction')
+    readonly_fields = [field.name for field in QuarterlyMileage._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(DailyMileage)
+class DailyMileageAdmin(admin.ModelAdmin):
+    list_display = ('date', 'vin', 'jurisdiction', 'miles')
+    list_filter = ('jurisdiction',)
+    search_fields = ('vin',)
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in DailyMileage._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+# deleting a fingerprint makes the next incremental run re-send its VIN-day
+@admin.register(VinDayFingerprint)
+class VinDayFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('date', 'vin', 'rows', 'fingerprint', 'updated_at')
+    search_fields = ('vin',)
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in VinDayFingerprint._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'command', 'report_date', 'status', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb')
+    list_filter = ('command', 'status')
+    readonly_fields = [field.name for field in JobRun._meta.fields]
+    # the change list shows the stage durations of the latest runs above the table
+    change_list_template = 'admin/daily_compliance_job/jobrun/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['stage_trend'] = get_stage_trend(JobRun.objects.filter(status=JobRun.SUCCEEDED)[:settings.JOB_RUN_TREND_RUNS])
+        return super().changelist_view(request, extra_context=extra_context)
+
+def get_stage_trend(job_runs) -> dict:
+    '''
+    Returns the stage names and, for each run from oldest to newest, the seconds of every stage
+        with the bar width as a percentage of the slowest run of that stage
+    '''
+    job_runs = list(reversed(job_runs))
+    seconds = [job_run.stage_seconds() for job_run in job_runs]
+    stages = list(dict.fromkeys(stage for run_seconds in seconds for stage in run_seconds))
+    slowest = {stage: max(run_seconds.get(stage, 0.0) for run_seconds in seconds) or 1.0 for stage in stages}
+    rows = [{
+        'job_run': job_run,
+        'stages': [{'seconds': run_seconds.get(stage), 'width': round(100 * run_seconds.get(stage, 0.0) / slowest[stage])} for stage in stages],
+    } for job_run, run_seconds in zip(job_runs, seconds)]
+    return {'stages': stages, 'rows': rows}
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the daily compliance job pipeline
+
+Run with: python manage.py run_benchmarks <suite>
+Add --save to keep the results and --compare to check them against the last saved run
+"""
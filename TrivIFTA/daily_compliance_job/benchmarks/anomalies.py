@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from daily_compliance_job.benchmarks.fleet import FleetGeotabAPI, SyntheticFleet
+from daily_compliance_job.services.anomalies import ANOMALY_TYPES, JUMP, JURISDICTION_BORDERS, MISSING_ODOMETER, ROLLBACK, TELEPORT, find_anomalies
+
+# trucks in the fleet
+DEFAULT_SIZES = [1_000, 10_000]
+# days of reports scanned together, as a backfill of the range would save them
+NUM_DAYS = 7
+# share of readings given each kind of anomaly
+ANOMALY_SHARE = 0.001
+MAX_MPH, JUMP_SLACK_MILES, ROLLBACK_TOLERANCE_MILES = 90, 5, 1
+
+
+def inject_anomalies(df: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    '''
+    Copy of the frame with ANOMALY_SHARE of its readings given a missing odometer, a rollback, a jump
+        and a jurisdiction far from every fleet jurisdiction
+    '''
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    df['Odometer'] = df['Odometer'].astype('float64')
+    rows = rng.permutation(len(df))[:4 * int(len(df) * ANOMALY_SHARE)].reshape(4, -1)
+    odometer = df.columns.get_loc('Odometer')
+    df.iloc[rows[0], odometer] = np.nan
+    df.iloc[rows[1], odometer] -= 500
+    df.iloc[rows[2], odometer] += 5_000
+    df.iloc[rows[3], df.columns.get_loc('Jurisdiction')] = 'CA'
+    return df
+
+
+def get_reference_anomalies(df: pd.DataFrame) -> pd.Series:
+    '''
+    Number of anomalies of each type, found per VIN with groupby and shift, to check the vectorized pass against
+    '''
+    previous = df.groupby('VIN', sort=False).shift(1)
+    timestamps = pd.to_datetime(df['ReadingDate'].astype(str) + ' ' + df['ReadingTime'].astype(str))
+    # the 23:59 reading that closes a day is taken at midnight
+    timestamps = timestamps.where(df['ReadingTime'] != time(23, 59), timestamps + pd.Timedelta(minutes=1))
+    hours = (timestamps - timestamps.groupby(df['VIN'], sort=False).shift(1)).dt.total_seconds() / 3600
+    miles = df['Odometer'] - previous['Odometer']
+    teleport = [previous_jurisdiction == previous_jurisdiction and jurisdiction != previous_jurisdiction
+                and jurisdiction in JURISDICTION_BORDERS and previous_jurisdiction in JURISDICTION_BORDERS
+                and jurisdiction not in JURISDICTION_BORDERS[previous_jurisdiction]
+                for jurisdiction, previous_jurisdiction in zip(df['Jurisdiction'], previous['Jurisdiction'])]
+    return pd.Series({
+        MISSING_ODOMETER: int(df['Odometer'].isna().sum()),
+        ROLLBACK: int((miles < -ROLLBACK_TOLERANCE_MILES).sum()),
+        JUMP: int((miles > JUMP_SLACK_MILES + MAX_MPH * hours.clip(lower=0)).sum()),
+        TELEPORT: int(sum(teleport)),
+    })
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Time the odometer anomaly checks over a week of reports of synthetic fleets of each size, with anomalies
+        injected, and check the counts against the groupby reference
+    The fleet itself drives between neighbouring jurisdictions at legal speeds, so it has no anomalies of its own
+    """
+    results = []
+    for size in sizes:
+        start_date = date(2024, 1, 1)
+        api = FleetGeotabAPI(SyntheticFleet(size, start=start_date, num_days=NUM_DAYS))
+        start = datetime.combine(start_date, time(0, 0))
+        clean_df = api.to_ifta_data_collection(start, start + timedelta(days=NUM_DAYS)).to_dataframe()
+        df = inject_anomalies(clean_df)
+
+        clean_anomalies = find_anomalies(clean_df, MAX_MPH, JUMP_SLACK_MILES, ROLLBACK_TOLERANCE_MILES)
+        start_time = timer.perf_counter()
+        anomalies = find_anomalies(df, MAX_MPH, JUMP_SLACK_MILES, ROLLBACK_TOLERANCE_MILES)
+        vectorized_seconds = timer.perf_counter() - start_time
+
+        start_time = timer.perf_counter()
+        reference = get_reference_anomalies(df)
+        reference_seconds = timer.perf_counter() - start_time
+
+        counts = anomalies['Anomaly'].value_counts().reindex(ANOMALY_TYPES, fill_value=0)
+        results.append({
+            'trucks': size,
+            'rows': len(df),
+            'anomalies': len(anomalies),
+            'clean_anomalies': len(clean_anomalies),
+            'reference_s': round(reference_seconds, 3),
+            'vectorized_s': round(vectorized_seconds, 3),
+            'match': counts.tolist() == reference[ANOMALY_TYPES].tolist(),
+        })
+    return results
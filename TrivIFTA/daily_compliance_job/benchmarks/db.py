@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from typing import Any, Dict, List
+
+import pandas as pd
+from django.db import connection
+
+from daily_compliance_job.benchmarks.ifta import make_fuel_tax_frame
+from daily_compliance_job.models import IftaEntry
+from daily_compliance_job.services.ifta import FuelTaxProcessor
+
+DEFAULT_SIZES = [10_000, 100_000]
+LEGACY_MAX_ROWS = 100_000
+
+
+def make_entries_frame(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a sorted IFTA frame with num_rows readings
+    """
+    ifta_df = FuelTaxProcessor.to_ifta_dataframe(make_fuel_tax_frame(num_rows, seed))
+    return ifta_df.dropna(subset=['Odometer']).head(num_rows)
+
+
+def legacy_save_all_entries(entries: pd.DataFrame) -> None:
+    """
+    Reference implementation issuing one update_or_create per row
+    """
+    for _, row in entries.iterrows():
+        IftaEntry.objects.update_or_create(
+            vin=row['VIN'],
+            reading_date=row['ReadingDate'],
+            reading_time=row['ReadingTime'],
+            defaults={
+                'odometer': row['Odometer'],
+                'jurisdiction': row['Jurisdiction']
+            }
+        )
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = timer.perf_counter()
+    func(*args, **kwargs)
+    return round(timer.perf_counter() - start, 3)
+
+
+def run(sizes: List[int] = DEFAULT_SIZES, legacy_max_rows: int = LEGACY_MAX_ROWS) -> List[Dict[str, Any]]:
+    """
+    Time the per-row and batched IftaEntry writers on a throwaway test database,
+        both inserting into an empty table and upserting over existing rows
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = []
+        for size in sizes:
+            entries = make_entries_frame(size)
+            result = {'rows': len(entries), 'vendor': connection.vendor}
+
+            IftaEntry.objects.all().delete()
+            result['bulk_insert_s'] = timed(IftaEntry.save_all_entries, entries)
+            result['bulk_upsert_s'] = timed(IftaEntry.save_all_entries, entries)
+
+            result['legacy_insert_s'] = result['legacy_upsert_s'] = None
+            if size <= legacy_max_rows:
+                IftaEntry.objects.all().delete()
+                result['legacy_insert_s'] = timed(legacy_save_all_entries, entries)
+                result['legacy_upsert_s'] = timed(legacy_save_all_entries, entries)
+
+            result['saved_rows'] = IftaEntry.objects.count()
+            results.append(result)
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
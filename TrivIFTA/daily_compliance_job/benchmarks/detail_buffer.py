@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gc
+import time as timer
+import tracemalloc
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+from daily_compliance_job.services.detail_buffer import FuelTaxDetailBuffer, KILO_TO_MILES
+
+DEFAULT_SIZES = [500_000]
+BATCH_SIZE = 5000
+JURISDICTIONS = ['IL', 'IN', 'WI', 'IA', 'MO', 'KY', 'OH', 'MI', None]
+
+
+def make_fuel_tax_details(num_details: int, seed: int = 0, batch_size: int = BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield batches of raw FuelTaxDetail records shaped like the Geotab API response
+    """
+    rng = np.random.default_rng(seed)
+    num_devices = max(1, num_details // 300)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, num_details, batch_size):
+        size = min(batch_size, num_details - offset)
+        devices = rng.integers(0, num_devices, size).tolist()
+        seconds = rng.uniform(0, 24 * 60 * 60, size).tolist()
+        odometers = rng.uniform(0, 1_500_000, size).round(3).tolist()
+        jurisdictions = rng.integers(0, len(JURISDICTIONS), size).tolist()
+        batch = []
+        for i in range(size):
+            enter_time = start + timedelta(seconds=seconds[i])
+            batch.append({
+                'id': f'a{offset + i:x}',
+                'device': {'id': f'b{devices[i]:x}', 'isCloudReliant': False},
+                'driver': {'id': 'UnknownDriverId', 'isDriver': True},
+                'enterTime': enter_time,
+                'exitTime': enter_time + timedelta(minutes=30),
+                'enterOdometer': odometers[i] if i % 500 else 0,
+                'exitOdometer': odometers[i] + 40.5,
+                'enterGpsOdometer': odometers[i],
+                'exitGpsOdometer': odometers[i] + 40.5,
+                'enterLatitude': 41.8781, 'enterLongitude': -87.6298,
+                'exitLatitude': 41.9, 'exitLongitude': -87.7,
+                'jurisdiction': JURISDICTIONS[jurisdictions[i]],
+                'isEnterOdometerInterpolated': False, 'isExitOdometerInterpolated': False,
+                'isClusterOdometer': True, 'authority': {'name': 'O\'Halloran', 'address': ''},
+                'hourlyOdometer': [], 'hourlyLatitude': [], 'hourlyLongitude': [], 'hourlyIsOdometerInterpolated': [],
+                'version': f'{offset + i:016x}',
+            })
+        yield batch
+
+
+def device_to_vin_map(num_details: int) -> Dict[str, str]:
+    # every other device is in the IFTA group
+    return {f'b{i:x}': f'1FUJGLDR{i:09d}' for i in range(0, max(1, num_details // 300), 2)}
+
+
+def legacy_build_detail_map(batches: Iterator[List[Dict[str, Any]]], device_to_vin: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Reference implementation keeping the raw Geotab dicts keyed by device id
+    """
+    detail_map = {}
+    for batch in batches:
+        for detail in batch:
+            if detail['device']['id'] not in device_to_vin:
+                continue
+            detail['vehicleIdentificationNumber'] = device_to_vin[detail['device']['id']]
+            detail_map.setdefault(detail['device']['id'], []).append(detail)
+    return detail_map
+
+
+def legacy_to_dataframe(detail_map: Dict[str, List[Dict[str, Any]]]) -> pd.DataFrame:
+    reduced_detail_map = []
+    for _, details in sorted(detail_map.items(), key=lambda x: x[0]):
+        for detail in details:
+            reduced_detail_map.append({
+                'FuelTaxVin': detail.get('vehicleIdentificationNumber', None),
+                'EnterReadingDate': detail['enterTime'].date() if detail.get('enterTime', None) else None,
+                'EnterReadingTime': detail['enterTime'].replace(microsecond=0).time() if detail.get('enterTime', None) else None,
+                'ExitReadingTime': detail['exitTime'].replace(microsecond=0).time() if detail.get('exitTime', None) else None,
+                'FuelTaxEnterOdometer': (detail['enterOdometer'] * KILO_TO_MILES) if detail.get('enterOdometer', None) else None,
+                'FuelTaxExitOdometer': (detail['exitOdometer'] * KILO_TO_MILES) if detail.get('exitOdometer', None) else None,
+                'FuelTaxJurisdiction': detail.get('jurisdiction', None),
+            })
+        if reduced_detail_map:
+            reduced_detail_map[-1]['ExitReadingTime'] = time(0, 0)
+    return pd.DataFrame(reduced_detail_map)
+
+
+def buffer_build_detail_map(batches: Iterator[List[Dict[str, Any]]], device_to_vin: Dict[str, str]) -> FuelTaxDetailBuffer:
+    detail_map = FuelTaxDetailBuffer()
+    for batch in batches:
+        detail_map.add_details(batch, device_to_vin)
+    return detail_map
+
+
+def measure(build, to_dataframe, num_details: int) -> Dict[str, Any]:
+    """
+    Ingest num_details records batch by batch, then build the dataframe,
+        recording time and the memory held by the detail map
+    """
+    device_to_vin = device_to_vin_map(num_details)
+    gc.collect()
+    tracemalloc.start()
+    start = timer.perf_counter()
+    detail_map = build(make_fuel_tax_details(num_details), device_to_vin)
+    ingest_seconds = timer.perf_counter() - start
+    retained, ingest_peak = tracemalloc.get_traced_memory()
+
+    tracemalloc.reset_peak()
+    start = timer.perf_counter()
+    df = to_dataframe(detail_map)
+    dataframe_seconds = timer.perf_counter() - start
+    _, dataframe_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ingest_s': round(ingest_seconds, 3),
+        'to_dataframe_s': round(dataframe_seconds, 3),
+        'detail_map_mb': round(retained / 2 ** 20, 1),
+        'peak_mb': round(max(ingest_peak, dataframe_peak) / 2 ** 20, 1),
+        'frame': df,
+    }
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Compare memory and time of the raw dict detail map and the columnar buffer
+    """
+    results = []
+    for size in sizes:
+        legacy = measure(legacy_build_detail_map, legacy_to_dataframe, size)
+        columnar = measure(buffer_build_detail_map, lambda detail_map: detail_map.to_dataframe(), size)
+        legacy_df, columnar_df = legacy.pop('frame'), columnar.pop('frame')
+
+        result = {'details': size, 'rows': len(columnar_df)}
+        result.update({f'legacy_{key}': value for key, value in legacy.items()})
+        result.update({f'columnar_{key}': value for key, value in columnar.items()})
+        result['frames_match'] = legacy_df.to_csv(index=False) == columnar_df.to_csv(index=False)
+        results.append(result)
+    return results
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import smtplib
+import time as timer
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Dict, List
+
+from django.db import connection
+
+from daily_compliance_job.benchmarks.ifta import make_fuel_tax_frame
+from daily_compliance_job.models import EmailRecipient, EmailSender
+from daily_compliance_job.services.email import EmailBatch, EmailService, clear_sender_config
+from daily_compliance_job.services.ifta import FuelTaxProcessor
+from daily_compliance_job.standins.smtp import SMTPStandIn
+
+DEFAULT_SIZES = [10, 100]
+# about 5 MB of CSV, large enough to be compressed
+ATTACHMENT_ROWS = 100_000
+
+
+def legacy_send(email: EmailService) -> None:
+    """
+    Reference implementation used before batching: reads the sender, decrypts its password
+        and opens, authenticates and closes an SMTP session for every email
+    """
+    sender = EmailSender.objects.first()
+    recipients = [recipient.email for recipient in EmailRecipient.objects.all()]
+    server = smtplib.SMTP(sender.smtp_server, sender.smtp_port)
+    server.starttls()
+    server.login(sender.email, sender.get_smtp_password())
+    msg = MIMEMultipart()
+    msg['From'] = sender.email
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = email.subject
+    msg.attach(MIMEText(email.body, 'plain'))
+    if email.attachment:
+        attachment = MIMEApplication(email.attachment, name=email.attachment_name)
+        attachment['Content-Disposition'] = f'attachment; filename="{email.attachment_name}"'
+        msg.attach(attachment)
+    server.send_message(msg)
+    server.quit()
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Send emails to a local SMTP stand-in one session per email and batched over one session,
+        then compare the size of a large report attachment sent raw and compressed
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = []
+        with SMTPStandIn() as server:
+            EmailSender.objects.create(email=server.username, smtp_server=server.host, smtp_port=server.port,
+                                       smtp_user=server.username, smtp_password=server.password)
+            EmailRecipient.objects.create(email='compliance@example.com')
+            clear_sender_config()
+
+            for size in sizes:
+                emails = [EmailService(f'IFTA Backfill {i}', f'Day {i} complete') for i in range(size)]
+
+                logins = server.logins
+                start = timer.perf_counter()
+                for email in emails:
+                    legacy_send(email)
+                legacy_seconds = timer.perf_counter() - start
+                legacy_logins = server.logins - logins
+
+                logins = server.logins
+                start = timer.perf_counter()
+                with EmailBatch() as batch:
+                    for email in emails:
+                        batch.add(email)
+                    sent = batch.flush()
+                batched_seconds = timer.perf_counter() - start
+
+                results.append({
+                    'emails': size,
+                    'legacy_s': round(legacy_seconds, 3),
+                    'batched_s': round(batched_seconds, 3),
+                    'legacy_logins': legacy_logins,
+                    'batched_logins': server.logins - logins,
+                    'all_sent': all(sent),
+                })
+
+            csv_data = FuelTaxProcessor.to_ifta_dataframe(make_fuel_tax_frame(ATTACHMENT_ROWS)).to_csv(index=False)
+            EmailService('IFTA Report', 'Attached', attachment=csv_data, attachment_name='report.csv').send()
+            attachment = server.messages[-1].get_payload()[1]
+            results.append({
+                'attachment_csv_bytes': len(csv_data.encode('utf-8')),
+                'attachment_sent_bytes': len(attachment.get_payload(decode=True)),
+                'attachment_name': attachment.get_filename(),
+            })
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
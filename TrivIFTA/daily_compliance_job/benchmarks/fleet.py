@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+from django.conf import settings
+from openpyxl import Workbook
+
+from daily_compliance_job.benchmarks.xlsx import EXPORT_COLUMNS
+from daily_compliance_job.services.detail_buffer import FuelTaxDetailBuffer, KILO_TO_MILES
+from daily_compliance_job.services.geotab import MyGeotabAPI
+
+# neighbouring jurisdictions, so consecutive details of a truck cross a real border
+BORDERS = {
+    'IL': ['IN', 'WI', 'IA', 'MO', 'KY'],
+    'IN': ['IL', 'MI', 'OH', 'KY'],
+    'WI': ['IL', 'IA', 'MI', 'MN'],
+    'IA': ['IL', 'WI', 'MN', 'MO', 'NE'],
+    'MO': ['IL', 'IA', 'KY', 'NE'],
+    'KY': ['IL', 'IN', 'OH', 'MO'],
+    'OH': ['IN', 'MI', 'KY'],
+    'MI': ['IN', 'OH', 'WI'],
+    'MN': ['WI', 'IA'],
+    'NE': ['IA', 'MO'],
+}
+JURISDICTIONS = sorted(BORDERS)
+SECONDS_PER_DAY = 24 * 60 * 60
+# group of the trucks outside the IFTA group
+OTHER_GROUP = 'b27A0'
+
+
+class SyntheticFleet:
+    """
+    Deterministic fleet of trucks and the FuelTaxDetail records Geotab would return for them
+
+    Each day a moving truck drives through a few neighbouring jurisdictions, one detail per jurisdiction,
+        with the first detail entered at midnight and the last one exited at the next midnight, as Geotab
+        splits details at day boundaries. Odometers carry over from one day to the next.
+    Nonmoving trucks have a single detail per day whose odometer does not change.
+    Trucks outside the IFTA group (GEOTAB_GROUP) report details too.
+
+    get() and get_feed() answer Get and GetFeed the way the MyGeotab API does,
+        for FleetGeotabAPI and the Geotab stand-in server.
+
+    Usage:
+        fleet = SyntheticFleet(1000, date(2024, 1, 2))
+        fleet.devices(), fleet.fuel_tax_details(from_date, to_date), fleet.to_workbook()
+    """
+    def __init__(self, num_devices: int, start: date = date(2024, 1, 2), num_days: int = 1, seed: int = 0,
+                 nonmoving_share: float = 0.1, non_ifta_share: float = 0.05, max_crossings: int = 12, group_id: str = None) -> None:
+        self.num_devices = num_devices
+        self.start = start
+        self.num_days = num_days
+        self.group_id = group_id or settings.GEOTAB_GROUP
+        rng = np.random.default_rng(seed)
+
+        self.device_ids = [f'b{i:x}' for i in range(num_devices)]
+        self.vins = [f'1FUJGLDR{i:09d}' for i in range(num_devices)]
+        kinds = rng.random(num_devices)
+        self.nonmoving = kinds < nonmoving_share
+        self.in_ifta_group = kinds < 1 - non_ifta_share
+
+        self.details_by_day = []
+        # device id -> that device's details, for each day
+        self.device_details_by_day = []
+        jurisdictions = rng.choice(JURISDICTIONS, num_devices).tolist()
+        odometers = rng.uniform(10_000, 1_500_000, num_devices).round(1).tolist()   # kilometers
+        for day in range(num_days):
+            day_start = datetime.combine(start + timedelta(days=day), time(0, 0), tzinfo=timezone.utc)
+            details = []
+            device_details = {}
+            for device in range(num_devices):
+                crossings = 0 if self.nonmoving[device] else int(rng.integers(1, max_crossings + 1))
+                # the seconds of the day at which the truck crosses into the next jurisdiction
+                boundaries = [0] + sorted(set(rng.integers(1, SECONDS_PER_DAY, crossings).tolist())) + [SECONDS_PER_DAY]
+                for enter_second, exit_second in zip(boundaries, boundaries[1:]):
+                    enter_odometer = odometers[device]
+                    if not self.nonmoving[device]:
+                        # driving at up to 100 km/h for part of the time spent in the jurisdiction
+                        odometers[device] = round(enter_odometer + (exit_second - enter_second) / 3600 * rng.uniform(0, 100) * rng.random(), 1)
+                    details.append(self.make_detail(len(details), device, day_start + timedelta(seconds=enter_second),
+                                                    day_start + timedelta(seconds=exit_second), enter_odometer, odometers[device], jurisdictions[device]))
+                    device_details.setdefault(self.device_ids[device], []).append(details[-1])
+                    if exit_second < SECONDS_PER_DAY:
+                        jurisdictions[device] = str(rng.choice(BORDERS[jurisdictions[device]]))
+            self.details_by_day.append(details)
+            self.device_details_by_day.append(device_details)
+
+    def make_detail(self, index: int, device: int, enter_time: datetime, exit_time: datetime, enter_odometer: float, exit_odometer: float, jurisdiction: str) -> Dict[str, Any]:
+        '''
+        Returns a FuelTaxDetail shaped like the Geotab API response, odometers in kilometers
+        '''
+        return {
+            'id': f'a{enter_time:%Y%m%d}{index:x}',
+            'device': {'id': self.device_ids[device], 'isCloudReliant': False},
+            'driver': {'id': 'UnknownDriverId', 'isDriver': True},
+            'enterTime': enter_time,
+            'exitTime': exit_time,
+            'enterOdometer': enter_odometer,
+            'exitOdometer': exit_odometer,
+            'enterGpsOdometer': enter_odometer,
+            'exitGpsOdometer': exit_odometer,
+            'enterLatitude': 41.8781, 'enterLongitude': -87.6298,
+            'exitLatitude': 41.9, 'exitLongitude': -87.7,
+            'jurisdiction': jurisdiction,
+            'isEnterOdometerInterpolated': False, 'isExitOdometerInterpolated': False,
+            'isClusterOdometer': True, 'authority': {'name': 'O\'Halloran', 'address': ''},
+            'hourlyOdometer': [], 'hourlyLatitude': [], 'hourlyLongitude': [], 'hourlyIsOdometerInterpolated': [],
+            'version': f'{enter_time:%Y%m%d}{index:08x}',
+        }
+
+    def devices(self, group_ids: List[str] = None) -> List[Dict[str, Any]]:
+        '''
+        Returns the Device records of the trucks, only those in one of group_ids if given
+        '''
+        devices = [{'id': device_id, 'name': f'Truck {i}', 'vehicleIdentificationNumber': vin,
+                    'groups': [{'id': self.group_id if self.in_ifta_group[i] else OTHER_GROUP}], 'version': f'{i:016x}'}
+                   for i, (device_id, vin) in enumerate(zip(self.device_ids, self.vins))]
+        if group_ids is None:
+            return devices
+        return [device for device in devices if device['groups'][0]['id'] in group_ids]
+
+    def groups(self) -> List[Dict[str, Any]]:
+        return [
+            {'id': 'GroupCompanyId', 'name': 'Company Group', 'children': [{'id': self.group_id}, {'id': OTHER_GROUP}]},
+            {'id': self.group_id, 'name': 'IFTA Group', 'children': []},
+            {'id': OTHER_GROUP, 'name': 'Yard Trucks', 'children': []},
+        ]
+
+    def device_to_vin(self) -> Dict[str, str]:
+        return {device['id']: device['vehicleIdentificationNumber'] for device in self.devices([self.group_id])}
+
+    def get(self, type_name: str, search: Dict[str, Any] = None, results_limit: int = None) -> List[Dict[str, Any]]:
+        '''
+        Answers Get for Device (searching by groups), FuelTaxDetail (searching by fromDate and toDate) and Group
+        '''
+        search = search or {}
+        if type_name == 'Device':
+            groups = search.get('groups', None)
+            entities = self.devices([group['id'] for group in groups] if groups else None)
+        elif type_name == 'FuelTaxDetail':
+            device_id = (search.get('deviceSearch', None) or {}).get('id', None)
+            entities = self.fuel_tax_details(search.get('fromDate', None), search.get('toDate', None), device_id)
+        elif type_name == 'Group':
+            entities = self.groups()
+        else:
+            raise ValueError(f'Unsupported type: {type_name}')
+        return entities[:results_limit] if results_limit else entities
+
+    def get_feed(self, type_name: str, search: Dict[str, Any] = None, from_version: str = None, results_limit: int = None) -> Dict[str, Any]:
+        '''
+        Answers GetFeed for Device and FuelTaxDetail, the feed version being the number of records read so far
+        '''
+        search = search or {}
+        if type_name == 'Device':
+            entities = self.devices()
+        elif type_name == 'FuelTaxDetail':
+            entities = self.fuel_tax_details(search.get('fromDate', None), search.get('toDate', None))
+        else:
+            raise ValueError(f'Unsupported feed: {type_name}')
+        start = int(from_version or 0)
+        data = entities[start:start + results_limit] if results_limit else entities[start:]
+        return {'data': data, 'toVersion': str(start + len(data))}
+
+    def fuel_tax_details(self, from_date: datetime = None, to_date: datetime = None, device_id: str = None) -> List[Dict[str, Any]]:
+        '''
+        Returns the details of every truck, or only of device_id, on the days from from_date up to, not including, to_date
+        '''
+        if device_id is not None:
+            return [detail for day in self.day_indexes(from_date, to_date) for detail in self.device_details_by_day[day].get(device_id, [])]
+        return [detail for day in self.day_indexes(from_date, to_date) for detail in self.details_by_day[day]]
+
+    def day_indexes(self, from_date: datetime = None, to_date: datetime = None) -> range:
+        first = 0 if from_date is None else (to_day(from_date) - self.start).days
+        last = self.num_days if to_date is None else (to_day(to_date) - self.start).days
+        return range(max(first, 0), min(last, self.num_days))
+
+    def to_workbook(self, from_date: datetime = None, to_date: datetime = None) -> bytes:
+        '''
+        Returns the details as a Geotab fuel tax XLSX export: a title block, then one row per detail on the 'Data' sheet,
+            with naive UTC times and odometers in miles
+        '''
+        wb = Workbook(write_only=True)
+        sheet = wb.create_sheet('Data')
+        sheet.append(['IFTA Report'])
+        sheet.append(['Report period', f'{self.start}', f'{self.start + timedelta(days=self.num_days - 1)}'])
+        sheet.append([])
+        sheet.append(EXPORT_COLUMNS)
+
+        device_codes = {device_id: i for i, device_id in enumerate(self.device_ids)}
+        for detail in self.fuel_tax_details(from_date, to_date):
+            device = device_codes[detail['device']['id']]
+            if not self.in_ifta_group[device]:
+                continue
+            enter_odometer = detail['enterOdometer'] * KILO_TO_MILES
+            exit_odometer = detail['exitOdometer'] * KILO_TO_MILES
+            sheet.append([
+                f'Truck {device}', self.vins[device], 'Unknown Driver',
+                detail['enterTime'].replace(tzinfo=None), detail['exitTime'].replace(tzinfo=None), detail['jurisdiction'],
+                enter_odometer, exit_odometer, enter_odometer, exit_odometer,
+                detail['enterLatitude'], detail['enterLongitude'], detail['exitLatitude'], detail['exitLongitude'],
+                exit_odometer - enter_odometer, False, False, detail['authority']['name'],
+            ])
+
+        output = io.BytesIO()
+        wb.save(output)
+        return output.getvalue()
+
+
+class FleetGeotabAPI(MyGeotabAPI):
+    """
+    MyGeotabAPI answering Get and GetFeed from a SyntheticFleet in process, without authenticating or a device cache
+    """
+    def __init__(self, fleet: SyntheticFleet) -> None:
+        self.fleet = fleet
+        self.detail_map = FuelTaxDetailBuffer()
+        self.device_cache = None
+
+    def get(self, type_name: str, search: Dict[str, Any] = None, resultsLimit: int = None, **parameters) -> List[Dict[str, Any]]:
+        # as mygeotab does, the other parameters are search parameters
+        return self.fleet.get(type_name, dict(search or {}, **parameters), resultsLimit)
+
+    def call(self, method: str, type_name: str = None, search: Dict[str, Any] = None, from_version: str = None, results_limit: int = None, **parameters) -> Any:
+        if method == 'Get':
+            return self.fleet.get(type_name, search, results_limit)
+        if method == 'GetFeed':
+            return self.fleet.get_feed(type_name, search, from_version, results_limit)
+        raise ValueError(f'Unsupported call: {method}')
+
+    def multi_call(self, calls: List[tuple]) -> List[Any]:
+        return [self.call(method, type_name=params.get('typeName', None), search=params.get('search', None), results_limit=params.get('resultsLimit', None))
+                for method, params in calls]
+
+
+def to_day(value: Any) -> date:
+    return value.date() if isinstance(value, datetime) else value
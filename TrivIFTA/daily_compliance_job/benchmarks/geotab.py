@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.test import override_settings
+from mygeotab import MyGeotabException
+
+from daily_compliance_job.benchmarks.fleet import FleetGeotabAPI, SyntheticFleet
+from daily_compliance_job.services import fetch_scheduler
+from daily_compliance_job.services.device_cache import InMemoryCacheBackend
+from daily_compliance_job.services.geotab import MyGeotabAPI
+from daily_compliance_job.standins.geotab import GeotabStandIn
+
+# trucks in the fleet
+DEFAULT_SIZES = [1_000, 5_000]
+# round trip to the MyGeotab servers
+LATENCY = 0.05
+# records per GetFeed call when streaming
+FEED_RESULTS_LIMIT = 1_000
+# calls per minute allowed in the throttled run
+THROTTLED_RATE_LIMIT = 5
+# calls per minute the sharded runs pace themselves to, well above GEOTAB_CALLS_PER_MINUTE so that the
+    # concurrency is measured rather than the account's rate limit
+SHARDED_CALLS_PER_MINUTE = 120_000
+# calls per second allowed in the throttled sharded run, below what the scheduler paces itself to
+SHARDED_RATE_LIMIT = 300
+
+
+def fetch(server: GeotabStandIn, from_date: datetime, to_date: datetime, stream: bool = False, sharded: bool = False,
+          calls_per_minute: int = None) -> Dict[str, Any]:
+    '''
+    Builds the day's IftaDataCollection through the stand-in, returning its CSV, the time taken and the calls made
+    '''
+    calls = sum(server.calls.values())
+    start = timer.perf_counter()
+    # a fresh device cache, so every run fetches the devices
+    api = MyGeotabAPI(server.username, server.password, server.database, device_cache_backend=InMemoryCacheBackend(),
+                      server=server.server, ca_bundle=server.ca_bundle)
+    # a fresh rate limiter, so runs do not inherit each other's waits
+    fetch_scheduler._rate_limiters.clear()
+    with override_settings(GEOTAB_FEED_RESULTS_LIMIT=FEED_RESULTS_LIMIT,
+                           GEOTAB_CALLS_PER_MINUTE=calls_per_minute or settings.GEOTAB_CALLS_PER_MINUTE):
+        csv_data = api.to_ifta_data_collection(from_date, to_date, stream=stream, sharded=sharded).to_dataframe().to_csv(index=False)
+    return {'csv': csv_data, 'seconds': round(timer.perf_counter() - start, 3), 'calls': sum(server.calls.values()) - calls}
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Fetch a day of data for synthetic fleets of each size through MyGeotabAPI and a local Geotab stand-in with
+        LATENCY seconds per call, in one Get call, paged through the FuelTaxDetail feed and sharded per device,
+        then check how a fetch fares when the stand-in throttles the caller, paged and sharded
+    """
+    results = []
+    for size in sizes:
+        fleet = SyntheticFleet(size)
+        from_date = datetime.combine(fleet.start, time(0, 0))
+        to_date = from_date + timedelta(days=1)
+        expected_csv = FleetGeotabAPI(fleet).to_ifta_data_collection(from_date, to_date).to_dataframe().to_csv(index=False)
+
+        with GeotabStandIn(fleet, latency=LATENCY) as server:
+            get = fetch(server, from_date, to_date, stream=False)
+            feed = fetch(server, from_date, to_date, stream=True)
+            sharded = fetch(server, from_date, to_date, sharded=True, calls_per_minute=SHARDED_CALLS_PER_MINUTE)
+
+        with GeotabStandIn(fleet, latency=LATENCY, rate_limit=THROTTLED_RATE_LIMIT) as server:
+            try:
+                fetch(server, from_date, to_date, stream=True)
+                throttled_outcome = 'completed'
+            except MyGeotabException as e:
+                throttled_outcome = e.name
+
+        # the scheduler assumes a higher rate than the stand-in allows, so it is throttled and has to back off
+        with GeotabStandIn(fleet, latency=LATENCY, rate_limit=SHARDED_RATE_LIMIT, rate_limit_period=1) as sharded_server:
+            try:
+                throttled_sharded = fetch(sharded_server, from_date, to_date, sharded=True, calls_per_minute=SHARDED_CALLS_PER_MINUTE)
+                throttled_sharded_outcome = 'completed' if throttled_sharded['csv'] == expected_csv else 'mismatch'
+            except MyGeotabException as e:
+                throttled_sharded_outcome = e.name
+
+        results.append({
+            'trucks': size,
+            'details': len(fleet.fuel_tax_details()),
+            'get_s': get['seconds'],
+            'get_calls': get['calls'],
+            'feed_s': feed['seconds'],
+            'feed_calls': feed['calls'],
+            'sharded_s': sharded['seconds'],
+            'sharded_calls': sharded['calls'],
+            'csv_match': get['csv'] == expected_csv and feed['csv'] == expected_csv and sharded['csv'] == expected_csv,
+            'throttled_calls': server.throttled,
+            'throttled_outcome': throttled_outcome,
+            'throttled_sharded_calls': sharded_server.throttled,
+            'throttled_sharded_outcome': throttled_sharded_outcome,
+        })
+    return results
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from datetime import date, time, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from daily_compliance_job.services.ifta import IftaDataCollection, FuelTaxProcessor
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+JURISDICTIONS = ['IL', 'IN', 'WI', 'IA', 'MO', 'KY', 'OH', 'MI']
+# The row-by-row implementation takes minutes past this size, so it is skipped by default
+LEGACY_MAX_ROWS = 100_000
+
+
+def make_fuel_tax_frame(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a frame shaped like MyGeotabAPI.to_dataframe output with num_rows details,
+        including empty VINs, empty jurisdictions, unreadable odometers and midnight exits
+    """
+    rng = np.random.default_rng(seed)
+    num_vins = max(1, num_rows // 20)
+    vins = np.array([f'1FUJGLDR{i:09d}' for i in range(num_vins)], dtype=object)
+
+    vin_codes = np.sort(rng.integers(0, num_vins, num_rows))
+    seconds = rng.integers(0, 24 * 60 * 60, num_rows)
+    day_offsets = rng.integers(0, 3, num_rows)
+    enter_odometer = rng.uniform(1_000, 900_000, num_rows)
+    exit_odometer = enter_odometer + rng.uniform(0, 150, num_rows)
+    midnight_exits = rng.random(num_rows) < 0.1
+
+    fuel_tax_vins = vins[vin_codes]
+    fuel_tax_vins[rng.random(num_rows) < 0.005] = None
+    jurisdictions = np.array(JURISDICTIONS, dtype=object)[rng.integers(0, len(JURISDICTIONS), num_rows)]
+    jurisdictions[rng.random(num_rows) < 0.005] = None
+    enter_odometer[rng.random(num_rows) < 0.001] = np.nan
+
+    times = [time(s // 3600, (s // 60) % 60, s % 60) for s in seconds.tolist()]
+    exit_times = [time(0, 0) if m else time(min(s // 3600 + 1, 23), 0) for s, m in zip(seconds.tolist(), midnight_exits.tolist())]
+    first_day = date(2024, 1, 1)
+    days = [first_day + timedelta(days=d) for d in range(3)]
+
+    return pd.DataFrame({
+        'FuelTaxVin': fuel_tax_vins,
+        'EnterReadingDate': [days[d] for d in day_offsets.tolist()],
+        'EnterReadingTime': times,
+        'ExitReadingTime': exit_times,
+        'FuelTaxEnterOdometer': enter_odometer,
+        'FuelTaxExitOdometer': exit_odometer,
+        'FuelTaxJurisdiction': jurisdictions,
+    })
+
+
+def legacy_to_ifta_data_collection(df: pd.DataFrame) -> IftaDataCollection:
+    """
+    Row-by-row reference implementation used before the columnar path
+    """
+    ifta_data_collection = IftaDataCollection()
+
+    for _, row in df.iterrows():
+        vin = str(row['FuelTaxVin'])
+        if vin in ('nan', 'None', ''):
+            continue
+        try:
+            enter_odometer = round(row['FuelTaxEnterOdometer'])
+        except ValueError:
+            enter_odometer = None
+        try:
+            exit_odometer = round(row['FuelTaxExitOdometer'])
+        except ValueError:
+            exit_odometer = None
+        jurisdiction = row['FuelTaxJurisdiction']
+        if jurisdiction in ('nan', None, '', ' '):
+            continue
+
+        ifta_data_collection.add_ifta_data(vin)
+        ifta_data = ifta_data_collection.get_ifta_data(vin)
+        ifta_data.add_entry(row['EnterReadingDate'], row['EnterReadingTime'], enter_odometer, jurisdiction)
+        if row['ExitReadingTime'] == time(0, 0):
+            ifta_data.add_entry(row['EnterReadingDate'], time(23, 59), exit_odometer, jurisdiction)
+
+    return ifta_data_collection
+
+
+def run(sizes: List[int] = DEFAULT_SIZES, legacy_max_rows: int = LEGACY_MAX_ROWS) -> List[Dict[str, Any]]:
+    """
+    Time the row-by-row and columnar FuelTaxDetail transforms and check their CSVs match
+    """
+    results = []
+    for size in sizes:
+        df = make_fuel_tax_frame(size)
+
+        start = timer.perf_counter()
+        columnar_csv = FuelTaxProcessor.to_ifta_dataframe(df).to_csv(index=False)
+        columnar_seconds = timer.perf_counter() - start
+
+        result = {'rows': size, 'columnar_s': round(columnar_seconds, 3), 'legacy_s': None, 'csv_match': None}
+        if size <= legacy_max_rows:
+            start = timer.perf_counter()
+            legacy_csv = legacy_to_ifta_data_collection(df).to_dataframe().to_csv(index=False)
+            result['legacy_s'] = round(timer.perf_counter() - start, 3)
+            result['csv_match'] = legacy_csv == columnar_csv
+        results.append(result)
+    return results
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gc
+import time as timer
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from daily_compliance_job.benchmarks.ifta import make_fuel_tax_frame
+from daily_compliance_job.services.ifta import IFTA_COLUMNS, FuelTaxProcessor, IftaDataCollection
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+
+
+def legacy_build_collection(df: pd.DataFrame) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Reference storage used before the typed arrays: one four-key dict per reading, in a list per VIN
+    """
+    collection = {}
+    for vin, group in df.groupby('VIN', sort=False):
+        collection[vin] = group[IFTA_COLUMNS[1:]].to_dict('records')
+    return collection
+
+
+def build_collection(df: pd.DataFrame) -> IftaDataCollection:
+    ifta_data_collection = IftaDataCollection.from_dataframe(df)
+    # drop the cached frame so only the IftaData storage is measured
+    ifta_data_collection.invalidate()
+    return ifta_data_collection
+
+
+def measure(build: Callable[[pd.DataFrame], Any], num_rows: int) -> Dict[str, Any]:
+    """
+    Build a collection from freshly generated readings and measure the memory it holds once the source frame is gone
+    """
+    gc.collect()
+    tracemalloc.start()
+    df = FuelTaxProcessor.to_ifta_dataframe(make_fuel_tax_frame(num_rows))
+    num_readings = len(df)
+
+    start = timer.perf_counter()
+    collection = build(df)
+    build_seconds = timer.perf_counter() - start
+
+    del df
+    gc.collect()
+    held_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del collection
+
+    return {
+        'readings': num_readings,
+        'build_s': round(build_seconds, 3),
+        'held_mb': round(held_bytes / 1024 / 1024, 1),
+        'bytes_per_reading': round(held_bytes / num_readings, 1),
+    }
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Compare the memory held by dict-per-reading and array-backed IftaData storage, measured with tracemalloc
+    """
+    results = []
+    for size in sizes:
+        legacy = measure(legacy_build_collection, size)
+        arrays = measure(build_collection, size)
+        results.append({
+            'rows': size,
+            'readings': arrays['readings'],
+            'legacy_held_mb': legacy['held_mb'],
+            'arrays_held_mb': arrays['held_mb'],
+            'legacy_bytes_per_reading': legacy['bytes_per_reading'],
+            'arrays_bytes_per_reading': arrays['bytes_per_reading'],
+            'legacy_build_s': legacy['build_s'],
+            'arrays_build_s': arrays['build_s'],
+        })
+    return results
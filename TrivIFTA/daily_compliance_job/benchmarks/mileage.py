@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import time as timer
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List
+
+import pandas as pd
+from django.db import connection
+
+from daily_compliance_job.benchmarks.fleet import FleetGeotabAPI, SyntheticFleet
+from daily_compliance_job.models import IFTA_ENTRY_KEY, IftaEntry
+from django.core.management import call_command
+
+from daily_compliance_job.services.mileage import MILEAGE_COLUMNS, get_jurisdiction_totals, get_mileage, get_quarter_mileage, get_quarter_totals, quarter_dates
+
+# trucks in the fleet
+DEFAULT_SIZES = [100, 1_000]
+# quarter the fleet drives through
+YEAR, QUARTER = 2024, 1
+
+
+def get_reference_mileage(entries: pd.DataFrame, from_date: date, to_date: date) -> pd.DataFrame:
+    '''
+    Miles per VIN per jurisdiction computed from the saved frame with pandas, to check the SQL against
+    '''
+    # keep the reading save_all_entries keeps when two share a time
+    entries = entries.drop_duplicates(subset=IFTA_ENTRY_KEY, keep='last').sort_values(IFTA_ENTRY_KEY)
+    entries = entries[(entries['ReadingDate'] >= from_date) & (entries['ReadingDate'] <= to_date)]
+    previous = entries.groupby(['VIN', 'ReadingDate']).shift(1)
+    segments = pd.DataFrame({
+        'VIN': entries['VIN'],
+        'Jurisdiction': previous['Jurisdiction'],
+        'Miles': entries['Odometer'] - previous['Odometer'],
+    }).dropna()
+    segments = segments[segments['Miles'] >= 0]
+    mileage = segments.groupby(['VIN', 'Jurisdiction'], as_index=False)['Miles'].sum()
+    return mileage.astype({'Miles': 'int64'})[MILEAGE_COLUMNS]
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Save a quarter of daily reports for synthetic fleets of each size to a throwaway test database, maintaining
+        the mileage rollups, then time the quarterly mileage from the raw entries and from the rollups, check both
+        against pandas, and time a rebuild of the rollups
+    """
+    from_date, to_date = quarter_dates(YEAR, QUARTER)
+    num_days = (to_date - from_date).days + 1
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = []
+        for size in sizes:
+            IftaEntry.objects.all().delete()
+            fleet = SyntheticFleet(size, start=from_date, num_days=num_days)
+            api = FleetGeotabAPI(fleet)
+            frames = []
+            for offset in range(num_days):
+                day = datetime.combine(from_date + timedelta(days=offset), time(0, 0))
+                frames.append(api.to_ifta_data_collection(day, day + timedelta(days=1)).to_dataframe())
+            entries = pd.concat(frames, ignore_index=True)
+            # one report a day, as the daily job saves them
+            start = timer.perf_counter()
+            for frame in frames:
+                IftaEntry.save_all_entries(frame)
+            save_seconds = round(timer.perf_counter() - start, 3)
+
+            start = timer.perf_counter()
+            raw_mileage = get_mileage(from_date, to_date)
+            raw_seconds = round(timer.perf_counter() - start, 3)
+            start = timer.perf_counter()
+            mileage = get_quarter_mileage(YEAR, QUARTER)
+            rollup_seconds = round(timer.perf_counter() - start, 3)
+            start = timer.perf_counter()
+            totals = get_quarter_totals(YEAR, QUARTER)
+            totals_seconds = round(timer.perf_counter() - start, 3)
+            start = timer.perf_counter()
+            call_command('rebuild_mileage_rollups', stdout=io.StringIO())
+            rebuild_seconds = round(timer.perf_counter() - start, 3)
+
+            results.append({
+                'trucks': size,
+                'entries': len(entries),
+                'mileage_rows': len(mileage),
+                'save_days_s': save_seconds,
+                'quarter_from_entries_s': raw_seconds,
+                'quarter_from_rollups_s': rollup_seconds,
+                'totals_from_rollups_s': totals_seconds,
+                'rebuild_s': rebuild_seconds,
+                'miles': int(mileage['Miles'].sum()),
+                'match': (raw_mileage.equals(get_reference_mileage(entries, from_date, to_date)) and mileage.equals(raw_mileage)
+                          and totals.equals(get_jurisdiction_totals(raw_mileage)) and get_quarter_mileage(YEAR, QUARTER).equals(mileage)),
+            })
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
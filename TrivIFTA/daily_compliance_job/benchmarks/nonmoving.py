@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from datetime import date, time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from daily_compliance_job.services.ifta import IftaDataCollection
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+JURISDICTIONS = ['IL', 'IN', 'WI', 'IA', 'MO', 'KY', 'OH', 'MI']
+
+
+def make_ifta_frame(num_vins: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a sorted frame shaped like IftaDataCollection.to_dataframe output for num_vins vehicles,
+        about a third of which are parked all day (two identical readings)
+    """
+    rng = np.random.default_rng(seed)
+    vins = np.array([f'1FUJGLDR{i:09d}' for i in range(num_vins)], dtype=object)
+    parked = rng.random(num_vins) < 0.3
+    # moving vehicles have 2 to 40 readings, so some have two readings that differ
+    entries_per_vin = np.where(parked, 2, rng.integers(2, 41, num_vins))
+    num_rows = int(entries_per_vin.sum())
+
+    vin_codes = np.repeat(np.arange(num_vins), entries_per_vin)
+    start_odometer = rng.integers(1_000, 900_000, num_vins)
+    odometer = start_odometer[vin_codes] + np.where(parked[vin_codes], 0, rng.integers(0, 150, num_rows))
+    jurisdiction_codes = np.where(parked[vin_codes], vin_codes % len(JURISDICTIONS), rng.integers(0, len(JURISDICTIONS), num_rows))
+    minutes = np.sort(rng.integers(0, 24 * 60, num_rows))
+
+    return pd.DataFrame({
+        'VIN': vins[vin_codes],
+        'ReadingDate': date(2024, 1, 1),
+        'ReadingTime': [time(m // 60, m % 60) for m in minutes.tolist()],
+        'Odometer': odometer,
+        'Jurisdiction': np.array(JURISDICTIONS, dtype=object)[jurisdiction_codes],
+    })
+
+
+def legacy_get_nonmoving_vehicles(df: pd.DataFrame) -> List[str]:
+    """
+    Per-group reference implementation used before the vectorized scan
+    """
+    grouped = df.groupby('VIN')
+    return [vin for vin, group in grouped if len(group) == 2 and group['Odometer'].nunique() == 1 and group['Jurisdiction'].nunique() == 1]
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Time the nonmoving-vehicle scan before and after vectorizing it and check both find the same vins
+    The legacy scan is timed twice, as the full and reduced frames each ran it
+    """
+    results = []
+    collection = IftaDataCollection()
+    for size in sizes:
+        df = make_ifta_frame(size)
+
+        start = timer.perf_counter()
+        legacy_vins = legacy_get_nonmoving_vehicles(df)
+        legacy_get_nonmoving_vehicles(df)
+        legacy_seconds = timer.perf_counter() - start
+
+        start = timer.perf_counter()
+        vehicle_stats = collection.get_vehicle_stats(df)
+        nonmoving_vehicles = set(vehicle_stats.index[vehicle_stats['nonmoving']])
+        vectorized_seconds = timer.perf_counter() - start
+
+        results.append({
+            'vins': size,
+            'rows': len(df),
+            'nonmoving': len(nonmoving_vehicles),
+            'legacy_s': round(legacy_seconds, 3),
+            'vectorized_s': round(vectorized_seconds, 3),
+            'match': set(legacy_vins) == nonmoving_vehicles,
+        })
+    return results
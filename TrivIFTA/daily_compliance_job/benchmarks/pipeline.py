@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time as timer
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List
+
+from django.db import connection
+
+from daily_compliance_job.benchmarks.fleet import FleetGeotabAPI, SyntheticFleet
+from daily_compliance_job.models import IftaEntry
+from daily_compliance_job.services.ifta import FuelTaxProcessor
+
+# trucks in the fleet
+DEFAULT_SIZES = [100, 1_000, 5_000]
+
+
+def timed(func, *args, **kwargs):
+    start = timer.perf_counter()
+    result = func(*args, **kwargs)
+    return result, round(timer.perf_counter() - start, 3)
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Run the daily report end to end for a synthetic fleet of each size: the XLSX export through
+        FuelTaxProcessor.process_data, the Geotab API path through MyGeotabAPI.to_ifta_data_collection,
+        IftaDataCollection.to_dataframe and IftaEntry.save_all_entries on a throwaway test database
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = []
+        for size in sizes:
+            fleet, generate_seconds = timed(SyntheticFleet, size)
+            from_date = datetime.combine(fleet.start, time(0, 0))
+            to_date = from_date + timedelta(days=1)
+            workbook = fleet.to_workbook()
+
+            xlsx_collection, xlsx_seconds = timed(FuelTaxProcessor(workbook, 'bytes').process_data)
+            api_collection, api_seconds = timed(FleetGeotabAPI(fleet).to_ifta_data_collection, from_date, to_date)
+            api_collection.invalidate()
+            df, to_dataframe_seconds = timed(api_collection.to_dataframe)
+            num_saved, save_seconds = timed(IftaEntry.save_all_entries, df)
+
+            results.append({
+                'trucks': size,
+                'details': len(fleet.fuel_tax_details()),
+                'rows': len(df),
+                'nonmoving': api_collection.num_nonmoving_vehicles,
+                'generate_s': generate_seconds,
+                'process_data_s': xlsx_seconds,
+                'to_ifta_data_collection_s': api_seconds,
+                'to_dataframe_s': to_dataframe_seconds,
+                'save_all_entries_s': save_seconds,
+                'saved': num_saved,
+                # the XLSX export and the API must produce the same report
+                'csv_match': xlsx_collection.to_dataframe().to_csv(index=False) == df.to_csv(index=False),
+            })
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
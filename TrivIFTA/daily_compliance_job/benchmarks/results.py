@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+# result fields compared between runs: seconds and megabytes, where higher is worse
+MEASURED_SUFFIXES = ('_s', '_mb')
+# differences smaller than this are noise, whatever the ratio
+MIN_REGRESSION = 0.05
+
+
+def get_revision() -> str:
+    '''
+    Returns the short git commit of the working tree, or None outside a git checkout
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def results_path(suite: str) -> str:
+    return os.path.join(settings.BENCHMARK_RESULTS_DIR, f'{suite}.jsonl')
+
+
+def save_results(suite: str, sizes: List[int], results: List[Dict[str, Any]]) -> str:
+    '''
+    Appends a run of the suite to BENCHMARK_RESULTS_DIR/<suite>.jsonl, one JSON object per run
+    Returns the path of the results file
+    '''
+    os.makedirs(settings.BENCHMARK_RESULTS_DIR, exist_ok=True)
+    path = results_path(suite)
+    run = {
+        'suite': suite,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'sizes': sizes,
+        'results': results,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    return path
+
+
+def load_last_results(suite: str) -> Dict[str, Any]:
+    '''
+    Returns the last saved run of the suite, or None if it was never saved
+    '''
+    path = results_path(suite)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def find_regressions(previous: List[Dict[str, Any]], results: List[Dict[str, Any]], threshold: float) -> List[str]:
+    '''
+    Compares results with the previous run of the same suite, matching results by their first field (the input size)
+    Returns a description of every measurement more than threshold (a fraction) worse than before
+    '''
+    previous_by_size = {next(iter(result.items())): result for result in previous if result}
+    regressions = []
+    for result in results:
+        if not result:
+            continue
+        size = next(iter(result.items()))
+        before = previous_by_size.get(size)
+        if before is None:
+            continue
+        for field, value in result.items():
+            old_value = before.get(field)
+            if not field.endswith(MEASURED_SUFFIXES) or not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)):
+                continue
+            if value > old_value * (1 + threshold) and value - old_value > MIN_REGRESSION:
+                regressions.append(f'{size[0]}={size[1]} {field}: {old_value} -> {value}')
+    return regressions
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import time as timer
+from typing import Any, Dict, List
+
+from daily_compliance_job.benchmarks.ifta import make_fuel_tax_frame
+from daily_compliance_job.services.ifta import FuelTaxProcessor
+from daily_compliance_job.services.sftp import GeotabSFTP, SFTPConnection, SFTPConnectionPool, write_file
+from daily_compliance_job.standins.sftp import SFTPStandIn
+
+DEFAULT_SIZES = [10, 50]
+ROWS_PER_FILE = 2_000
+
+
+def legacy_send_files(server: SFTPStandIn, files: Dict[str, str]) -> None:
+    """
+    One connection and SSH handshake per file, as GeotabSFTP did before pooling
+    """
+    for filename, csv_data in files.items():
+        connection = SFTPConnection(server.host, server.port, server.username, server.password)
+        try:
+            write_file(connection, filename, [csv_data.encode('utf-8')])
+        finally:
+            connection.close()
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Upload daily reports to a local SFTP stand-in with a connection per file and over the pool,
+        then check the pool recovers when the server drops its connections
+    """
+    csv_data = FuelTaxProcessor.to_ifta_dataframe(make_fuel_tax_frame(ROWS_PER_FILE)).to_csv(index=False)
+    results = []
+    for size in sizes:
+        files = {f'report_{i:04d}.csv': csv_data for i in range(size)}
+        with tempfile.TemporaryDirectory() as root, SFTPStandIn(root) as server:
+            start = timer.perf_counter()
+            legacy_send_files(server, files)
+            legacy_seconds = timer.perf_counter() - start
+            legacy_connections = server.connections
+
+            pool = SFTPConnectionPool(server.host, server.port, server.username, server.password, max_size=1, backoff=0.1)
+            sftp = GeotabSFTP(pool=pool)
+            start = timer.perf_counter()
+            uploads = sftp.send_files(files.items())
+            pooled_seconds = timer.perf_counter() - start
+            pooled_connections = server.connections - legacy_connections
+
+            server.drop_connections()
+            recovered = sftp.send_to_sftp(csv_data, 'after_drop.csv')
+            pool.close()
+
+            expected_sha256 = hashlib.sha256(csv_data.encode('utf-8')).hexdigest()
+            results.append({
+                'files': size,
+                'legacy_s': round(legacy_seconds, 3),
+                'pooled_s': round(pooled_seconds, 3),
+                'legacy_connections': legacy_connections,
+                'pooled_connections': pooled_connections,
+                'checksums_ok': all(upload.sha256 == expected_sha256 for upload in uploads + [recovered]),
+                'reconnected_after_drop': os.path.exists(os.path.join(root, 'after_drop.csv')) and pool.connects == 2,
+            })
+    return results
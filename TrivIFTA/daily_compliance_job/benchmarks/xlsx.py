@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import time as timer
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from daily_compliance_job.services import ifta
+from daily_compliance_job.services.ifta import FileManager, FleetDataFrame, FuelTaxProcessor
+
+DEFAULT_SIZES = [10_000, 50_000, 100_000]
+JURISDICTIONS = ['IL', 'IN', 'WI', 'IA', 'MO', 'KY', 'OH', 'MI', None]
+# columns of a Geotab fuel tax export, including the ones the report does not use
+EXPORT_COLUMNS = [
+    'DeviceName', 'FuelTaxVin', 'FuelTaxDriverName', 'FuelTaxEnterTime', 'FuelTaxExitTime', 'FuelTaxJurisdiction',
+    'FuelTaxEnterOdometer', 'FuelTaxExitOdometer', 'FuelTaxEnterGpsOdometer', 'FuelTaxExitGpsOdometer',
+    'FuelTaxEnterLatitude', 'FuelTaxEnterLongitude', 'FuelTaxExitLatitude', 'FuelTaxExitLongitude',
+    'FuelTaxDistance', 'FuelTaxIsEnterOdometerInterpolated', 'FuelTaxIsExitOdometerInterpolated', 'FuelTaxAuthority',
+]
+
+
+def make_workbook(num_rows: int, seed: int = 0) -> bytes:
+    """
+    Generate a Geotab-style fuel tax XLSX export with a title block above the header on the 'Data' sheet
+    """
+    rng = np.random.default_rng(seed)
+    num_devices = max(1, num_rows // 30)
+    start = datetime(2024, 1, 1)
+
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet('Data')
+    sheet.append(['IFTA Report'])
+    sheet.append(['Report period', '2024-01-01', '2024-01-31'])
+    sheet.append([])
+    sheet.append(EXPORT_COLUMNS)
+
+    devices = rng.integers(0, num_devices, num_rows).tolist()
+    seconds = rng.uniform(0, 31 * 24 * 60 * 60, num_rows).tolist()
+    odometers = rng.uniform(1_000, 900_000, num_rows).tolist()
+    jurisdictions = rng.integers(0, len(JURISDICTIONS), num_rows).tolist()
+    for i in range(num_rows):
+        enter_time = start + timedelta(seconds=seconds[i])
+        exit_time = (enter_time + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0) if i % 7 == 0 else enter_time + timedelta(minutes=45)
+        sheet.append([
+            f'Truck {devices[i]}', f'1FUJGLDR{devices[i]:09d}', 'Unknown Driver', enter_time, exit_time, JURISDICTIONS[jurisdictions[i]],
+            odometers[i], odometers[i] + 50.25, odometers[i], odometers[i] + 50.25,
+            41.8781, -87.6298, 41.9, -87.7, 50.25, False, False, "O'Halloran",
+        ])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def legacy_read_file(input_data: bytes) -> pd.DataFrame:
+    """
+    Reference implementation parsing the workbook twice: once for the header, once with pd.read_excel
+    """
+    header_row = FileManager.find_header_row(input_data, 'DeviceName')
+    return pd.read_excel(io.BytesIO(input_data), sheet_name='Data', skiprows=header_row)
+
+
+def to_ifta_csv(df: pd.DataFrame) -> str:
+    fleet_dataframe = FleetDataFrame(df)
+    fleet_dataframe.reduce_df()
+    fleet_dataframe.split_date_time()
+    return FuelTaxProcessor.to_ifta_dataframe(fleet_dataframe).to_csv(index=False)
+
+
+def timed_read(read, input_data: bytes):
+    start = timer.perf_counter()
+    df = read(input_data)
+    return df, round(timer.perf_counter() - start, 3)
+
+
+def run(sizes: List[int] = DEFAULT_SIZES) -> List[Dict[str, Any]]:
+    """
+    Time the two-pass and single-pass readers on generated workbooks of increasing size
+        and check they produce the same report
+    """
+    results = []
+    for size in sizes:
+        input_data = make_workbook(size)
+        result = {'rows': size, 'workbook_mb': round(len(input_data) / 2 ** 20, 1)}
+
+        legacy_df, result['legacy_s'] = timed_read(legacy_read_file, input_data)
+        legacy_csv = to_ifta_csv(legacy_df)
+
+        engines = {'openpyxl': None, 'calamine': ifta.CalamineWorkbook} if ifta.CalamineWorkbook else {'openpyxl': None}
+        calamine_workbook = ifta.CalamineWorkbook
+        try:
+            for engine, workbook in engines.items():
+                ifta.CalamineWorkbook = workbook
+                df, result[f'{engine}_s'] = timed_read(lambda data: FileManager.read_file(data, data_type='bytes'), input_data)
+                result[f'{engine}_match'] = to_ifta_csv(df) == legacy_csv
+        finally:
+            ifta.CalamineWorkbook = calamine_workbook
+        results.append(result)
+    return results
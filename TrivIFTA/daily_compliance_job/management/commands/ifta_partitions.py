@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from daily_compliance_job.models import ArchivedMonth
+from daily_compliance_job.services.partitions import archive_month, create_future_partitions, get_cold_months, is_partitioned, parse_month, reload_month
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Create the monthly IftaEntry partitions ahead of time, archive cold months to Parquet and reload them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            default=None,
+            type=int,
+            help='Months after the current one to create partitions for (defaults to IFTA_PARTITION_MONTHS_AHEAD)',)
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help='Archive the months older than --hot-months to IFTA_ARCHIVE_DIR and remove them from the database',)
+        parser.add_argument(
+            '--hot-months',
+            default=None,
+            type=int,
+            help='Months of entries, counting the current one, kept in the database by --archive (defaults to IFTA_ENTRY_HOT_MONTHS)',)
+        parser.add_argument(
+            '--reload',
+            nargs='+',
+            default=[],
+            type=str,
+            help='Archived months to load back into the database (format YYYY-MM)',)
+
+    def handle(self, *args, **options) -> str:
+        try:
+            reload_months = [parse_month(month) for month in options['reload']]
+        except ValueError as e:
+            raise CommandError(f'Invalid month format in command: {e}')
+        if options['hot_months'] is not None and options['hot_months'] < 1:
+            raise CommandError('--hot-months must keep at least the current month')
+        unknown_months = set(reload_months) - set(ArchivedMonth.objects.filter(month__in=reload_months).values_list('month', flat=True))
+        if unknown_months:
+            raise CommandError(f'Not archived: {", ".join(f"{month:%Y-%m}" for month in sorted(unknown_months))}')
+
+        summary = []
+        months = create_future_partitions(options['months_ahead'])
+        if is_partitioned():
+            summary.append(f'Partitions ready up to {months[-1]:%Y-%m}.')
+
+        if options['archive']:
+            for month in get_cold_months(options['hot_months']):
+                num_archived = archive_month(month)
+                summary.append(f'Archived {num_archived} entries of {month:%Y-%m}.')
+
+        for month in reload_months:
+            num_loaded = reload_month(month)
+            summary.append(f'Reloaded {num_loaded} entries of {month:%Y-%m}.')
+
+        summary = '\n'.join(summary) or 'Nothing to do.'
+        logger.info(summary)
+        return summary
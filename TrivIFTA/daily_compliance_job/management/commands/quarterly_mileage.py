@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from daily_compliance_job.services.mileage import get_jurisdiction_totals, get_mileage, get_quarter_mileage, get_quarter_totals, parse_quarter, quarter_dates
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Compute the miles driven per VIN per jurisdiction in an IFTA quarter from the saved entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'quarter',
+            type=str,
+            help='Quarter to compute (format YYYY-Q<n>, e.g. 2024-Q1)',)
+        parser.add_argument(
+            '--vin',
+            default=None,
+            type=str,
+            help='Only compute the miles of this VIN',)
+        parser.add_argument(
+            '--jurisdiction',
+            default=None,
+            type=str,
+            help='Only compute the miles driven in this jurisdiction',)
+        parser.add_argument(
+            '--totals',
+            action='store_true',
+            help='Print the fleet miles per jurisdiction instead of the miles per VIN',)
+        parser.add_argument(
+            '--from-entries',
+            action='store_true',
+            help='Compute the miles from the raw entries instead of reading the mileage rollups',)
+        parser.add_argument(
+            '--output',
+            default=None,
+            type=str,
+            help='Write the CSV to this file instead of printing it',)
+
+    def handle(self, *args, **options) -> str:
+        try:
+            year, quarter = parse_quarter(options['quarter'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+        if options['totals'] and not options['vin'] and not options['from_entries']:
+            mileage = get_quarter_totals(year, quarter, options['jurisdiction'])
+        else:
+            if options['from_entries']:
+                mileage = get_mileage(*quarter_dates(year, quarter), options['vin'], options['jurisdiction'])
+            else:
+                mileage = get_quarter_mileage(year, quarter, options['vin'], options['jurisdiction'])
+            if options['totals']:
+                mileage = get_jurisdiction_totals(mileage)
+        logger.info(f'Computed {len(mileage)} mileage rows for {year}-Q{quarter} in {time.perf_counter() - start:.2f}s')
+
+        csv_data = mileage.to_csv(index=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(csv_data)
+            return f'Wrote {len(mileage)} rows to {options["output"]}'
+        return csv_data
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from daily_compliance_job.models import ArchivedMonth, DailyMileage, IftaEntry
+from daily_compliance_job.services.entry_cache import EntryCache
+from daily_compliance_job.services.partitions import month_start
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and quarterly mileage rollups from the saved entries, except in archived months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='range_from',
+            default=None,
+            type=str,
+            help='First date to rebuild (format YYYY-MM-DD, defaults to the first saved entry)',)
+        parser.add_argument(
+            '--to',
+            dest='range_to',
+            default=None,
+            type=str,
+            help='Last date to rebuild, inclusive (format YYYY-MM-DD, defaults to the last saved entry)',)
+        parser.add_argument(
+            '--chunk-days',
+            default=31,
+            type=int,
+            help='Days rebuilt per transaction',)
+
+    def handle(self, *args, **options) -> str:
+        first_date, last_date = IftaEntry.objects.aggregate(first=Min('reading_date'), last=Max('reading_date')).values()
+        try:
+            from_date = datetime.date.fromisoformat(options['range_from']) if options['range_from'] else first_date
+            to_date = datetime.date.fromisoformat(options['range_to']) if options['range_to'] else last_date
+        except ValueError as e:
+            raise CommandError(f'Invalid date format in command: {e}')
+        if from_date is None or to_date is None:
+            return 'No entries to roll up.'
+        if to_date < from_date or options['chunk_days'] < 1:
+            raise CommandError(f'Invalid rebuild range {from_date} to {to_date} in chunks of {options["chunk_days"]} days')
+
+        # the rollups are all that is left of archived months, and refreshing them from no entries would delete them
+        archived_months = set(ArchivedMonth.objects.filter(month__gte=month_start(from_date), month__lte=to_date).values_list('month', flat=True))
+        if archived_months:
+            logger.warning(f'Skipping archived months {", ".join(f"{month:%Y-%m}" for month in sorted(archived_months))}')
+
+        start = time.perf_counter()
+        num_saved = 0
+        chunk_start = from_date
+        while chunk_start <= to_date:
+            chunk_end = min(chunk_start + datetime.timedelta(days=options['chunk_days'] - 1), to_date)
+            dates = [chunk_start + datetime.timedelta(days=offset) for offset in range((chunk_end - chunk_start).days + 1)]
+            dates = [date for date in dates if month_start(date) not in archived_months]
+            if dates:
+                num_saved += DailyMileage.refresh(dates)
+                EntryCache().invalidate(dates)
+                logger.info(f'Rebuilt mileage rollups for {chunk_start} to {chunk_end}')
+            chunk_start = chunk_end + datetime.timedelta(days=1)
+
+        summary = f'Rebuilt {num_saved} daily mileage rollups for {from_date} to {to_date} in {time.perf_counter() - start:.2f}s'
+        summary += f', skipping {len(archived_months)} archived months.' if archived_months else '.'
+        logger.info(summary)
+        return summary
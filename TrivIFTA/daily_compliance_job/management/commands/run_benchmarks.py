@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from daily_compliance_job.benchmarks import anomalies, db, detail_buffer, email, geotab, ifta, ifta_data, mileage, nonmoving, pipeline, sftp, xlsx
+from daily_compliance_job.benchmarks.results import find_regressions, load_last_results, save_results
+import json
+
+SUITES = {
+    'anomalies': anomalies,
+    'ifta': ifta,
+    'ifta_data': ifta_data,
+    'db': db,
+    'detail_buffer': detail_buffer,
+    'email': email,
+    'geotab': geotab,
+    'mileage': mileage,
+    'nonmoving': nonmoving,
+    'pipeline': pipeline,
+    'sftp': sftp,
+    'xlsx': xlsx,
+}
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks for the daily compliance job pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suite',
+            choices=sorted(SUITES),
+            help='Benchmark suite to run',)
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=None,
+            help='Input sizes to benchmark (defaults to the suite sizes)',)
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Fail if a timing or memory result regressed by more than BENCHMARK_REGRESSION_THRESHOLD since the last saved run',)
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Append the results to BENCHMARK_RESULTS_DIR/<suite>.jsonl',)
+
+    def handle(self, *args, **options) -> None:
+        suite = SUITES[options['suite']]
+        sizes = options['sizes'] or suite.DEFAULT_SIZES
+        if any(size <= 0 for size in sizes):
+            raise CommandError('Benchmark sizes must be positive')
+
+        # read the baseline before saving, so a run is not compared with itself
+        previous = load_last_results(options['suite']) if options['compare'] else None
+        results = suite.run(sizes)
+        for result in results:
+            self.stdout.write(json.dumps(result))
+
+        # the boolean results check a suite's output against its reference, so a failed check fails the run before it is saved
+        failed_checks = [f'{key} of {json.dumps(result)}' for result in results for key, value in result.items() if value is False]
+        if failed_checks:
+            raise CommandError('Benchmark checks failed:\n' + '\n'.join(failed_checks))
+
+        if options['save']:
+            self.stdout.write(f'Saved results to {save_results(options["suite"], sizes, results)}')
+        if options['compare']:
+            if previous is None:
+                self.stdout.write(f'No saved results for {options["suite"]} to compare with')
+                return
+            regressions = find_regressions(previous['results'], results, settings.BENCHMARK_REGRESSION_THRESHOLD)
+            if regressions:
+                raise CommandError(f'Regressions since {previous["revision"]} ({previous["timestamp"]}):\n' + '\n'.join(regressions))
+            self.stdout.write(f'No regressions since {previous["revision"]} ({previous["timestamp"]})')
@@ -1,16 +1,33 @@
-from django.core.management.base import BaseCommand
-from daily_compliance_job.models import IftaEntry
-from daily_compliance_job.services.geotab import MyGeotabAPI
-from daily_compliance_job.services.sftp import GeotabSFTP
-from daily_compliance_job.services.email import EmailService
+from django.core.management.base import BaseCommand, CommandError
+from daily_compliance_job.models import IftaEntry, VinDayFingerprint
+from daily_compliance_job.services.backfill import Backfill, COMPLETED, SKIPPED
+from daily_compliance_job.services.geotab import MyGeotabAPI, IFTA_GROUP
+from daily_compliance_job.services.anomalies import count_anomalies, describe_anomalies
+from daily_compliance_job.services.report_cache import ReportCache
+from daily_compliance_job.services.sftp import GeotabSFTP, close_pools
+from daily_compliance_job.services.email import EmailBatch, EmailService
+from daily_compliance_job.services.fingerprints import ADDED, CHANGED, count_changes, diff_fingerprints, fingerprint_vin_days, is_first_run, select_changed
 from daily_compliance_job.services.ifta import IftaDataCollection
+from daily_compliance_job.services.instrumentation import JobInstrumentation, span
+from daily_compliance_job.utils import get_report_file_name, get_update_file_name
 import datetime
+import pandas as pd
 import logging
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = 'Run the daily compliance job to generate IFTA reports'
+    # called with the name of each stage as the job reaches it (fetching, processing, uploading, emailing, saving)
+    progress_callback = None
+    # the ReportCache key of the report a single day's run produced, None until one is stored
+    report_key = None
+
+    def report_progress(self, stage: str) -> None:
+        logger.info(f'Daily job stage: {stage}')
+        if self.progress_callback:
+            self.progress_callback(stage)
 
     def add_arguments(self, parser):
         # arugments for the date, test mode, and removing unchanged entries
@@ -39,8 +56,75 @@ class Command(BaseCommand):
             '--send-to-ftp',
             action='store_true',
             help='Send the report to the FTP server',)
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Page the Geotab data through the FuelTaxDetail feed instead of fetching it in one call. The feed is read from the start of the day '
+                 'on every run; the saved feed version of sync_fuel_tax_feed is neither used nor updated',)
+        parser.add_argument(
+            '--sharded',
+            action='store_true',
+            help='Fetch the Geotab data per device, concurrently and within the account rate limit (GEOTAB_CALLS_PER_MINUTE)',)
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help='Re-fetch the report from Geotab even if a processed copy is cached',)
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only upload, email and save the VIN-days whose readings changed since the last incremental run of the date (always re-fetches from Geotab). '
+                 'With --save-to-db, the saved entries of the VIN-days Geotab no longer returns are deleted',)
+        # arguments for backfilling a range of dates
+        parser.add_argument(
+            '--from',
+            dest='range_from',
+            default=None,
+            type=str,
+            help='First date of a range of reports to backfill (format YYYY-MM-DD)',)
+        parser.add_argument(
+            '--to',
+            dest='range_to',
+            default=None,
+            type=str,
+            help='Last date of a range of reports to backfill, inclusive (format YYYY-MM-DD)',)
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='Maximum number of days processed at the same time when backfilling',)
+        parser.add_argument(
+            '--output-dir',
+            default='reports',
+            type=str,
+            help='Directory for the backfilled CSVs; days that already have a CSV there are skipped',)
+        parser.add_argument(
+            '--combined',
+            action='store_true',
+            help='Also write a single CSV covering the whole backfill range',)
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Profile the run with pyinstrument if installed, cProfile otherwise, writing the profile to JOB_PROFILE_DIR',)
 
     def handle(self, *args, **options) -> str:
+        if options['stream'] and options['sharded']:
+            raise CommandError('--stream and --sharded cannot be combined')
+        # the stage timings of the run are logged and stored as a JobRun
+        self.instrumentation = JobInstrumentation('run_daily_job', options)
+        # every email of the run goes over one SMTP session
+        try:
+            with self.instrumentation.record(profile=options['profile']), EmailBatch() as emails:
+                if options['range_from'] or options['range_to']:
+                    return self.handle_range(options, emails)
+                return self.handle_day(options, emails)
+        finally:
+            # the pooled SFTP connections only need to outlive the uploads of one run, not the worker
+            close_pools()
+
+    def handle_day(self, options, emails: EmailBatch) -> str:
+        '''
+        Generate the report for a single day
+        '''
         # Parsing the date arguments
         from_date_str = options['from_date']
 
@@ -60,49 +144,148 @@ class Command(BaseCommand):
         # Set the time to 0:00:00
         from_date = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
         to_date = to_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.instrumentation.report_date = from_date.date()
+
+        self.report_progress('fetching')
 
-        # Instantiate MyGeotabAPI
-        my_geotab_api = MyGeotabAPI()
+        # Reuse the processed report if this date was already generated recently
+        report_cache = ReportCache()
+        cache_key = report_cache.key(from_date, to_date, [group['id'] for group in IFTA_GROUP])
+        with span('report_cache.get'):
+            # a cached report would hide the details Geotab added since, which is what an incremental run is for
+            cached_df = None if options['refresh'] or options['incremental'] else report_cache.get(cache_key)
+
+        if cached_df is not None:
+            logger.info(f'Using cached report for {from_date.date()}')
+            geotab_ifta_data_collection = IftaDataCollection.from_dataframe(cached_df)
+        else:
+            # Instantiate MyGeotabAPI
+            my_geotab_api = MyGeotabAPI()
 
-        # Logic to generate CSV
-        geotab_ifta_data_collection = my_geotab_api.to_ifta_data_collection(from_date, to_date)
-        full_df = geotab_ifta_data_collection.to_dataframe()
+            # Logic to generate CSV
+            geotab_ifta_data_collection = my_geotab_api.to_ifta_data_collection(from_date, to_date, stream=options['stream'], sharded=options['sharded'])
+            if my_geotab_api.device_cache:
+                logger.info(f'Device cache: {my_geotab_api.device_cache.stats()}')
+        self.report_progress('processing')
+        with span('ifta_report') as stage:
+            report = geotab_ifta_data_collection.to_report()
+            full_df = report.full
+            stage.rows = len(full_df)
+        if len(report.anomalies):
+            logger.warning(f'Odometer anomalies for {from_date.date()}: {count_anomalies(report.anomalies)}')
+        if cached_df is None:
+            with span('report_cache.put'):
+                report_cache.put(cache_key, full_df)
 
-        full_csv_data = full_df.to_csv(index=False)
-        file_name = f'Ohalloran_{from_date.year}_{from_date.month:02d}_{from_date.day:02d}.csv'
+        file_name = get_report_file_name(from_date)
 
-        csv_data = full_csv_data
-        # if the remove_unchanged argument was provided, create a reduced dataframe
-        if options['remove_unchanged']:
-            reduced_df = geotab_ifta_data_collection.to_dataframe(remove_nonmoving_vehicles=True)
-            reduced_csv_data = reduced_df.to_csv(index=False)
-            csv_data = reduced_csv_data
+        # if the remove_unchanged argument was provided, report the reduced dataframe
+        report_df = report.reduced if options['remove_unchanged'] else full_df
         
         # if the test argument was provided, print the dataframe and return (and email if the email argument was provided)
         if options['test']:
             send_email = bool(options['send_email'])
-            test_mode(full_csv_data, file_name, from_date, send_email=send_email)
+            test_mode(full_df.to_csv(index=False), file_name, from_date, send_email=send_email, emails=emails)
             return
 
-        # send the CSV to the FTP server
+        # in incremental mode, only the VIN-days that changed since the last incremental run of the date go out,
+        #   in an update file once the date has been sent before
+        delta = None
+        changes = None
+        if options['incremental']:
+            with span('fingerprints') as stage:
+                delta = diff_fingerprints(fingerprint_vin_days(full_df), [from_date.date()])
+                stage.rows = len(delta)
+            changes = count_changes(delta)
+            logger.info(f'VIN-day changes for {from_date.date()}: {changes}')
+            if not changes[ADDED] and not changes[CHANGED]:
+                VinDayFingerprint.save_delta(delta, delete_entries=bool(options['save_to_db']))
+                logger.info(f'No VIN-days added or changed for {from_date.date()}, nothing to send or save.')
+                return ''
+            if not is_first_run(delta):
+                file_name = get_update_file_name(from_date, datetime.datetime.now())
+            full_df = select_changed(full_df, delta)
+            report_df = select_changed(report_df, delta)
+
+        # stream the CSV to the FTP server
         if options['send_to_ftp']:
-            if not send_to_sftp(csv_data, file_name, from_date):
-                raise Exception('Failed to send data to FTP server')
+            self.report_progress('uploading')
+            with span('sftp_upload') as stage:
+                stage.rows = len(report_df)
+                if not send_to_sftp(report_df, file_name, from_date, emails):
+                    raise Exception('Failed to send data to FTP server')
 
         # send email to recipients
         if options['send_email']:
-            if not send_success_email(csv_data, file_name, bool(options['send_to_ftp']), from_date, geotab_ifta_data_collection.total_vehicles, geotab_ifta_data_collection.num_nonmoving_vehicles):
-                raise Exception('Failed to send success email')
+            self.report_progress('emailing')
+            # only the email attachment needs the CSV text; the upload streams the dataframe
+            with span('csv_render') as stage:
+                csv_data = report_df.to_csv(index=False)
+                stage.rows = len(report_df)
+            with span('email'):
+                if not send_success_email(csv_data, file_name, bool(options['send_to_ftp']), from_date, report.total_vehicles, report.num_nonmoving_vehicles, emails, anomalies=report.anomalies, changes=changes):
+                    raise Exception('Failed to send success email')
             
         # save entries to database if save_to_db argument was provided
         #   Note: the full dataframe is always saved to the database
         if options['save_to_db']:
-            IftaEntry.save_all_entries(entries=full_df)
-            logger.info('Successfully saved entries to database.')
+            self.report_progress('saving')
+            with span('db_save') as stage:
+                num_saved = IftaEntry.save_all_entries(entries=full_df)
+                stage.rows = num_saved
+            logger.info(f'Successfully saved {num_saved} entries to database.')
+
+        # only remember what was sent once everything went out; the saved entries of the removed VIN-days are deleted with their fingerprints
+        if delta is not None:
+            with span('fingerprints.save') as stage:
+                stage.rows = VinDayFingerprint.save_delta(delta, delete_entries=bool(options['save_to_db']))
         
-        return csv_data
+        # keep the report the run produced, so the task result only carries its key (see tasks.run_daily_job_task)
+        with span('report_cache.put_job'):
+            self.report_key = report_cache.job_key()
+            report_cache.put(self.report_key, report_df)
+
+        return f'{file_name}: {len(report_df)} rows'
+
+    def handle_range(self, options, emails: EmailBatch) -> str:
+        '''
+        Backfill the reports for every day from --from to --to, writing one CSV per day
+        '''
+        if not options['range_from'] or not options['range_to']:
+            raise CommandError('Both --from and --to are required to backfill a range of dates')
+        if options['from_date'] or options['test'] or options['send_to_ftp'] or options['incremental']:
+            raise CommandError('--from/--to cannot be combined with a single date, --test, --send-to-ftp or --incremental')
 
-def test_mode(csv_data: str, file_name: str, date: datetime.date, send_email: bool = False) -> None:
+        try:
+            from_date = datetime.datetime.strptime(options['range_from'], '%Y-%m-%d').date()
+            to_date = datetime.datetime.strptime(options['range_to'], '%Y-%m-%d').date()
+            backfill = Backfill(MyGeotabAPI(), from_date, to_date, options['output_dir'], workers=options['workers'],
+                                remove_unchanged=options['remove_unchanged'], save_to_db=options['save_to_db'], stream=options['stream'],
+                                sharded=options['sharded'])
+        except ValueError as e:
+            raise CommandError(f'Invalid backfill range: {e}')
+
+        results = backfill.run()
+        if backfill.api.device_cache:
+            logger.info(f'Device cache: {backfill.api.device_cache.stats()}')
+
+        summary_lines = [f'{result.date}: {result.status}' + (f' ({result.rows} rows, {result.anomalies} odometer anomalies)' if result.status == COMPLETED else '') + (f' - {result.error}' if result.error else '')
+                         for result in results]
+        num_done = sum(result.status in (COMPLETED, SKIPPED) for result in results)
+        summary_lines.append(f'{sum(result.anomalies for result in results)} odometer anomalies in the days generated')
+        summary_lines.append(f'{num_done}/{len(results)} days complete in {options["output_dir"]}')
+        if options['combined']:
+            summary_lines.append(f'Combined report: {backfill.write_combined()}')
+        summary = '\n'.join(summary_lines)
+        logger.info(f'Backfill finished for {from_date} to {to_date}.\n{summary}')
+
+        if options['send_email']:
+            subject = f"IFTA Backfill {'Success' if num_done == len(results) else 'Incomplete'} --- {from_date} to {to_date}"
+            emails.send(EmailService(subject, f'IFTA backfill results:\n\n{summary}'))
+
+        return summary
+
+def test_mode(csv_data: str, file_name: str, date: datetime.date, send_email: bool = False, emails: EmailBatch = None) -> None:
     '''
     Run the command in test mode
     '''
@@ -114,19 +297,22 @@ def test_mode(csv_data: str, file_name: str, date: datetime.date, send_email: bo
         subject = "IFTA Report Test"
         body = f"This is a test email. Please ignore. Attached is the IFTA report for date: {date.month}/{date.day}/{date.year}"
         email_service = EmailService(subject, body, date=date, attachment=csv_data, attachment_name=file_name)
-        email_service.send()
+        if emails:
+            emails.send(email_service)
+        else:
+            email_service.send()
 
     return
 
-def send_to_sftp(full_csv_data: str, file_name: str, date: datetime.date) -> bool:
+def send_to_sftp(df: pd.DataFrame, file_name: str, date: datetime.date, emails: EmailBatch = None) -> bool:
     '''
-    Send the CSV to the SFTP server
+    Stream the dataframe to the SFTP server as CSV
 
     Returns True if the CSV was sent successfully, False otherwise
     '''
-    sftp = GeotabSFTP()
     try:
-        sftp.send_to_sftp(full_csv_data, file_name)
+        sftp = GeotabSFTP()
+        sftp.send_dataframe_to_sftp(df, file_name)
     except Exception as e:
         # If SFTP job fails, send an email to the recipients and return
         logger.error(f'Failed to send {file_name} to SFTP server.\n\t{e}')
@@ -138,25 +324,39 @@ def send_to_sftp(full_csv_data: str, file_name: str, date: datetime.date) -> boo
                 '''
 
         email_service = EmailService(subject, body)
-        email_service.send()
+        if emails:
+            emails.send(email_service)
+        else:
+            email_service.send()
         return False
 
     logger.info(f'Successfully sent {file_name} to SFTP server🔥')
     return True
 
-def send_success_email(full_csv_data: str, file_name: str, sent_to_ftp: bool, date: datetime.date, total_vehhicles: int, num_nonmoving_vehicles: int) -> bool:
+def send_success_email(full_csv_data: str, file_name: str, sent_to_ftp: bool, date: datetime.date, total_vehhicles: int, num_nonmoving_vehicles: int, emails: EmailBatch = None, anomalies: pd.DataFrame = None, changes: Dict[str, int] = None) -> bool:
     '''
     Send an email to the recipients to notify them of a successful CSV generation
+    anomalies: the odometer anomalies of the report (see IftaReport), counted in the statistics and listed after them
+    changes: the number of VIN-days of each kind of change of an incremental run (see services.fingerprints.count_changes)
     
     Returns True if the email was sent successfully, False otherwise
     '''
+    anomaly_statistics = ''
+    anomaly_details = ''
+    change_statistics = ''
+    if changes is not None:
+        change_statistics = ''.join(f'\n\tVIN-days {change}: {count}' for change, count in changes.items())
+    if anomalies is not None:
+        anomaly_statistics = ''.join(f'\n\tOdometer anomalies ({anomaly_type}): {count}' for anomaly_type, count in count_anomalies(anomalies).items())
+        if len(anomalies):
+            anomaly_details = '\n\nOdometer anomalies:' + ''.join(f'\n\t{line}' for line in describe_anomalies(anomalies))
     subject = f"IFTA Report Success {file_name} --- {date.month}/{date.day}/{date.year}"
     if not sent_to_ftp:
         body = f'''IFTA report for {date.month}/{date.day}/{date.year} sucessfully generated.
                 \n\nPlease see the attached file for the report.
                 \n\nReport statistics:
                 \n\tTotal vehicles: {total_vehhicles}
-                \n\tNumber of non-moving vehicles: {num_nonmoving_vehicles}
+                \n\tNumber of non-moving vehicles: {num_nonmoving_vehicles}{change_statistics}{anomaly_statistics}{anomaly_details}
                 \n\nThank you,
                 \nTrivista IFTA Compliance Team
                 '''
@@ -165,10 +365,10 @@ def send_success_email(full_csv_data: str, file_name: str, sent_to_ftp: bool, da
                 \n\nPlease see the attached file for the report sent to the Idealease FTP server.
                 \n\nReport statistics:
                 \n\tTotal vehicles: {total_vehhicles}
-                \n\tNumber of non-moving vehicles: {num_nonmoving_vehicles}
+                \n\tNumber of non-moving vehicles: {num_nonmoving_vehicles}{change_statistics}{anomaly_statistics}{anomaly_details}
                 \n\nThank you,
                 \nTrivista IFTA Compliance Team
                 '''
 
     email_service = EmailService(subject, body, date=date, attachment=full_csv_data, attachment_name=file_name)
-    return email_service.send()
\ No newline at end of file
+    return emails.send(email_service) if emails else email_service.send()
\ No newline at end of file
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from daily_compliance_job.models import FeedVersion, IftaEntry
+from daily_compliance_job.services.detail_buffer import FuelTaxDetailBuffer
+from daily_compliance_job.services.geotab import MyGeotabAPI
+from daily_compliance_job.services.ifta import FuelTaxProcessor
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEED_NAME = 'FuelTaxDetail'
+
+class Command(BaseCommand):
+    help = 'Save FuelTaxDetail records added or changed since the last sync to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            default=None,
+            type=str,
+            help='Date to start from when there is no saved feed version (format YYYY-MM-DD, defaults to 7 days ago)',)
+        parser.add_argument(
+            '--results-limit',
+            default=None,
+            type=int,
+            help='Maximum number of records fetched per feed call',)
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Ignore the saved feed version and start again from --since',)
+
+    def handle(self, *args, **options) -> str:
+        try:
+            since = datetime.datetime.strptime(options['since'], '%Y-%m-%d') if options['since'] else datetime.datetime.now() - datetime.timedelta(days=7)
+        except ValueError as e:
+            raise CommandError(f'Invalid date format in command: {e}')
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        from_version = None if options['reset'] else FeedVersion.get_version(FEED_NAME)
+        logger.info(f'Syncing {FEED_NAME} feed from version {from_version or "start"} (since {since.date()})')
+
+        my_geotab_api = MyGeotabAPI()
+        device_to_vin = my_geotab_api.get_device_to_vin(since, datetime.datetime.now())
+
+        num_details = num_saved = 0
+        for details, to_version in my_geotab_api.iter_fuel_tax_details(since, from_version=from_version, results_limit=options['results_limit']):
+            detail_map = FuelTaxDetailBuffer()
+            detail_map.add_details(details, device_to_vin)
+            # a batch holds arbitrary slices of each device's day, so only Geotab's own midnight exits close a day
+            df = my_geotab_api.to_dataframe(detail_map, close_last_detail=False)
+            if len(detail_map):
+                num_saved += IftaEntry.save_all_entries(entries=FuelTaxProcessor.to_ifta_dataframe(df))
+
+            # only move the version forward once the batch is saved, so a failed run picks up where it stopped
+            FeedVersion.set_version(FEED_NAME, to_version)
+            num_details += len(details)
+
+        summary = f'Synced {num_details} fuel tax details, saved {num_saved} entries.'
+        logger.info(summary)
+        return summary
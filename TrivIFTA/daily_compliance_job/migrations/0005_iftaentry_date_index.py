@@ -0,0 +1,19 @@
+# Generated by Django 4.2.8 on 2026-10-17 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("daily_compliance_job", "0004_feedversion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="iftaentry",
+            index=models.Index(
+                fields=["reading_date", "vin", "reading_time"],
+                name="iftaentry_date_vin_time_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.8 on 2026-10-17 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("daily_compliance_job", "0005_iftaentry_date_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("command", models.CharField(max_length=255)),
+                ("options", models.JSONField(blank=True, default=dict)),
+                ("report_date", models.DateField(blank=True, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                        ],
+                        default="running",
+                        max_length=16,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("wall_seconds", models.FloatField(blank=True, null=True)),
+                ("cpu_seconds", models.FloatField(blank=True, null=True)),
+                ("peak_rss_mb", models.FloatField(blank=True, null=True)),
+                ("stages", models.JSONField(blank=True, default=list)),
+                ("error", models.TextField(blank=True)),
+                ("profile_path", models.CharField(blank=True, max_length=1024)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+    ]
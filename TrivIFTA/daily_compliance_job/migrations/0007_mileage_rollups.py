@@ -0,0 +1,55 @@
+# Generated by Django 4.2.8 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("daily_compliance_job", "0006_jobrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuarterlyMileage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.IntegerField()),
+                ("quarter", models.IntegerField()),
+                ("jurisdiction", models.CharField(max_length=2)),
+                ("miles", models.BigIntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("year", "quarter", "jurisdiction")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyMileage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("vin", models.CharField(max_length=17)),
+                ("jurisdiction", models.CharField(max_length=2)),
+                ("miles", models.IntegerField()),
+            ],
+            options={
+                "unique_together": {("date", "vin", "jurisdiction")},
+            },
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 4.2.8 on 2026-10-17 20:05
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+
+# the helpers below are copied from services.partitions as they were when this migration was written,
+# so later changes to that module or to IftaEntry do not change what the migration does
+TABLE = "daily_compliance_job_iftaentry"
+PARTITIONED_TABLE = f"{TABLE}_partitioned"
+UNPARTITIONED_TABLE = f"{TABLE}_unpartitioned"
+SEQUENCE = f"{TABLE}_id_seq"
+UNIQUE_CONSTRAINT = "iftaentry_vin_date_time_uniq"
+COLUMNS = "id, vin, reading_date, reading_time, odometer, jurisdiction"
+COLUMN_DEFINITIONS = """
+    id bigserial,
+    vin varchar(17) NOT NULL,
+    reading_date date NOT NULL,
+    reading_time time NOT NULL,
+    odometer integer NOT NULL,
+    jurisdiction varchar(2) NOT NULL
+"""
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def add_months(month, months):
+    month_index = month.year * 12 + month.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_partitions(cursor, table, from_month, to_month):
+    """
+    Creates the partitions of table for every month from from_month to to_month (inclusive),
+        named after the IftaEntry table so they keep their names once table is renamed to it
+    """
+    month = from_month
+    while month <= to_month:
+        next_month = add_months(month, 1)
+        cursor.execute(
+            f"CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        )
+        month = next_month
+
+
+def get_month_range(cursor):
+    cursor.execute(f"SELECT MIN(reading_date), MAX(reading_date) FROM {TABLE}")
+    first_date, last_date = cursor.fetchone()
+    this_month = month_start(datetime.date.today())
+    from_month = month_start(first_date) if first_date else this_month
+    to_month = max(month_start(last_date) if last_date else this_month, add_months(this_month, settings.IFTA_PARTITION_MONTHS_AHEAD))
+    return from_month, to_month
+
+
+def swap_table(cursor, new_table):
+    """
+    Copies the entries into new_table, replaces the IftaEntry table with it and recreates the
+        keys and indexes, which are added after the copy so it does not maintain them row by row
+    """
+    cursor.execute(f"INSERT INTO {new_table} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}")
+    cursor.execute(f"DROP TABLE {TABLE}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {TABLE}")
+    cursor.execute(f"ALTER SEQUENCE {new_table}_id_seq RENAME TO {SEQUENCE}")
+    # a partitioned table's keys must include the partition key, so the primary key is (id, reading_date)
+    primary_key = "id, reading_date" if new_table == PARTITIONED_TABLE else "id"
+    cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})")
+    cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {UNIQUE_CONSTRAINT} UNIQUE (vin, reading_date, reading_time)")
+    cursor.execute(f"CREATE INDEX iftaentry_date_vin_time_idx ON {TABLE} (reading_date, vin, reading_time)")
+    cursor.execute(f"SELECT setval('{SEQUENCE}', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+
+
+def partition_iftaentry(apps, schema_editor):
+    """
+    Replaces the IftaEntry table with one range partitioned by month of reading_date,
+        with a partition for every month from the first entry to IFTA_PARTITION_MONTHS_AHEAD months ahead
+    Only Postgres supports partitioning, other databases keep the plain table
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        from_month, to_month = get_month_range(cursor)
+        cursor.execute(f"CREATE TABLE {PARTITIONED_TABLE} ({COLUMN_DEFINITIONS}) PARTITION BY RANGE (reading_date)")
+        create_partitions(cursor, PARTITIONED_TABLE, from_month, to_month)
+        swap_table(cursor, PARTITIONED_TABLE)
+
+
+def unpartition_iftaentry(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {UNPARTITIONED_TABLE} ({COLUMN_DEFINITIONS})")
+        swap_table(cursor, UNPARTITIONED_TABLE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("daily_compliance_job", "0007_mileage_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMonth",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(unique=True)),
+                ("path", models.CharField(max_length=1024)),
+                ("rows", models.IntegerField()),
+                ("archived_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["month"],
+            },
+        ),
+        migrations.RunPython(partition_iftaentry, unpartition_iftaentry),
+    ]
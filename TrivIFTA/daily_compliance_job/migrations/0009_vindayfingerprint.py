@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-17 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("daily_compliance_job", "0008_partition_iftaentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VinDayFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("vin", models.CharField(max_length=17)),
+                ("fingerprint", models.CharField(max_length=32)),
+                ("rows", models.IntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("date", "vin")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daily_compliance_job', '0009_vindayfingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='jobrun',
+            name='peak_rss_mb',
+            field=models.FloatField(blank=True, null=True, verbose_name='process peak RSS (MB)'),
+        ),
+    ]
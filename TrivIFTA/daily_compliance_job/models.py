@@ -1,9 +1,19 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, DatabaseError
 from .utils import encrypt_data, decrypt_data
+from .services.entry_cache import EntryCache
+from .services.mileage import get_mileage, get_quarter, lock_quarter, quarter_dates, to_date_ranges
+from .services.partitions import prepare_months
 from django.core.exceptions import ValidationError
-from pandas import DataFrame
+from pandas import DataFrame, to_datetime
+from typing import Iterable, List
+import logging
+import math
+
+logger = logging.getLogger(__name__)
 
 MAX_EMAIL_SENDERS = 1
+IFTA_ENTRY_KEY = ['VIN', 'ReadingDate', 'ReadingTime']
 
 class EmailRecipient(models.Model):
     email = models.EmailField(max_length=254, unique=True)
@@ -41,28 +51,318 @@ class IftaEntry(models.Model):
     jurisdiction = models.CharField(max_length=2)
 
     class Meta:
+        # on Postgres the table is range partitioned by month of reading_date (migration 0008, services.partitions),
+            # which every unique key has to include
         unique_together = (('vin', 'reading_date', 'reading_time'),)
+        indexes = [
+            # the unique index leads with vin, so filtering by date alone needs its own index
+            models.Index(fields=['reading_date', 'vin', 'reading_time'], name='iftaentry_date_vin_time_idx'),
+        ]
 
     @staticmethod
-    def save_all_entries(entries: DataFrame) -> None:
+    def save_all_entries(entries: DataFrame, batch_size: int = None, refresh_quarters: bool = True) -> int:
         """
-        Save all entries in the dataframe to the database
+        Save all entries in the dataframe to the database,
+            upserting batch_size rows at a time in one transaction per batch
+        The mileage rollups of the saved dates are refreshed and their cached /api/ responses invalidated
+        refresh_quarters: also refresh the QuarterlyMileage totals of the dates; callers saving many days at once
+            pass False and refresh the quarters once at the end
+        Raises ArchivedMonthException if a date falls in an archived month
+        Returns the number of entries saved
         """
-        for _, row in entries.iterrows():
-            try:
-                # Create or update an IftaEntry object from the row
-                IftaEntry.objects.update_or_create(
-                    vin=row['VIN'],
-                    reading_date=row['ReadingDate'],
-                    reading_time=row['ReadingTime'],
-                    defaults={
-                        'odometer': row['Odometer'],
-                        'jurisdiction': row['Jurisdiction']
-                    }
+        batch_size = batch_size or settings.IFTA_ENTRY_BATCH_SIZE
+        # Later readings win, as they would with one update_or_create per row
+        entries = entries.drop_duplicates(subset=IFTA_ENTRY_KEY, keep='last')
+        dates = to_datetime(entries['ReadingDate'].dropna().unique()).date
+        prepare_months(dates)
+
+        rows = entries[IFTA_ENTRY_KEY + ['Odometer', 'Jurisdiction']].itertuples(index=False, name=None)
+        batch = []
+        num_saved = 0
+        for row in rows:
+            entry = IftaEntry.from_row(row)
+            if entry is not None:
+                batch.append(entry)
+            if len(batch) >= batch_size:
+                num_saved += IftaEntry.save_batch(batch)
+                batch = []
+        if batch:
+            num_saved += IftaEntry.save_batch(batch)
+
+        DailyMileage.refresh(dates, refresh_quarters=refresh_quarters)
+        EntryCache().invalidate(dates)
+        return num_saved
+
+    @staticmethod
+    def delete_vin_days(vin_days: DataFrame) -> int:
+        """
+        Delete the entries of the VIN-days (VIN and ReadingDate columns) in the dataframe, in one transaction
+        The mileage rollups of the dates that lost entries are refreshed, and their cached /api/ responses invalidated once the deletion commits
+        Returns the number of entries deleted
+        """
+        dates = set()
+        num_deleted = 0
+        with transaction.atomic():
+            for date, vins in vin_days.groupby('ReadingDate')['VIN']:
+                num_deleted_of_date, _ = IftaEntry.objects.filter(reading_date=date, vin__in=list(vins)).delete()
+                if num_deleted_of_date:
+                    dates.add(date)
+                    num_deleted += num_deleted_of_date
+            DailyMileage.refresh(dates)
+            transaction.on_commit(lambda: EntryCache().invalidate(dates))
+        return num_deleted
+
+    @staticmethod
+    def from_row(row: tuple) -> 'IftaEntry':
+        """
+        Create an unsaved IftaEntry from a (VIN, ReadingDate, ReadingTime, Odometer, Jurisdiction) row
+        Returns None and logs the error if the row cannot be saved
+        """
+        vin, reading_date, reading_time, odometer, jurisdiction = row
+        if odometer is None or (isinstance(odometer, float) and math.isnan(odometer)):
+            logger.error(f"Error creating entry from row {row}: missing odometer reading")
+            return None
+        if len(str(vin)) > 17 or not isinstance(jurisdiction, str) or len(jurisdiction) > 2:
+            logger.error(f"Error creating entry from row {row}: invalid VIN or jurisdiction")
+            return None
+        return IftaEntry(vin=vin, reading_date=reading_date, reading_time=reading_time, odometer=int(odometer), jurisdiction=jurisdiction)
+
+    @staticmethod
+    def save_batch(batch: List['IftaEntry']) -> int:
+        """
+        Upsert a batch of entries in a single transaction
+        If the batch is rejected, fall back to saving row by row so only the failing rows are skipped
+        Returns the number of entries saved
+        """
+        try:
+            with transaction.atomic():
+                IftaEntry.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['vin', 'reading_date', 'reading_time'],
+                    update_fields=['odometer', 'jurisdiction'],
                 )
-            except Exception as e:
+            return len(batch)
+        except DatabaseError as e:
+            logger.warning(f"Batch of {len(batch)} entries failed, retrying row by row: {e}")
+
+        num_saved = 0
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    IftaEntry.objects.update_or_create(
+                        vin=entry.vin,
+                        reading_date=entry.reading_date,
+                        reading_time=entry.reading_time,
+                        defaults={
+                            'odometer': entry.odometer,
+                            'jurisdiction': entry.jurisdiction
+                        }
+                    )
+                num_saved += 1
+            except DatabaseError as e:
                 # Log the error and continue with the next row
-                print(f"Error creating or updating entry from row {row}: {e}")
-    
+                logger.error(f"Error creating or updating entry {entry}: {e}")
+        return num_saved
+
     def __str__(self) -> str:
         return f"{self.vin} {self.reading_date} {self.reading_time} {self.odometer} {self.jurisdiction}"
+
+class ArchivedMonth(models.Model):
+    """
+    Month of IftaEntry rows moved out of the database to a compressed Parquet file (see services.partitions)
+    """
+    month = models.DateField(unique=True) # first day of the month
+    path = models.CharField(max_length=1024)
+    rows = models.IntegerField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['month']
+
+    def __str__(self) -> str:
+        return f"{self.month:%Y-%m} {self.rows} rows {self.path}"
+
+class DailyMileage(models.Model):
+    """
+    Miles driven per VIN per jurisdiction per day, rolled up from IftaEntry (see services.mileage.get_mileage)
+    IftaEntry.save_all_entries refreshes the days it writes; rebuild older days with manage.py rebuild_mileage_rollups
+    """
+    date = models.DateField()
+    vin = models.CharField(max_length=17)
+    jurisdiction = models.CharField(max_length=2)
+    miles = models.IntegerField()
+
+    class Meta:
+        unique_together = (('date', 'vin', 'jurisdiction'),)
+
+    @staticmethod
+    def refresh(dates: Iterable, batch_size: int = None, refresh_quarters: bool = True) -> int:
+        """
+        Recompute the rollups of the given dates from their entries, then (if refresh_quarters) the QuarterlyMileage totals of their quarters
+        The miles of a day only depend on the entries of that day, so no other day is read
+        Returns the number of rollup rows written
+        """
+        batch_size = batch_size or settings.IFTA_ENTRY_BATCH_SIZE
+        dates = set(dates)
+        num_saved = 0
+        for from_date, to_date in to_date_ranges(dates):
+            mileage = get_mileage(from_date, to_date, by_date=True)
+            rollups = [DailyMileage(date=date, vin=vin, jurisdiction=jurisdiction, miles=miles)
+                       for date, vin, jurisdiction, miles in mileage.itertuples(index=False, name=None)]
+            with transaction.atomic():
+                DailyMileage.objects.filter(date__gte=from_date, date__lte=to_date).delete()
+                DailyMileage.objects.bulk_create(rollups, batch_size=batch_size)
+            num_saved += len(rollups)
+
+        if refresh_quarters:
+            QuarterlyMileage.refresh({get_quarter(date) for date in dates})
+        return num_saved
+
+    def __str__(self) -> str:
+        return f"{self.date} {self.vin} {self.jurisdiction} {self.miles}"
+
+class QuarterlyMileage(models.Model):
+    """
+    Fleet miles per jurisdiction per IFTA quarter, summed from DailyMileage whenever a day of the quarter is refreshed
+    """
+    year = models.IntegerField()
+    quarter = models.IntegerField()
+    jurisdiction = models.CharField(max_length=2)
+    miles = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('year', 'quarter', 'jurisdiction'),)
+
+    @staticmethod
+    def refresh(quarters: Iterable) -> None:
+        """
+        Recompute the totals of the given (year, quarter) pairs from DailyMileage
+        Each quarter is upserted under its lock (see services.mileage.lock_quarter), so jobs refreshing the same quarter
+            at the same time wait for each other instead of failing on the unique key
+        """
+        for year, quarter in sorted(set(quarters)):
+            from_date, to_date = quarter_dates(year, quarter)
+            with transaction.atomic():
+                lock_quarter(year, quarter)
+                totals = list(DailyMileage.objects.filter(date__gte=from_date, date__lte=to_date)
+                              .values_list('jurisdiction').annotate(total=models.Sum('miles')).order_by('jurisdiction'))
+                QuarterlyMileage.objects.bulk_create(
+                    [QuarterlyMileage(year=year, quarter=quarter, jurisdiction=jurisdiction, miles=miles) for jurisdiction, miles in totals],
+                    update_conflicts=True,
+                    unique_fields=['year', 'quarter', 'jurisdiction'],
+                    update_fields=['miles', 'updated_at'],
+                )
+                QuarterlyMileage.objects.filter(year=year, quarter=quarter).exclude(jurisdiction__in=[jurisdiction for jurisdiction, _ in totals]).delete()
+
+    def __str__(self) -> str:
+        return f"{self.year}-Q{self.quarter} {self.jurisdiction} {self.miles}"
+
+class VinDayFingerprint(models.Model):
+    """
+    Fingerprint of the readings of one VIN on one day, as last sent by an incremental run of the daily job
+        (see services.fingerprints), so a re-run only re-sends the VIN-days Geotab changed since
+    """
+    date = models.DateField()
+    vin = models.CharField(max_length=17)
+    fingerprint = models.CharField(max_length=32)
+    rows = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('date', 'vin'),)
+
+    @staticmethod
+    def save_delta(delta: DataFrame, batch_size: int = None, delete_entries: bool = False) -> int:
+        """
+        Store the fingerprints of the added and changed VIN-days of a delta (see services.fingerprints.diff_fingerprints)
+            and forget the removed ones, in one transaction
+        VINs too long to store are skipped, as they are not saved to IftaEntry either
+        delete_entries: also delete the IftaEntry rows of the removed VIN-days (see IftaEntry.delete_vin_days),
+            for runs that save their entries to the database
+        Returns the number of fingerprints written
+        """
+        from .services.fingerprints import ADDED, CHANGED, REMOVED
+
+        batch_size = batch_size or settings.IFTA_ENTRY_BATCH_SIZE
+        changed = delta[delta['Change'].isin([ADDED, CHANGED]) & (delta['VIN'].str.len() <= 17)]
+        removed = delta[delta['Change'] == REMOVED]
+        fingerprints = [VinDayFingerprint(date=date, vin=vin, fingerprint=fingerprint, rows=rows)
+                        for vin, date, fingerprint, rows in changed[['VIN', 'ReadingDate', 'Fingerprint', 'Rows']].itertuples(index=False, name=None)]
+        with transaction.atomic():
+            VinDayFingerprint.objects.bulk_create(
+                fingerprints,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['date', 'vin'],
+                update_fields=['fingerprint', 'rows', 'updated_at'],
+            )
+            for date, vins in removed.groupby('ReadingDate')['VIN']:
+                VinDayFingerprint.objects.filter(date=date, vin__in=list(vins)).delete()
+            if delete_entries and len(removed):
+                num_deleted = IftaEntry.delete_vin_days(removed)
+                logger.info(f'Deleted {num_deleted} entries of {len(removed)} VIN-days Geotab no longer returns')
+        return len(fingerprints)
+
+    def __str__(self) -> str:
+        return f"{self.date} {self.vin} {self.fingerprint} {self.rows} rows"
+
+class FeedVersion(models.Model):
+    """
+    Last version read from a Geotab data feed, so the next read only fetches newer records
+    """
+    name = models.CharField(max_length=255, unique=True)
+    version = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def get_version(name: str) -> str:
+        feed_version = FeedVersion.objects.filter(name=name).first()
+        return feed_version.version if feed_version else None
+
+    @staticmethod
+    def set_version(name: str, version: str) -> None:
+        FeedVersion.objects.update_or_create(name=name, defaults={'version': version})
+
+    def __str__(self) -> str:
+        return f"{self.name} {self.version}"
+
+class JobRun(models.Model):
+    """
+    Timings of one run of a management command, one span per stage (see services.instrumentation)
+    """
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    command = models.CharField(max_length=255)
+    options = models.JSONField(default=dict, blank=True)
+    report_date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=RUNNING)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wall_seconds = models.FloatField(null=True, blank=True)
+    cpu_seconds = models.FloatField(null=True, blank=True)
+    # the highest RSS of the process since it started, not of this run: a long-lived worker reports its all-time peak
+    peak_rss_mb = models.FloatField('process peak RSS (MB)', null=True, blank=True)
+    # [{'stage', 'parent', 'rows', 'wall_s', 'cpu_s', 'rss_mb', 'rss_delta_mb'}, ...] in the order the stages finished
+    stages = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    profile_path = models.CharField(max_length=1024, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def stage_seconds(self) -> dict:
+        """
+        Returns the wall time of each stage, summing stages that ran more than once
+        """
+        seconds = {}
+        for stage in self.stages:
+            seconds[stage['stage']] = seconds.get(stage['stage'], 0.0) + stage['wall_s']
+        return seconds
+
+    def __str__(self) -> str:
+        return f"{self.command} {self.started_at:%Y-%m-%d %H:%M:%S} {self.status}"
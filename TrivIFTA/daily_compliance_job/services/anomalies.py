@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Set
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from daily_compliance_job.services.ifta import END_OF_DAY, IFTA_COLUMNS, MISSING, to_epoch_day, to_second_of_day
+
+MISSING_ODOMETER = 'missing odometer'
+ROLLBACK = 'rollback'
+JUMP = 'jump'
+TELEPORT = 'teleport'
+ANOMALY_TYPES = [MISSING_ODOMETER, ROLLBACK, JUMP, TELEPORT]
+# each anomaly is reported on the later reading of the pair, with the reading before it and the miles and hours between them
+ANOMALY_COLUMNS = IFTA_COLUMNS + ['Anomaly', 'PreviousOdometer', 'PreviousJurisdiction', 'Miles', 'Hours']
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# land borders between IFTA jurisdictions (and DC), listed once per pair
+_BORDERS = {
+    'AL': ['FL', 'GA', 'MS', 'TN'],
+    'AR': ['LA', 'MO', 'MS', 'OK', 'TN', 'TX'],
+    'AZ': ['CA', 'CO', 'NM', 'NV', 'UT'],
+    'CA': ['NV', 'OR'],
+    'CO': ['KS', 'NE', 'NM', 'OK', 'UT', 'WY'],
+    'CT': ['MA', 'NY', 'RI'],
+    'DC': ['MD', 'VA'],
+    'DE': ['MD', 'NJ', 'PA'],
+    'FL': ['GA'],
+    'GA': ['NC', 'SC', 'TN'],
+    'IA': ['IL', 'MN', 'MO', 'NE', 'SD', 'WI'],
+    'ID': ['MT', 'NV', 'OR', 'UT', 'WA', 'WY', 'BC'],
+    'IL': ['IN', 'KY', 'MO', 'WI'],
+    'IN': ['KY', 'MI', 'OH'],
+    'KS': ['MO', 'NE', 'OK'],
+    'KY': ['MO', 'OH', 'TN', 'VA', 'WV'],
+    'LA': ['MS', 'TX'],
+    'MA': ['NH', 'NY', 'RI', 'VT'],
+    'MD': ['PA', 'VA', 'WV'],
+    'ME': ['NH', 'NB', 'QC'],
+    'MI': ['OH', 'WI', 'ON'],
+    'MN': ['ND', 'SD', 'WI', 'MB', 'ON'],
+    'MO': ['NE', 'OK', 'TN'],
+    'MS': ['TN'],
+    'MT': ['ND', 'SD', 'WY', 'AB', 'BC', 'SK'],
+    'NC': ['SC', 'TN', 'VA'],
+    'ND': ['SD', 'MB', 'SK'],
+    'NE': ['SD', 'WY'],
+    'NH': ['VT', 'QC'],
+    'NJ': ['NY', 'PA'],
+    'NM': ['OK', 'TX', 'UT'],
+    'NV': ['OR', 'UT'],
+    'NY': ['PA', 'VT', 'ON', 'QC'],
+    'OH': ['PA', 'WV'],
+    'OK': ['TX'],
+    'OR': ['WA'],
+    'PA': ['WV'],
+    'SD': ['WY'],
+    'TN': ['VA'],
+    'UT': ['WY'],
+    'VA': ['WV'],
+    'VT': ['QC'],
+    'WA': ['BC'],
+    'AB': ['BC', 'SK'],
+    'MB': ['ON', 'SK'],
+    'NB': ['NS', 'PE', 'QC'],
+    'NL': ['NS', 'QC'],  # NS by ferry
+    'NS': ['PE'],  # by ferry
+    'ON': ['QC'],
+}
+
+def to_neighbours(borders: Dict[str, List[str]]) -> Dict[str, Set[str]]:
+    neighbours = {}
+    for jurisdiction, bordering in borders.items():
+        for neighbour in bordering:
+            neighbours.setdefault(jurisdiction, set()).add(neighbour)
+            neighbours.setdefault(neighbour, set()).add(jurisdiction)
+    return neighbours
+
+JURISDICTION_BORDERS = to_neighbours(_BORDERS)
+
+def to_timestamps(df: pd.DataFrame) -> np.ndarray:
+    '''
+    Seconds since the epoch of each reading of an IFTA frame, NaN when its date or time is missing
+    The 23:59 reading that closes a day holds the midnight odometer, so it is timed at the end of the day
+    '''
+    # convert each distinct date and time once, shared by every row that has it; -1 (missing) picks the trailing MISSING
+    date_indexes, dates = pd.factorize(df['ReadingDate'])
+    time_indexes, times = pd.factorize(df['ReadingTime'])
+    days = np.array([to_epoch_day(value) for value in dates] + [MISSING], dtype=np.float64)[date_indexes]
+    seconds = np.array([SECONDS_PER_DAY if value == END_OF_DAY else to_second_of_day(value) for value in times] + [MISSING], dtype=np.float64)[time_indexes]
+    timestamps = days * SECONDS_PER_DAY + seconds
+    timestamps[(days == MISSING) | (seconds == MISSING)] = np.nan
+    return timestamps
+
+def get_adjacency(jurisdictions: pd.Index) -> np.ndarray:
+    '''
+    Square matrix telling whether a vehicle can go straight from one jurisdiction to another, indexed by the
+        jurisdiction codes of pd.factorize, with a trailing row and column for missing jurisdictions
+    Jurisdictions missing from JURISDICTION_BORDERS can go anywhere, as there is nothing to check them against
+    '''
+    known = np.array([jurisdiction in JURISDICTION_BORDERS for jurisdiction in jurisdictions] + [False])
+    adjacency = np.array([[a == b or b in JURISDICTION_BORDERS.get(a, ()) for b in jurisdictions] + [True] for a in jurisdictions] + [[True] * (len(jurisdictions) + 1)])
+    return adjacency | ~known[:, None] | ~known[None, :]
+
+def find_anomalies(df: pd.DataFrame, max_mph: float = None, jump_slack_miles: float = None, rollback_tolerance_miles: float = None) -> pd.DataFrame:
+    '''
+    Flag the readings of a sorted IFTA frame (VIN, ReadingDate, ReadingTime) that would come up in an IFTA audit,
+        comparing each reading with the one before it for the same VIN, in a single vectorized pass:
+        missing odometer: the odometer could not be read or rounded
+        rollback: the odometer went down by more than rollback_tolerance_miles
+        jump: the odometer went up by more than max_mph allows in the time between the readings, plus jump_slack_miles
+        teleport: the vehicle went straight between two jurisdictions that do not share a border
+    The thresholds default to ODOMETER_MAX_MPH, ODOMETER_JUMP_SLACK_MILES and ODOMETER_ROLLBACK_TOLERANCE_MILES
+
+    Returns a frame with ANOMALY_COLUMNS, one row per anomaly in the order of the readings
+    '''
+    max_mph = max_mph if max_mph is not None else settings.ODOMETER_MAX_MPH
+    jump_slack_miles = jump_slack_miles if jump_slack_miles is not None else settings.ODOMETER_JUMP_SLACK_MILES
+    rollback_tolerance_miles = rollback_tolerance_miles if rollback_tolerance_miles is not None else settings.ODOMETER_ROLLBACK_TOLERANCE_MILES
+
+    vins = df['VIN'].to_numpy(dtype=object)
+    odometers = df['Odometer'].to_numpy(dtype=np.float64)
+    timestamps = to_timestamps(df)
+    jurisdiction_indexes, jurisdictions = pd.factorize(df['Jurisdiction'])
+
+    # pairs of consecutive readings of the same VIN, paired on the later one
+    same_vin = np.zeros(len(df), dtype=bool)
+    same_vin[1:] = vins[1:] == vins[:-1]
+    previous_odometers = np.full(len(df), np.nan)
+    previous_odometers[1:] = odometers[:-1]
+    previous_odometers[~same_vin] = np.nan
+    miles = odometers - previous_odometers
+    hours = np.full(len(df), np.nan)
+    hours[1:] = (timestamps[1:] - timestamps[:-1]) / 3600
+    hours[~same_vin] = np.nan
+
+    # comparisons with NaN are False, so pairs with a missing odometer or time are only flagged as missing
+    missing = np.isnan(odometers)
+    with np.errstate(invalid='ignore'):
+        rollback = miles < -rollback_tolerance_miles
+        jump = miles > jump_slack_miles + max_mph * np.maximum(hours, 0)
+    teleport = np.zeros(len(df), dtype=bool)
+    teleport[1:] = ~get_adjacency(jurisdictions)[jurisdiction_indexes[:-1], jurisdiction_indexes[1:]]
+    teleport &= same_vin
+
+    masks = [missing, rollback, jump, teleport]
+    indexes = np.concatenate([np.flatnonzero(mask) for mask in masks])
+    types = np.repeat(np.array(ANOMALY_TYPES, dtype=object), [int(mask.sum()) for mask in masks])
+    order = np.argsort(indexes, kind='stable')
+    indexes, types = indexes[order], types[order]
+
+    previous_jurisdictions = np.empty(len(df), dtype=object)
+    previous_jurisdictions[1:] = df['Jurisdiction'].to_numpy(dtype=object)[:-1]
+    previous_jurisdictions[~same_vin] = None
+
+    anomalies = df[IFTA_COLUMNS].iloc[indexes].reset_index(drop=True)
+    anomalies['Anomaly'] = types
+    anomalies['PreviousOdometer'] = previous_odometers[indexes]
+    anomalies['PreviousJurisdiction'] = previous_jurisdictions[indexes]
+    anomalies['Miles'] = miles[indexes]
+    anomalies['Hours'] = np.round(hours[indexes], 2)
+    return anomalies
+
+def count_anomalies(anomalies: pd.DataFrame) -> Dict[str, int]:
+    '''
+    Number of anomalies of each type in ANOMALY_TYPES, including the types with none
+    '''
+    counts = anomalies['Anomaly'].value_counts()
+    return {anomaly_type: int(counts.get(anomaly_type, 0)) for anomaly_type in ANOMALY_TYPES}
+
+def describe_anomalies(anomalies: pd.DataFrame, limit: int = None) -> List[str]:
+    '''
+    One line per anomaly for the report email, the first ODOMETER_ANOMALY_EMAIL_LIMIT of them followed by how many were left out
+    '''
+    limit = limit if limit is not None else settings.ODOMETER_ANOMALY_EMAIL_LIMIT
+    lines = []
+    for row in anomalies.head(limit).itertuples(index=False):
+        reading = f'{row.VIN} {row.ReadingDate} {row.ReadingTime} {row.Jurisdiction}'
+        if row.Anomaly == MISSING_ODOMETER:
+            lines.append(f'{reading}: {row.Anomaly}')
+        elif row.Anomaly == TELEPORT:
+            lines.append(f'{reading}: {row.Anomaly} from {row.PreviousJurisdiction} in {row.Hours} hours')
+        else:
+            lines.append(f'{reading}: {row.Anomaly} of {row.Miles:+.0f} miles in {row.Hours} hours ({row.PreviousOdometer:.0f} to {row.Odometer:.0f})')
+    if len(anomalies) > limit:
+        lines.append(f'... and {len(anomalies) - limit} more')
+    return lines
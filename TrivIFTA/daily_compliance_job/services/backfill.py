@@ -0,0 +1,141 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple
+
+from django.db import connection
+
+from daily_compliance_job.models import IftaEntry, QuarterlyMileage
+from daily_compliance_job.services.anomalies import count_anomalies
+from daily_compliance_job.services.events import NoFuelTaxDataException
+from daily_compliance_job.services.geotab import MyGeotabAPI
+from daily_compliance_job.services.mileage import get_quarter
+from daily_compliance_job.utils import get_report_file_name
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = 'completed'
+SKIPPED = 'skipped'
+NO_DATA = 'no data'
+FAILED = 'failed'
+
+class DayResult(NamedTuple):
+    date: datetime.date
+    status: str
+    rows: int = 0
+    error: str = ''
+    anomalies: int = 0  # odometer anomalies in the day's report
+
+class Backfill:
+    """
+    Generates IFTA reports for every day in a date range, several days at a time
+
+    One authenticated API object and one device to VIN map are shared by all days.
+    Days whose CSV already exists in output_dir are skipped, so an interrupted run can be resumed.
+    """
+    def __init__(self, api: MyGeotabAPI, from_date: datetime.date, to_date: datetime.date, output_dir: str,
+                 workers: int = 4, remove_unchanged: bool = False, save_to_db: bool = False, stream: bool = False,
+                 sharded: bool = False) -> None:
+        if to_date < from_date:
+            raise ValueError(f'Backfill range ends before it starts: {from_date} to {to_date}')
+        if workers < 1:
+            raise ValueError(f'Backfill needs at least one worker, got {workers}')
+
+        self.api = api
+        self.from_date = from_date
+        self.to_date = to_date
+        self.output_dir = output_dir
+        self.workers = workers
+        self.remove_unchanged = remove_unchanged
+        self.save_to_db = save_to_db
+        self.stream = stream
+        self.sharded = sharded
+
+    def days(self) -> List[datetime.date]:
+        num_days = (self.to_date - self.from_date).days + 1
+        return [self.from_date + datetime.timedelta(days=offset) for offset in range(num_days)]
+
+    def file_path(self, date: datetime.date) -> str:
+        return os.path.join(self.output_dir, get_report_file_name(date))
+
+    def run(self) -> List[DayResult]:
+        """
+        Process every day in the range and return one result per day, in date order
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        pending = [day for day in self.days() if not os.path.exists(self.file_path(day))]
+        results = {day: DayResult(day, SKIPPED) for day in self.days() if day not in pending}
+
+        if pending:
+            # Fetch the device roster once for the whole range instead of once per day
+            range_start, range_end = to_datetime(pending[0]), to_datetime(pending[-1] + datetime.timedelta(days=1))
+            device_to_vin = self.api.get_device_to_vin(range_start, range_end)
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for result in executor.map(lambda day: self.run_day(day, device_to_vin), pending):
+                    results[result.date] = result
+
+            # days of the same quarter are saved concurrently, so their quarterly totals are refreshed once, after all of them
+            saved_days = [day for day in pending if results[day].status == COMPLETED]
+            if self.save_to_db and saved_days:
+                QuarterlyMileage.refresh({get_quarter(day) for day in saved_days})
+
+        return [results[day] for day in self.days()]
+
+    def run_day(self, date: datetime.date, device_to_vin: Dict[str, str]) -> DayResult:
+        """
+        Generate, write and optionally save the report for a single day
+        """
+        try:
+            ifta_data_collection = self.api.to_ifta_data_collection(to_datetime(date), to_datetime(date + datetime.timedelta(days=1)), device_to_vin=device_to_vin, stream=self.stream, sharded=self.sharded)
+            report = ifta_data_collection.to_report()
+            full_df = report.full
+            df = report.reduced if self.remove_unchanged else full_df
+
+            # Write to a temporary file first so a crash never leaves a partial report that would be skipped on resume
+            file_path = self.file_path(date)
+            df.to_csv(f'{file_path}.part', index=False)
+
+            # Note: the full dataframe is always saved to the database
+            if self.save_to_db:
+                IftaEntry.save_all_entries(entries=full_df, refresh_quarters=False)
+
+            os.replace(f'{file_path}.part', file_path)
+            logger.info(f'Backfill: generated {os.path.basename(file_path)} with {len(df)} rows')
+            if len(report.anomalies):
+                logger.warning(f'Backfill: odometer anomalies for {date}: {count_anomalies(report.anomalies)}')
+            return DayResult(date, COMPLETED, rows=len(df), anomalies=len(report.anomalies))
+        except NoFuelTaxDataException as e:
+            logger.warning(f'Backfill: no data for {date}: {e}')
+            return DayResult(date, NO_DATA, error=str(e))
+        except Exception as e:
+            logger.exception(f'Backfill: failed to generate report for {date}')
+            return DayResult(date, FAILED, error=str(e))
+        finally:
+            if os.path.exists(f'{self.file_path(date)}.part'):
+                os.remove(f'{self.file_path(date)}.part')
+            # each worker thread holds its own database connection
+            connection.close()
+
+    def write_combined(self) -> str:
+        """
+        Concatenate the per-day CSVs in the range into one file and return its path
+        """
+        combined_path = os.path.join(self.output_dir, f'Ohalloran_{self.from_date:%Y_%m_%d}_to_{self.to_date:%Y_%m_%d}.csv')
+        wrote_header = False
+        with open(combined_path, 'w', encoding='utf-8') as combined:
+            for day in self.days():
+                if not os.path.exists(self.file_path(day)):
+                    continue
+                with open(self.file_path(day), encoding='utf-8') as day_file:
+                    header = day_file.readline()
+                    if not wrote_header:
+                        combined.write(header)
+                        wrote_header = True
+                    combined.writelines(day_file)
+        return combined_path
+
+def to_datetime(date: datetime.date) -> datetime.datetime:
+    return datetime.datetime(date.year, date.month, date.day)
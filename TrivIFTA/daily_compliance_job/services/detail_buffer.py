@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import calendar
+import math
+from array import array
+from datetime import time
+from typing import Any, Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+KILO_TO_MILES = 0.62137119
+
+class FuelTaxDetailBuffer:
+    """
+    Columnar store for fuel tax details, keeping only the fields used to build the IFTA report
+
+    Each detail is projected into typed arrays as it is added, so the raw Geotab JSON
+        (boundaries, hourly data, nested device objects, ...) can be discarded right away.
+    Missing times and odometers are stored as NaN.
+
+    feed: the details are read from the FuelTaxDetail feed, which returns them in feed version order.
+        A detail Geotab revised comes again later with a higher version, replacing the one already added,
+        and each device's details are put in enter time order when the dataframe is created.
+    """
+    def __init__(self, feed: bool = False) -> None:
+        self.feed = feed
+        # detail id to its row and version, for replacing revised feed details
+        self.rows_by_id = {}
+
+        # device ids and VINs are stored once and referenced by code
+        self.device_codes = {}
+        self.device_ids = []
+        self.vins = []
+        self.jurisdiction_codes = {}
+        self.jurisdictions = []
+
+        self.device = array('i')
+        self.enter_time = array('d')    # epoch seconds, truncated to the second
+        self.exit_time = array('d')
+        self.enter_odometer = array('d')    # kilometers
+        self.exit_odometer = array('d')
+        self.jurisdiction = array('h')  # -1 if missing
+
+    def __len__(self) -> int:
+        return len(self.device)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self.device_codes
+
+    def add_details(self, fuel_tax_details: Iterable[Dict[str, Any]], device_to_vin: Dict[str, str]) -> None:
+        '''
+        Projects fuel tax details into the buffer, skipping devices that are not in the IFTA group
+        '''
+        for detail in fuel_tax_details:
+            device_id = detail['device']['id']
+            if device_id not in device_to_vin:
+                continue
+
+            device_code = self.device_codes.get(device_id, None)
+            if device_code is None:
+                device_code = self.device_codes[device_id] = len(self.device_ids)
+                self.device_ids.append(device_id)
+                self.vins.append(device_to_vin[device_id])
+
+            jurisdiction = detail.get('jurisdiction', None)
+            jurisdiction_code = -1
+            if jurisdiction is not None:
+                jurisdiction_code = self.jurisdiction_codes.get(jurisdiction, None)
+                if jurisdiction_code is None:
+                    jurisdiction_code = self.jurisdiction_codes[jurisdiction] = len(self.jurisdictions)
+                    self.jurisdictions.append(jurisdiction)
+
+            values = (
+                device_code,
+                to_epoch_seconds(detail.get('enterTime', None)),
+                to_epoch_seconds(detail.get('exitTime', None)),
+                detail.get('enterOdometer', None) or math.nan,
+                detail.get('exitOdometer', None) or math.nan,
+                jurisdiction_code,
+            )
+            if self.feed:
+                version = to_version_number(detail.get('version', None))
+                row, added_version = self.rows_by_id.get(detail['id'], (None, None))
+                if row is not None:
+                    # keep the latest version of a detail the feed returned again
+                    if version >= added_version:
+                        self.rows_by_id[detail['id']] = (row, version)
+                        self.set_row(row, values)
+                    continue
+                self.rows_by_id[detail['id']] = (len(self.device), version)
+            self.append_row(values)
+
+    def append_row(self, values: tuple) -> None:
+        for column, value in zip(self.columns(), values):
+            column.append(value)
+
+    def set_row(self, row: int, values: tuple) -> None:
+        for column, value in zip(self.columns(), values):
+            column[row] = value
+
+    def columns(self) -> tuple:
+        return self.device, self.enter_time, self.exit_time, self.enter_odometer, self.exit_odometer, self.jurisdiction
+
+    def to_dataframe(self, close_last_detail: bool = True) -> pd.DataFrame:
+        '''
+        Creates the FuelTaxDetail dataframe, ordered by device id and then by the order details were added,
+            or by enter time for a feed buffer
+        close_last_detail: treat the last detail of each device as ending at midnight,
+            which only holds when the buffer covers a whole day
+        '''
+        # the numeric columns are read from the buffers without converting each value; putting them in device order
+        #   with [order] makes one copy of each
+        device = np.frombuffer(self.device, dtype=np.intc)
+        device_rank = np.argsort(np.argsort(np.array(self.device_ids, dtype=object)))
+        device_order = device_rank[device] if len(device) else device
+        if self.feed:
+            # the feed does not return a device's details in time order, and the last one is closed at midnight below
+            order = np.lexsort((np.frombuffer(self.enter_time), device_order))
+        else:
+            order = np.argsort(device_order, kind='stable')
+
+        device = device[order]
+        enter_time = pd.to_datetime(np.frombuffer(self.enter_time)[order], unit='s')
+        exit_time = pd.to_datetime(np.frombuffer(self.exit_time)[order], unit='s')
+
+        exit_reading_time = nullable(exit_time.time, exit_time.isna())
+        if close_last_detail and len(device):
+            # change the last detail of each device to have an exit time of 00:00:00
+            last_of_device = np.append(device[1:] != device[:-1], True)
+            exit_reading_time[last_of_device] = time(0, 0)
+
+        return pd.DataFrame({
+            'FuelTaxVin': np.array(self.vins, dtype=object)[device],
+            'EnterReadingDate': nullable(enter_time.date, enter_time.isna()),
+            'EnterReadingTime': nullable(enter_time.time, enter_time.isna()),
+            'ExitReadingTime': exit_reading_time,
+            'FuelTaxEnterOdometer': np.frombuffer(self.enter_odometer)[order] * KILO_TO_MILES,
+            'FuelTaxExitOdometer': np.frombuffer(self.exit_odometer)[order] * KILO_TO_MILES,
+            'FuelTaxJurisdiction': np.array(self.jurisdictions + [None], dtype=object)[np.frombuffer(self.jurisdiction, dtype=np.int16)[order]],
+        })
+
+def to_epoch_seconds(value: Any) -> float:
+    # naive datetimes are treated as UTC, as Geotab returns them
+    return calendar.timegm(value.utctimetuple()) if value else math.nan
+
+def to_version_number(version: Any) -> int:
+    # Geotab versions are hexadecimal, so their numbers follow the order of the changes
+    return int(version, 16) if version else -1
+
+def nullable(values: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=object)
+    values[missing] = None
+    return values
@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FEED_RESULTS_LIMIT = 5000 # maximum number of devices Geotab returns per GetFeed call
+
+class InMemoryCacheBackend:
+    """
+    In-process LRU store for cached device rosters, shared by every MyGeotabAPI in the process
+    """
+    def __init__(self, max_entries: int = 16) -> None:
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key: str, entry: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class RedisCacheBackend:
+    """
+    Redis store for cached device rosters, shared across processes through the Celery broker
+    """
+    def __init__(self, url: str = None, expiry: int = 7 * 24 * 60 * 60) -> None:
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.CELERY_BROKER_URL)
+        # entries outlive the TTL so stale rosters can still be refreshed incrementally
+        self.expiry = expiry
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(f'device_cache:{key}')
+        return json.loads(value) if value else None
+
+    def store(self, key: str, entry: Dict[str, Any]) -> None:
+        self.client.set(f'device_cache:{key}', json.dumps(entry), ex=self.expiry)
+
+_default_backend = None
+
+def get_default_backend():
+    '''
+    Returns the backend configured by settings.DEVICE_CACHE_BACKEND ('memory', 'redis' or 'none')
+    '''
+    global _default_backend
+    if settings.DEVICE_CACHE_BACKEND == 'none':
+        return None
+    if _default_backend is None:
+        if settings.DEVICE_CACHE_BACKEND == 'redis':
+            _default_backend = RedisCacheBackend()
+        elif settings.DEVICE_CACHE_BACKEND == 'memory':
+            _default_backend = InMemoryCacheBackend()
+        else:
+            raise ValueError(f"Unknown DEVICE_CACHE_BACKEND: {settings.DEVICE_CACHE_BACKEND}")
+    return _default_backend
+
+class DeviceToVinCache:
+    """
+    Caches the device id to VIN map for the IFTA group
+
+    The map is served from the cache for ttl seconds. After that it is brought up to date
+        with the Device changes reported by GetFeed since the last refresh instead of re-pulling every device,
+        unless the IFTA group tree changed since, which is read again on every refresh.
+    """
+    def __init__(self, api: Any, group_ids: List[str], backend: Any, ttl: int = None) -> None:
+        self.api = api
+        self.group_ids = group_ids
+        self.backend = backend
+        self.ttl = ttl if ttl is not None else settings.DEVICE_CACHE_TTL
+        self.key = f"{api.credentials.database}:{','.join(sorted(group_ids))}"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.full_refreshes = 0
+        self.incremental_refreshes = 0
+        self._entry = None
+
+    def get_map(self) -> Dict[str, str]:
+        '''
+        Returns the device id to VIN map, refreshing it first if it is older than the TTL
+        '''
+        with self.lock:
+            if self._entry is None or not self.is_fresh(self._entry):
+                self._entry = self.backend.load(self.key) or self._entry
+
+            if self._entry is not None and self.is_fresh(self._entry):
+                self.hits += 1
+                return self._entry['devices']
+
+            self.misses += 1
+            entry = None
+            if self._entry is not None:
+                try:
+                    entry = self.refresh_incremental(self._entry)
+                except Exception as e:
+                    logger.warning(f'Incremental device refresh failed, re-pulling all devices: {e}')
+            if entry is None:
+                entry = self.refresh_full()
+
+            self.backend.store(self.key, entry)
+            self._entry = entry
+            return entry['devices']
+
+    def get_vin(self, device_id: str) -> Optional[str]:
+        return self.get_map().get(device_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'full_refreshes': self.full_refreshes,
+            'incremental_refreshes': self.incremental_refreshes,
+        }
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry['refreshed_at'] < self.ttl
+
+    def refresh_full(self) -> Dict[str, Any]:
+        '''
+        Reads every device from the start of the Device feed
+        '''
+        self.full_refreshes += 1
+        entry = {'version': None, 'devices': {}, 'group_ids': self.get_group_tree(), 'refreshed_at': time.time()}
+        return self.apply_feed(entry)
+
+    def refresh_incremental(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        '''
+        Applies the devices changed since the cached feed version
+        Returns None if the IFTA group tree changed since, as devices that did not change themselves may have moved
+            in or out of it with their group, and only a full refresh re-checks those
+        '''
+        if self.get_group_tree() != list(entry['group_ids']):
+            logger.info('IFTA group tree changed, re-pulling all devices')
+            return None
+        self.incremental_refreshes += 1
+        entry = dict(entry, devices=dict(entry['devices']), refreshed_at=time.time())
+        return self.apply_feed(entry)
+
+    def apply_feed(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        group_ids = set(entry['group_ids'])
+        while True:
+            result = self.api.call('GetFeed', type_name='Device', from_version=entry['version'], results_limit=FEED_RESULTS_LIMIT)
+            for device in result['data']:
+                device_id = device.get('id', None)
+                vin = device.get('vehicleIdentificationNumber', None)
+                in_group = any(group.get('id', None) in group_ids for group in device.get('groups', []))
+                if device_id and vin and in_group:
+                    entry['devices'][device_id] = vin
+                elif device_id:
+                    entry['devices'].pop(device_id, None)
+            entry['version'] = result['toVersion']
+            if len(result['data']) < FEED_RESULTS_LIMIT:
+                return entry
+
+    def get_group_tree(self) -> List[str]:
+        '''
+        Returns the ids of the IFTA groups and all of their subgroups
+        '''
+        children = {group['id']: [child['id'] for child in group.get('children', [])] for group in self.api.get('Group')}
+        group_ids = set()
+        pending = list(self.group_ids)
+        while pending:
+            group_id = pending.pop()
+            if group_id not in group_ids:
+                group_ids.add(group_id)
+                pending.extend(children.get(group_id, []))
+        return sorted(group_ids)
@@ -2,12 +2,80 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 from email.mime.text import MIMEText
+import gzip
+import io
 import logging
+import threading
+import time
+import zipfile
+from django.conf import settings
 from daily_compliance_job.models import EmailRecipient, EmailSender
 from datetime import date
+from typing import List, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+class SenderConfig(NamedTuple):
+    email: str
+    smtp_server: str
+    smtp_port: int
+    password: str   # decrypted
+    recipients: List[str]
+
+_sender_config = None
+_sender_config_loaded_at = 0.0
+_sender_config_lock = threading.Lock()
+
+def get_sender_config() -> Optional[SenderConfig]:
+    '''
+    Returns the email sender, its decrypted password and the recipients,
+        read from the database at most once every EMAIL_CONFIG_TTL seconds
+    Returns None and logs the error if no sender or recipients are configured
+    '''
+    global _sender_config, _sender_config_loaded_at
+    with _sender_config_lock:
+        if _sender_config is None or time.monotonic() - _sender_config_loaded_at > settings.EMAIL_CONFIG_TTL:
+            # get the email sender
+            sender = EmailSender.objects.first()
+            if not sender:
+                logger.error("No email sender configured")
+                return None
+
+            # get the email recipients
+            recipients = [recipient.email for recipient in EmailRecipient.objects.all()]
+            if not recipients:
+                logger.error("No email recipients configured")
+                return None
+
+            _sender_config = SenderConfig(sender.email, sender.smtp_server, sender.smtp_port, sender.get_smtp_password(), recipients)
+            _sender_config_loaded_at = time.monotonic()
+        return _sender_config
+
+def clear_sender_config() -> None:
+    '''
+    Forces the next email to re-read the sender and recipients
+    '''
+    global _sender_config
+    with _sender_config_lock:
+        _sender_config = None
+
+def compress_attachment(data: bytes, name: str, compression: str = None) -> Tuple[bytes, str]:
+    '''
+    Compresses attachments larger than EMAIL_COMPRESS_THRESHOLD bytes with EMAIL_ATTACHMENT_COMPRESSION ('zip', 'gzip' or 'none')
+    Returns the attachment data and file name to send
+    '''
+    compression = compression or settings.EMAIL_ATTACHMENT_COMPRESSION
+    if compression == 'none' or len(data) <= settings.EMAIL_COMPRESS_THRESHOLD:
+        return data, name
+    if compression == 'gzip':
+        return gzip.compress(data), f'{name}.gz'
+    if compression == 'zip':
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(name or 'report.csv', data)
+        return buffer.getvalue(), f'{name}.zip'
+    raise ValueError(f"Unknown EMAIL_ATTACHMENT_COMPRESSION: {compression}")
+
 class EmailService:
     def __init__(self, subject: str, body: str, date: date = None, attachment: bytes = None, attachment_name: str = '') -> None:
         self.subject = subject
@@ -21,55 +89,125 @@ class EmailService:
         Send the email
         returns True if the email was sent successfully, False otherwise
         '''
-        # get the email sender 
-        sender = EmailSender.objects.first()
-        if not sender:
-            logger.error("No email sender configured")
-            return False
+        with EmailBatch() as batch:
+            return batch.send(self)
 
-        # get the email recipients
-        recipients = [recipient.email for recipient in EmailRecipient.objects.all()]
-        if not recipients:
-            logger.error("No email recipients configured")
-            return False
+    def to_message(self, sender: SenderConfig) -> MIMEMultipart:
+        '''
+        Create the email message
+        '''
+        msg = MIMEMultipart()
+        msg['From'] = sender.email
+        msg['To'] = ', '.join(sender.recipients)
+        msg['Subject'] = self.subject
+
+        body = self.body
+        # if the date was provided and that date is a weekend, add a note to the email
+        if self.date and self.date.weekday() >= 5:
+            day_of_week = 'Saturday' if self.date.weekday() == 5 else 'Sunday'
+            body += f"\n\nNote: {self.date.month}/{self.date.day}/{self.date.year} is a {day_of_week}. There may be less data than usual.\n"
+
+        msg.attach(MIMEText(body, 'plain'))
+
+        # Add the attachment if provided
+        if self.attachment:
+            data = self.attachment.encode('utf-8') if isinstance(self.attachment, str) else self.attachment
+            data, attachment_name = compress_attachment(data, self.attachment_name)
+            attachment = MIMEApplication(data, name=attachment_name)
+            attachment['Content-Disposition'] = f'attachment; filename="{attachment_name}"'
+            msg.attach(attachment)
+
+        return msg
 
+class EmailBatch:
+    """
+    Sends emails over one authenticated SMTP session, opened on the first send and kept until close
+
+    Emails can be sent right away with send(), or queued with add() and sent together with flush().
+    Leaving a `with EmailBatch() as batch:` block flushes the queue and closes the session.
+    """
+    def __init__(self) -> None:
+        self.queue = []
+        self.server = None
+        self.sender = None
+        self.logins = 0
+
+    def __enter__(self) -> 'EmailBatch':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
         try:
-            # Set up the SMTP server
-            server = smtplib.SMTP(sender.smtp_server, sender.smtp_port)
-            # Using tls
-            server.starttls()
+            self.flush()
+        finally:
+            self.close()
+
+    def add(self, email: EmailService) -> None:
+        self.queue.append(email)
+
+    def flush(self) -> List[bool]:
+        '''
+        Send the queued emails
+        returns whether each email was sent successfully
+        '''
+        emails, self.queue = self.queue, []
+        return [self.send(email) for email in emails]
+
+    def send(self, email: EmailService) -> bool:
+        '''
+        Send the email over the batch's session, reconnecting once if the server dropped it
+        returns True if the email was sent successfully, False otherwise
+        '''
+        for attempt in range(2):
             try:
-                server.login(sender.email, sender.get_smtp_password())
-            except smtplib.SMTPAuthenticationError as e:
-                logger.error(f"Error authenticating with SMTP server: {e}")
+                if not self.connect():
+                    return False
+                self.server.send_message(email.to_message(self.sender))
+                logger.info("Emails sent successfully.")
+                return True
+            except smtplib.SMTPServerDisconnected as e:
+                self.server = None
+                if attempt == 1:
+                    logger.error(f"Error sending email: {e}")
+            except Exception as e:
+                logger.error(f"Error sending email: {e}")
                 return False
+        return False
 
-            # Create the email message
-            msg = MIMEMultipart()
-            msg['From'] = sender.email
-            msg['To'] = ', '.join(recipients)
-            msg['Subject'] = self.subject
-
-            # if the date was provided and that date is a weekend, add a note to the email
-            if self.date and self.date.weekday() >= 5:
-                day_of_week = 'Saturday' if self.date.weekday() == 5 else 'Sunday'
-                self.body += f"\n\nNote: {self.date.month}/{self.date.day}/{self.date.year} is a {day_of_week}. There may be less data than usual.\n"
-                
-            msg.attach(MIMEText(self.body, 'plain'))
-
-            # Add the attachment if provided
-            if self.attachment:
-                attachment = MIMEApplication(self.attachment, name=self.attachment_name)
-                attachment['Content-Disposition'] = f'attachment; filename="{self.attachment_name}"'
-                msg.attach(attachment)
-
-            # Send the email
-            server.send_message(msg)
-
-            server.quit()
-            logger.info("Emails sent successfully.")
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
+    def connect(self) -> bool:
+        '''
+        Open and authenticate the SMTP session if it is not open yet
+        returns False if there is no sender configured or the login failed
+        '''
+        if self.server is not None:
+            return True
+
+        self.sender = get_sender_config()
+        if self.sender is None:
             return False
-        
-        return True
\ No newline at end of file
+
+        # Set up the SMTP server
+        server = smtplib.SMTP(self.sender.smtp_server, self.sender.smtp_port)
+        try:
+            # Using tls
+            server.starttls()
+            server.login(self.sender.email, self.sender.password)
+        except smtplib.SMTPAuthenticationError as e:
+            logger.error(f"Error authenticating with SMTP server: {e}")
+            server.close()
+            # the password may have changed since it was cached
+            clear_sender_config()
+            return False
+        except Exception:
+            server.close()
+            raise
+        self.logins += 1
+        self.server = server
+        return True
+
+    def close(self) -> None:
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            self.server = None
@@ -0,0 +1,52 @@
+import datetime
+import hashlib
+import json
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+class EntryCache:
+    """
+    Per-date cache of /api/entries/ responses
+
+    Every reading date has a version token, which IftaEntry.save_all_entries replaces whenever it writes that date.
+    A response's ETag hashes the versions of the dates it covers with its query, so a write to any of those dates
+        changes the ETag and orphans every cached page for it.
+    """
+    def __init__(self, timeout: int = None) -> None:
+        self.timeout = timeout if timeout is not None else settings.ENTRY_CACHE_TIMEOUT
+
+    def get_versions(self, dates: List[datetime.date]) -> Dict[str, str]:
+        '''
+        Returns the version token of each date, creating tokens for dates that have none yet
+        '''
+        keys = [version_key(date) for date in dates]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # add() keeps a token another process created in the meantime
+                cache.add(key, new_version(), timeout=None)
+                versions[key] = cache.get(key)
+        return versions
+
+    def etag(self, dates: List[datetime.date], query: Dict[str, Any]) -> str:
+        versions = self.get_versions(dates)
+        content = json.dumps({'versions': [versions[version_key(date)] for date in dates], 'query': query}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get_page(self, etag: str) -> Optional[Dict[str, Any]]:
+        return cache.get(f'entries:page:{etag}')
+
+    def put_page(self, etag: str, page: Dict[str, Any]) -> None:
+        cache.set(f'entries:page:{etag}', page, timeout=self.timeout)
+
+    def invalidate(self, dates: Iterable[datetime.date]) -> None:
+        cache.set_many({version_key(date): new_version() for date in dates}, timeout=None)
+
+def version_key(date: datetime.date) -> str:
+    return f'entries:version:{date.isoformat()}'
+
+def new_version() -> str:
+    return uuid.uuid4().hex
@@ -0,0 +1,203 @@
+import datetime
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple
+
+from django.conf import settings
+from mygeotab import MyGeotabException, TimeoutException
+from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError
+
+logger = logging.getLogger(__name__)
+
+# MyGeotab errors that go away if the call is made again later
+RETRYABLE_ERRORS = ('OverLimitException', 'DbUnavailableException')
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average, in bursts of up to `capacity` calls, across threads
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        '''
+        Waits until tokens are available and takes them
+        A cost above the capacity waits for a full bucket and takes the rest as a deficit, which the calls after it wait out
+        Returns the seconds waited
+        '''
+        # the bucket never holds more than capacity, so that is all a large cost can wait for
+        needed = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        '''
+        Empties the bucket so no calls go out for the next `seconds`, after the server reported the limit was hit
+        '''
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+            self.updated_at = time.monotonic()
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(key: str) -> TokenBucket:
+    '''
+    Returns the process-wide limiter of a MyGeotab account, so the days of a backfill share its rate limit
+    '''
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            rate = settings.GEOTAB_CALLS_PER_MINUTE / 60
+            _rate_limiters[key] = TokenBucket(rate, capacity=max(1.0, rate * settings.GEOTAB_RATE_BURST_SECONDS))
+        return _rate_limiters[key]
+
+class Shard(NamedTuple):
+    index: int
+    device_ids: List[str]
+    from_date: datetime.datetime
+    to_date: datetime.datetime
+
+class FetchStats:
+    """
+    Counts of a sharded fetch, reported with the job's stage timings
+    """
+    def __init__(self) -> None:
+        self.shards = 0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.details = 0
+        self.waited_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, **counts) -> None:
+        with self.lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'shards': self.shards,
+            'calls': self.calls,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'rate_limit_wait_s': round(self.waited_seconds, 3),
+        }
+
+class FuelTaxDetailScheduler:
+    """
+    Fetches fuel tax details one Get call per device, sharding the devices and the date range
+        and sending each shard as one ExecuteMultiCall from a pool of workers
+
+    Calls go through a token bucket matching the account's MyGeotab rate limit (GEOTAB_CALLS_PER_MINUTE).
+    Shards that are throttled or fail transiently are retried with exponential backoff and full jitter.
+    run() yields the details of each shard in shard order, so each device's details stay in time order.
+
+    Usage:
+        scheduler = FuelTaxDetailScheduler(api, device_ids, from_date, to_date)
+        for details in scheduler.run():
+            detail_map.add_details(details, device_to_vin)
+    """
+    def __init__(self, api: Any, device_ids: List[str], from_date: datetime.datetime, to_date: datetime.datetime,
+                 devices_per_shard: int = None, slice_days: int = None, workers: int = None, limiter: TokenBucket = None,
+                 retries: int = None, backoff: float = None) -> None:
+        self.api = api
+        self.device_ids = sorted(device_ids)
+        self.from_date = from_date
+        self.to_date = to_date
+        self.devices_per_shard = devices_per_shard or settings.GEOTAB_DEVICES_PER_SHARD
+        self.slice_days = slice_days or settings.GEOTAB_FETCH_SLICE_DAYS
+        self.workers = workers or settings.GEOTAB_FETCH_WORKERS
+        self.limiter = limiter or get_rate_limiter(f'{api.credentials.server}/{api.credentials.database}/{api.credentials.username}')
+        self.retries = retries if retries is not None else settings.GEOTAB_FETCH_RETRIES
+        self.backoff = backoff if backoff is not None else settings.GEOTAB_RETRY_BACKOFF
+        self.stats = FetchStats()
+
+    def shards(self) -> List[Shard]:
+        '''
+        Splits the devices into groups of devices_per_shard and the date range into slices of slice_days,
+            ordered by device group and then by time
+        '''
+        slices = []
+        slice_start = self.from_date
+        while slice_start < self.to_date:
+            slice_end = min(slice_start + datetime.timedelta(days=self.slice_days), self.to_date)
+            slices.append((slice_start, slice_end))
+            slice_start = slice_end
+
+        shards = []
+        for offset in range(0, len(self.device_ids), self.devices_per_shard):
+            for slice_start, slice_end in slices:
+                shards.append(Shard(len(shards), self.device_ids[offset:offset + self.devices_per_shard], slice_start, slice_end))
+        return shards
+
+    def run(self) -> Iterator[List[Dict[str, Any]]]:
+        '''
+        Yields the details of every shard, in shard order
+        Details returned by more than one time slice are only yielded once
+        '''
+        shards = self.shards()
+        self.stats.add(shards=len(shards))
+        # a detail crossing the boundary of two time slices can be returned for both
+        deduplicate = len({shard.from_date for shard in shards}) > 1
+        seen_ids = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for details in executor.map(self.fetch_shard, shards):
+                if deduplicate:
+                    details = [detail for detail in details if detail['id'] not in seen_ids and not seen_ids.add(detail['id'])]
+                self.stats.add(details=len(details))
+                yield details
+
+    def fetch_shard(self, shard: Shard) -> List[Dict[str, Any]]:
+        '''
+        Gets the details of every device in the shard in one ExecuteMultiCall, retrying transient failures
+        '''
+        calls = [('Get', {'typeName': 'FuelTaxDetail', 'search': {
+                    'deviceSearch': {'id': device_id},
+                    'fromDate': shard.from_date,
+                    'toDate': shard.to_date,
+                    'includeHourlyData': False,
+                    'includeBoundaries': False,
+                }}) for device_id in shard.device_ids]
+
+        for attempt in range(self.retries + 1):
+            self.stats.add(waited_seconds=self.limiter.acquire(len(calls)))
+            try:
+                results = self.api.multi_call(calls)
+                self.stats.add(calls=len(calls))
+                return [detail for device_details in results for detail in device_details or []]
+            except (MyGeotabException, TimeoutException, RequestsConnectionError, HTTPError) as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if isinstance(e, MyGeotabException) and e.name == 'OverLimitException':
+                    self.stats.add(throttled=1)
+                    # hold back every worker, not just this one
+                    self.limiter.pause(delay)
+                self.stats.add(retries=1)
+                logger.warning(f'Fuel tax detail shard {shard.index} failed ({e}), retrying in {delay:.2f}s')
+                time.sleep(delay)
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, MyGeotabException):
+        return error.name in RETRYABLE_ERRORS
+    if isinstance(error, HTTPError):
+        return error.response is not None and (error.response.status_code == 429 or error.response.status_code >= 500)
+    return True
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from daily_compliance_job.services.ifta import MISSING, to_second_of_day
+
+FINGERPRINT_COLUMNS = ['VIN', 'ReadingDate', 'Fingerprint', 'Rows']
+DELTA_COLUMNS = FINGERPRINT_COLUMNS + ['Change']
+# how a VIN-day compares with the fingerprint stored by the last incremental run
+ADDED = 'added'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+REMOVED = 'removed'
+CHANGES = [ADDED, CHANGED, UNCHANGED, REMOVED]
+
+def hash_rows(df: pd.DataFrame) -> np.ndarray:
+    '''
+    64-bit hash of the time, odometer and jurisdiction of each reading of an IFTA frame
+    The columns are normalized first, so the hash does not depend on whether the odometers are int or float
+    '''
+    time_indexes, times = pd.factorize(df['ReadingTime'])
+    seconds = np.array([to_second_of_day(value) for value in times] + [MISSING], dtype=np.int64)[time_indexes]
+    normalized = pd.DataFrame({
+        'ReadingTime': seconds,
+        'Odometer': np.where(df['Odometer'].isna(), MISSING, df['Odometer'].fillna(0)).astype(np.int64),
+        'Jurisdiction': df['Jurisdiction'].fillna('').astype(str).to_numpy(dtype=object),
+    })
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+def fingerprint_vin_days(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Fingerprint of the readings of each VIN on each day of an IFTA frame: a hash of its rows in time order,
+        which changes when Geotab adds, drops or corrects any reading of the VIN that day
+    The rows are hashed in one vectorized pass and only the per VIN-day digests are built in Python
+    Readings without a date are left out
+
+    Returns a frame with FINGERPRINT_COLUMNS, sorted by VIN and date
+    '''
+    df = df[df['ReadingDate'].notna()]
+    groups = df.groupby(['VIN', 'ReadingDate'], sort=True)
+    codes = groups.ngroup().to_numpy()
+    row_hashes = hash_rows(df)
+
+    time_indexes, times = pd.factorize(df['ReadingTime'], sort=True)
+    # rows of a VIN-day next to each other in time order, keeping the frame order of readings taken at the same time
+    order = np.lexsort((np.arange(len(df)), time_indexes, codes))
+    row_hashes = row_hashes[order]
+    rows = np.bincount(codes, minlength=groups.ngroups)
+    ends = np.cumsum(rows)
+    fingerprints = [hashlib.blake2b(row_hashes[end - num_rows:end].tobytes(), digest_size=16).hexdigest() for end, num_rows in zip(ends.tolist(), rows.tolist())]
+
+    keys = groups.size().index
+    return pd.DataFrame({
+        'VIN': keys.get_level_values('VIN').to_numpy(dtype=object),
+        'ReadingDate': keys.get_level_values('ReadingDate').to_numpy(dtype=object),
+        'Fingerprint': fingerprints,
+        'Rows': rows.astype(np.int64),
+    }, columns=FINGERPRINT_COLUMNS)
+
+def diff_fingerprints(fingerprints: pd.DataFrame, dates: Iterable[datetime.date]) -> pd.DataFrame:
+    '''
+    Compare VIN-day fingerprints with the ones stored for their dates and the given report dates
+    VIN-days stored for those dates but missing from fingerprints are returned as REMOVED, without a fingerprint
+
+    Returns a frame with DELTA_COLUMNS, sorted by VIN and date
+    '''
+    from daily_compliance_job.models import VinDayFingerprint
+
+    dates = set(dates) | set(fingerprints['ReadingDate'])
+    stored = pd.DataFrame(list(VinDayFingerprint.objects.filter(date__in=dates).values_list('vin', 'date', 'fingerprint')),
+                          columns=['VIN', 'ReadingDate', 'StoredFingerprint'])
+    delta = fingerprints.merge(stored, on=['VIN', 'ReadingDate'], how='outer', indicator=True)
+    delta['Change'] = np.select(
+        [delta['_merge'] == 'left_only', delta['_merge'] == 'right_only', delta['Fingerprint'] != delta['StoredFingerprint']],
+        [ADDED, REMOVED, CHANGED],
+        UNCHANGED,
+    )
+    delta['Rows'] = delta['Rows'].fillna(0).astype(np.int64)
+    return delta.sort_values(['VIN', 'ReadingDate'], ignore_index=True)[DELTA_COLUMNS]
+
+def select_changed(df: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    '''
+    The rows of an IFTA frame that belong to the ADDED or CHANGED VIN-days of delta, keeping their order
+    Readings without a date have no fingerprint, so they are always kept
+    '''
+    changed = delta[delta['Change'].isin([ADDED, CHANGED])]
+    keys = pd.MultiIndex.from_arrays([df['VIN'], df['ReadingDate']])
+    mask = keys.isin(pd.MultiIndex.from_arrays([changed['VIN'], changed['ReadingDate']])) | df['ReadingDate'].isna().to_numpy()
+    return df[mask]
+
+def count_changes(delta: pd.DataFrame) -> Dict[str, int]:
+    '''
+    Number of VIN-days of each kind of change in CHANGES, including the kinds with none
+    '''
+    counts = delta['Change'].value_counts()
+    return {change: int(counts.get(change, 0)) for change in CHANGES}
+
+def is_first_run(delta: pd.DataFrame) -> bool:
+    '''
+    Whether no fingerprints were stored for the VIN-days of delta, i.e. every VIN-day is new
+    '''
+    return bool((delta['Change'] == ADDED).all())
@@ -2,43 +2,107 @@
 
 import mygeotab
 import pandas as pd
-from typing import Dict, Any, List
-from datetime import datetime, time
+from typing import Dict, Any, Iterator, List, Tuple
+from datetime import datetime
 from ftplib import FTP
 import io
+from daily_compliance_job.services.detail_buffer import FuelTaxDetailBuffer, KILO_TO_MILES
+from daily_compliance_job.services.device_cache import DeviceToVinCache, get_default_backend
 from daily_compliance_job.services.events import NoFuelTaxDataException
+from daily_compliance_job.services.fetch_scheduler import FuelTaxDetailScheduler
 from daily_compliance_job.services.ifta import IftaDataCollection, FuelTaxProcessor
+from daily_compliance_job.services.instrumentation import span
 from django.conf import settings
 
-KILO_TO_MILES = 0.62137119
 IFTA_GROUP = [{'id': settings.GEOTAB_GROUP}] # if more groups need to be added in the future, add them to this list
 
 class MyGeotabAPI(mygeotab.API):
-    def __init__(self, username: str = '', password: str = '', database: str = '') -> None:
-
+    def __init__(self, username: str = '', password: str = '', database: str = '', device_cache_backend: Any = None, server: str = '', ca_bundle: str = '') -> None:
+        # MYGEOTAB_SERVER and MYGEOTAB_CA_BUNDLE can point the API at a local stand-in (see standins.geotab)
+        server = server or settings.MYGEOTAB_SERVER
+        self.ca_bundle = ca_bundle or settings.MYGEOTAB_CA_BUNDLE
         if not username or not password or not database:
-            super().__init__(username=settings.MYGEOTAB_USERNAME, password=settings.MYGEOTAB_PASSWORD, database=settings.MYGEOTAB_DATABASE)
+            super().__init__(username=settings.MYGEOTAB_USERNAME, password=settings.MYGEOTAB_PASSWORD, database=settings.MYGEOTAB_DATABASE, server=server)
         else:
-            super().__init__(username, password, database)
+            super().__init__(username, password, database, server=server)
         # authenticate the api object then check for success. If not, raise an exception
         try:
             self.authenticate()
         except mygeotab.AuthenticationException as e:
             raise Exception(f'Failed to authenticate API.\n\t{e}')
-        # Maps device id to metadata about the device
-        self.detail_map = {}
+        # Fuel tax details for the IFTA devices, grouped by device id
+        self.detail_map = FuelTaxDetailBuffer()
+        # Caches the device id to VIN map across calls (None if caching is disabled)
+        backend = device_cache_backend or get_default_backend()
+        self.device_cache = DeviceToVinCache(self, [group['id'] for group in IFTA_GROUP], backend) if backend else None
+
+    @property
+    def _is_verify_ssl(self):
+        # requests takes a certificate bundle in place of True
+        return self.ca_bundle or super()._is_verify_ssl
 
     def get_fuel_tax_details(self, from_date: datetime, to_date: datetime) -> List[Dict[str, Any]]:
-        fuel_tax_details = self.get('FuelTaxDetail', 
-                                    fromDate=from_date, 
-                                    toDate=to_date, 
-                                    includeHourlyData=False, 
-                                    includeBoundaries=False)
+        with span('geotab.fuel_tax_details') as fetch:
+            fuel_tax_details = self.get('FuelTaxDetail', 
+                                        fromDate=from_date, 
+                                        toDate=to_date, 
+                                        includeHourlyData=False, 
+                                        includeBoundaries=False)
+            fetch.rows = len(fuel_tax_details or [])
         if not fuel_tax_details:
             raise NoFuelTaxDataException('No data returned from FuelTaxDetails endpoint.')
         
         return fuel_tax_details
 
+    def fetch_sharded_fuel_tax_details(self, from_date: datetime, to_date: datetime, device_ids: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        '''
+        Yields the fuel tax details of the devices between from_date and to_date, fetched concurrently per device
+            by a FuelTaxDetailScheduler, in device and time order
+        '''
+        has_data = False
+        with span('geotab.fuel_tax_details') as fetch:
+            fetch.rows = 0
+            scheduler = FuelTaxDetailScheduler(self, device_ids, from_date, to_date)
+            try:
+                for details in scheduler.run():
+                    has_data = has_data or bool(details)
+                    fetch.rows += len(details)
+                    yield details
+            finally:
+                fetch.extra.update(scheduler.stats.to_dict())
+        if not has_data:
+            raise NoFuelTaxDataException('No data returned from FuelTaxDetails endpoint.')
+
+    def iter_fuel_tax_details(self, from_date: datetime, to_date: datetime = None, from_version: str = None, results_limit: int = None) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+        '''
+        Pages through the FuelTaxDetail feed, yielding each batch of details with the feed version it ends at
+        from_version: version returned by a previous call, to only fetch details added or changed since then
+        results_limit: maximum number of details per batch
+        '''
+        results_limit = results_limit or settings.GEOTAB_FEED_RESULTS_LIMIT
+        search = {'fromDate': from_date, 'includeHourlyData': False, 'includeBoundaries': False}
+        if to_date is not None:
+            search['toDate'] = to_date
+
+        while True:
+            result = self.call('GetFeed', type_name='FuelTaxDetail', search=search, from_version=from_version, results_limit=results_limit)
+            from_version = result['toVersion']
+            if result['data']:
+                yield result['data'], from_version
+            if len(result['data']) < results_limit:
+                return
+
+    def stream_fuel_tax_details(self, from_date: datetime, to_date: datetime, results_limit: int = None) -> Iterator[List[Dict[str, Any]]]:
+        '''
+        Yields every fuel tax detail between from_date and to_date in batches of at most results_limit
+        '''
+        has_data = False
+        for details, _ in self.iter_fuel_tax_details(from_date, to_date, results_limit=results_limit):
+            has_data = True
+            yield details
+        if not has_data:
+            raise NoFuelTaxDataException('No data returned from FuelTaxDetails feed.')
+
     def get_ifta_devices(self, from_date: datetime, to_date: datetime) -> List[Dict[str, Any]]:
         # Return all unique devices in the group 'Ifta Group'
         return self.get('Device', 
@@ -46,67 +110,100 @@ class MyGeotabAPI(mygeotab.API):
                         toDate=to_date, 
                         search={'groups': IFTA_GROUP})
 
-    def get_device_to_vin(self, from_date: datetime, to_date: datetime) -> Dict[str, str]:
-        device_list = self.get_ifta_devices(from_date, to_date)
-        return {device['id']: device['vehicleIdentificationNumber'] for device in device_list if device.get('vehicleIdentificationNumber', None) and device.get('id', None)}
+    def get_device_to_vin(self, from_date: datetime = None, to_date: datetime = None) -> Dict[str, str]:
+        '''
+        Maps device id to VIN for the devices in the IFTA group
+        When the device cache is enabled, the cached map covers every IFTA device regardless of the dates
+        '''
+        with span('geotab.devices') as fetch:
+            if self.device_cache:
+                device_to_vin = self.device_cache.get_map()
+            else:
+                if from_date is None or to_date is None:
+                    raise ValueError('from_date and to_date are required when the device cache is disabled')
+                device_list = self.get_ifta_devices(from_date, to_date)
+                device_to_vin = {device['id']: device['vehicleIdentificationNumber'] for device in device_list if device.get('vehicleIdentificationNumber', None) and device.get('id', None)}
+            fetch.rows = len(device_to_vin)
+        return device_to_vin
 
     def get_vin(self, device_id: str) -> str:
-        return self.get_device_to_vin()[device_id]
-
-    def init_detail_map(self, from_date: datetime, to_date: datetime) -> None:
-        # clear any cached data in the detail map from previous calls
-        self.detail_map.clear()
-
-        fuel_tax_details = self.get_fuel_tax_details(from_date, to_date)
-        device_to_vin = self.get_device_to_vin(from_date, to_date)
-
-        for detail in fuel_tax_details:
-            # Skip devices that are not in the IFTA group
-            if detail['device']['id'] not in device_to_vin:
-                continue
-            # Add details to the detail map
-            if detail['device']['id'] not in self.detail_map:
-                self.detail_map[detail['device']['id']] = [detail]
-                self.detail_map[detail['device']['id']][0]['vehicleIdentificationNumber'] = device_to_vin[detail['device']['id']]
+        if self.device_cache:
+            vin = self.device_cache.get_vin(device_id)
+            if vin is None:
+                raise KeyError(device_id)
+            return vin
+        now = datetime.now()
+        return self.get_device_to_vin(now, now)[device_id]
+
+    def build_detail_map(self, from_date: datetime, to_date: datetime, device_to_vin: Dict[str, str] = None, stream: bool = False, sharded: bool = False) -> FuelTaxDetailBuffer:
+        '''
+        Fetches fuel tax details and groups them by device id, skipping devices that are not in the IFTA group
+        device_to_vin: device id to VIN map to reuse across calls, fetched from Geotab if not provided
+        stream: page the details through the FuelTaxDetail feed instead of fetching them in one call,
+            reading the whole range from the start of the feed: a report needs every detail of its dates,
+            not only the ones since the FeedVersion that sync_fuel_tax_feed resumes from.
+            Only the latest version of a detail the feed returned again is kept (see FuelTaxDetailBuffer)
+        sharded: fetch the details of each IFTA device concurrently, within the account's rate limit
+        '''
+        if stream and sharded:
+            raise ValueError('stream and sharded cannot be combined')
+        with span('geotab.init_detail_map') as build:
+            if device_to_vin is None:
+                device_to_vin = self.get_device_to_vin(from_date, to_date)
+
+            detail_map = FuelTaxDetailBuffer(feed=stream)
+            if stream:
+                # each batch is projected and dropped before the next one is fetched, so this span includes the projection
+                with span('geotab.fuel_tax_details') as fetch:
+                    fetch.rows = 0
+                    for details in self.stream_fuel_tax_details(from_date, to_date):
+                        fetch.rows += len(details)
+                        detail_map.add_details(details, device_to_vin)
+            elif sharded:
+                for details in self.fetch_sharded_fuel_tax_details(from_date, to_date, list(device_to_vin)):
+                    detail_map.add_details(details, device_to_vin)
             else:
-                self.detail_map[detail['device']['id']].append(detail)
-                self.detail_map[detail['device']['id']][-1]['vehicleIdentificationNumber'] = device_to_vin[detail['device']['id']]
+                detail_map.add_details(self.get_fuel_tax_details(from_date, to_date), device_to_vin)
+            build.rows = len(detail_map)
+
+        return detail_map
+
+    def init_detail_map(self, from_date: datetime, to_date: datetime, device_to_vin: Dict[str, str] = None) -> None:
+        # replace any cached data in the detail map from previous calls
+        self.detail_map = self.build_detail_map(from_date, to_date, device_to_vin)
                 
-    def to_dataframe(self) -> pd.DataFrame:
+    def to_dataframe(self, detail_map: FuelTaxDetailBuffer = None, close_last_detail: bool = True) -> pd.DataFrame:
         '''
         Creates a dataframe object using the data in the detail_map
+        close_last_detail: treat the last detail of each device as ending at midnight,
+            which only holds when the detail map covers a whole day
         '''
-        reduced_detail_map = []
-        for _, details in sorted(self.detail_map.items(), key=lambda x: x[0]):
-            for detail in details:
-                vin = detail.get('vehicleIdentificationNumber', None)
-                reduced_detail_map.append({
-                    'FuelTaxVin': vin,
-                    'EnterReadingDate': detail['enterTime'].date() if detail.get('enterTime', None) else None,  
-                    'EnterReadingTime': detail['enterTime'].replace(microsecond=0).time() if detail.get('enterTime', None) else None,
-                    'ExitReadingTime': detail['exitTime'].replace(microsecond=0).time() if detail.get('exitTime', None) else None,
-                    'FuelTaxEnterOdometer': (detail['enterOdometer'] * KILO_TO_MILES) if detail.get('enterOdometer', None) else None,
-                    'FuelTaxExitOdometer': (detail['exitOdometer'] * KILO_TO_MILES) if detail.get('exitOdometer', None) else None,
-                    'FuelTaxJurisdiction': detail.get('jurisdiction', None),
-                })
-            # change the last detail in the list to have an exit time of 00:00:00
-            if reduced_detail_map:
-                reduced_detail_map[-1]['ExitReadingTime'] = time(0, 0)
-
-        return pd.DataFrame(reduced_detail_map)
-
-    def to_ifta_data_collection(self, fromDate: datetime, toDate: datetime) -> IftaDataCollection:
+        if detail_map is None:
+            detail_map = self.detail_map
+
+        with span('geotab.to_dataframe') as convert:
+            df = detail_map.to_dataframe(close_last_detail=close_last_detail)
+            convert.rows = len(df)
+        return df
+
+    def to_ifta_data_collection(self, fromDate: datetime, toDate: datetime, device_to_vin: Dict[str, str] = None, stream: bool = False, sharded: bool = False) -> IftaDataCollection:
         '''
         Creates a IftaDataCollection object using the data from Geotab
+        device_to_vin: device id to VIN map to reuse across calls, fetched from Geotab if not provided
+        stream: page the details through the FuelTaxDetail feed instead of fetching them in one call
+        sharded: fetch the details of each IFTA device concurrently, within the account's rate limit
         '''
-        # initialize the device detail map
-        self.init_detail_map(fromDate, toDate)
+        # build the device detail map for this date range only, so one API object can serve several ranges at once
+        detail_map = self.build_detail_map(fromDate, toDate, device_to_vin, stream=stream, sharded=sharded)
 
         # create a dataframe object from the device detail map
-        df = self.to_dataframe()
+        df = self.to_dataframe(detail_map)
 
         # return the IftaDataCollection object from the dataframe
-        return FuelTaxProcessor.to_ifta_data_collection(df)
+        with span('geotab.to_ifta_data_collection') as convert:
+            collection = FuelTaxProcessor.to_ifta_data_collection(df)
+            convert.rows = len(df)
+        return collection
 
 class GeotabFTP(FTP):
     def __init__(self, host: str):
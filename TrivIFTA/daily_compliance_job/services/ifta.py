@@ -3,44 +3,192 @@
 
 import numpy as np
 import pandas as pd
-from datetime import date, time
+from array import array
+from datetime import date, time, timedelta
 from openpyxl import load_workbook
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, NamedTuple, Set
 import io
+import threading
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional: faster XLSX parsing, falls back to openpyxl
+    CalamineWorkbook = None
+
+FUEL_TAX_COLUMNS = ['FuelTaxVin', 'FuelTaxEnterTime', 'FuelTaxExitTime', 'FuelTaxJurisdiction', 'FuelTaxEnterOdometer', 'FuelTaxExitOdometer']
+IFTA_COLUMNS = ['VIN', 'ReadingDate', 'ReadingTime', 'Odometer', 'Jurisdiction']
+EMPTY_VINS = ('nan', 'None', '')
+EMPTY_JURISDICTIONS = ('nan', '', ' ')
+# Geotab closes the last detail of each day at 00:00, which IFTA reports as 23:59
+MIDNIGHT = time(0, 0)
+END_OF_DAY = time(23, 59)
+# IftaData stores dates as days since the epoch, times as seconds since midnight, and MISSING for unknown values
+EPOCH = date(1970, 1, 1)
+MISSING = -2 ** 31
+
+# Jurisdictions are interned process-wide and stored as uint8 codes, with code 0 for a missing jurisdiction
+JURISDICTION_TABLE = [None]
+JURISDICTION_CODES = {None: 0}
+_jurisdiction_lock = threading.Lock()
+
+class IftaReport(NamedTuple):
+    """
+    Full and reduced IFTA frames with the vehicle stats for the report email
+    """
+    full: pd.DataFrame
+    reduced: pd.DataFrame  # full without the nonmoving vehicles
+    nonmoving_vehicles: Set[str]
+    total_vehicles: int
+    num_nonmoving_vehicles: int
+    anomalies: pd.DataFrame = None  # odometer anomalies of the full frame, see services.anomalies
 
 class IftaData:
     """
     Class to hold relevant IFTA data for each unique VIN
+
+    Readings are kept in append-only typed arrays (see EPOCH, MISSING and JURISDICTION_TABLE)
+        instead of one dict per reading.
+    Changes made through add_entry/add_entries invalidate the collection's cached dataframe
     """
-    def __init__(self, vin: str) -> None:
+    __slots__ = ('vin', 'collection', 'days', 'seconds', 'odometers', 'jurisdictions')
+
+    def __init__(self, vin: str, collection: 'IftaDataCollection' = None) -> None:
 
         self.vin = vin
-        self.data = []
+        self.collection = collection
+        self.days = array('i')          # ReadingDate, days since EPOCH
+        self.seconds = array('i')       # ReadingTime, seconds since midnight
+        self.odometers = array('i')     # Odometer, miles
+        self.jurisdictions = array('B') # Jurisdiction, code in JURISDICTION_TABLE
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for day, second, odometer, jurisdiction in zip(self.days, self.seconds, self.odometers, self.jurisdictions):
+            yield {
+                'ReadingDate': None if day == MISSING else EPOCH + timedelta(days=day),
+                'ReadingTime': None if second == MISSING else time(second // 3600, (second // 60) % 60, second % 60),
+                'Odometer': None if odometer == MISSING else odometer,
+                'Jurisdiction': JURISDICTION_TABLE[jurisdiction]
+            }
+
+    @property
+    def data(self) -> List[Dict[str, Any]]:
+        return list(self)
     
     def add_entry(self, reading_date: date, reading_time: time, odometer: int, jurisdiction: str) -> None:
-        self.data.append({
-            'ReadingDate': reading_date,
-            'ReadingTime': reading_time,
-            'Odometer': odometer,
-            'Jurisdiction': jurisdiction
-        })
+        self.days.append(to_epoch_day(reading_date))
+        self.seconds.append(to_second_of_day(reading_time))
+        self.odometers.append(MISSING if pd.isna(odometer) else round(odometer))
+        self.jurisdictions.append(get_jurisdiction_code(jurisdiction))
+        self.mark_dirty()
+
+    def add_entries(self, entries: List[Dict[str, Any]]) -> None:
+        for entry in entries:
+            self.add_entry(entry['ReadingDate'], entry['ReadingTime'], entry['Odometer'], entry['Jurisdiction'])
+
+    def add_columns(self, days: np.ndarray, seconds: np.ndarray, odometers: np.ndarray, jurisdictions: np.ndarray) -> None:
+        """
+        Append readings already encoded as int32 (days, seconds, odometers) and uint8 (jurisdictions) arrays
+        """
+        self.days.frombytes(days.astype(np.intc).tobytes())
+        self.seconds.frombytes(seconds.astype(np.intc).tobytes())
+        self.odometers.frombytes(odometers.astype(np.intc).tobytes())
+        self.jurisdictions.frombytes(jurisdictions.astype(np.uint8).tobytes())
+        self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        if self.collection is not None:
+            self.collection.invalidate()
+
+def to_epoch_day(value: date) -> int:
+    return MISSING if pd.isna(value) else value.toordinal() - EPOCH.toordinal()
+
+def to_second_of_day(value: time) -> int:
+    return MISSING if pd.isna(value) else value.hour * 3600 + value.minute * 60 + value.second
+
+def get_jurisdiction_code(jurisdiction: str) -> int:
+    code = JURISDICTION_CODES.get(jurisdiction, None)
+    if code is None:
+        with _jurisdiction_lock:
+            code = JURISDICTION_CODES.get(jurisdiction, None)
+            if code is None:
+                if len(JURISDICTION_TABLE) > np.iinfo(np.uint8).max:
+                    raise ValueError(f'Too many jurisdictions to intern {jurisdiction}')
+                code = JURISDICTION_CODES[jurisdiction] = len(JURISDICTION_TABLE)
+                JURISDICTION_TABLE.append(jurisdiction)
+    return code
+
+def to_dates(days: np.ndarray) -> np.ndarray:
+    # build one date object per distinct day, shared by every row of that day
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    dates = np.array([None if day == MISSING else EPOCH + timedelta(days=day) for day in unique_days.tolist()], dtype=object)
+    return dates[inverse]
+
+def to_times(seconds: np.ndarray) -> np.ndarray:
+    unique_seconds, inverse = np.unique(seconds, return_inverse=True)
+    times = np.array([None if second == MISSING else time(second // 3600, (second // 60) % 60, second % 60) for second in unique_seconds.tolist()], dtype=object)
+    return times[inverse]
 
 class IftaDataCollection(Dict[str, IftaData]):
     """
     Class to hold data for all VINs for which IFTA reporting is needed -- behaves like Dict[str, IftaData]
+
+    The sorted dataframe and report are built once and cached until the data changes.
+    The cached frames are shared by every caller, so they must not be modified in place.
     """
     def __init__(self) -> None:
         super().__init__()
         self.total_vehicles = 0
         self.num_nonmoving_vehicles = 0
+        self._frame = None
+        self._report = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> 'IftaDataCollection':
+        """
+        Build a collection from a sorted IFTA frame (see FuelTaxProcessor.to_ifta_dataframe)
+        The frame is kept as the collection's materialized dataframe, so it is not rebuilt and re-sorted
+        """
+        ifta_data_collection = cls()
+        reading_dates = pd.to_datetime(df['ReadingDate'])
+        days = np.where(reading_dates.isna(), MISSING, reading_dates.to_numpy().astype('datetime64[D]').astype(np.int64))
+        seconds = np.array([to_second_of_day(value) for value in df['ReadingTime'].tolist()], dtype=np.int64)
+        odometers = np.where(df['Odometer'].isna(), MISSING, df['Odometer'].fillna(0).round()).astype(np.int64)
+        # factorize marks missing jurisdictions -1, which picks the trailing 0 code
+        jurisdiction_indexes, jurisdictions = pd.factorize(df['Jurisdiction'])
+        jurisdiction_codes = np.array([get_jurisdiction_code(jurisdiction) for jurisdiction in jurisdictions] + [0], dtype=np.uint8)[jurisdiction_indexes]
+
+        for vin, indexes in df.groupby('VIN', sort=False).indices.items():
+            ifta_data_collection.add_ifta_data(vin)
+            ifta_data_collection[vin].add_columns(days[indexes], seconds[indexes], odometers[indexes], jurisdiction_codes[indexes])
+        ifta_data_collection._frame = df[IFTA_COLUMNS]
+        return ifta_data_collection
+
+    def __setitem__(self, vin: str, ifta_data: IftaData) -> None:
+        ifta_data.collection = self
+        super().__setitem__(vin, ifta_data)
+        self.invalidate()
+
+    def __delitem__(self, vin: str) -> None:
+        super().__delitem__(vin)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached dataframe and report after the data changes
+        """
+        self._frame = None
+        self._report = None
 
     def add_ifta_data(self, vin: str) -> None:
         if vin not in self:
-            self[vin] = IftaData(vin)
+            self[vin] = IftaData(vin, self)
     
     def get_ifta_data(self, vin: str) -> IftaData:
         ifta_data = self.get(vin, None)
-        if not ifta_data:
+        if ifta_data is None:
             raise Exception(f'IftaData not found for VIN: {vin}')
         return ifta_data
 
@@ -49,50 +197,88 @@ class IftaDataCollection(Dict[str, IftaData]):
         Convert data for all VINs to a single dataframe object,
             sorted by VIN, ReadingDate, ReadingTime
         """
-        all_entries = []
+        report = self.to_report()
+        return report.reduced if remove_nonmoving_vehicles else report.full
 
-        # Iterate over VINs in the collection
-        for vin, ifta_data in self.items():
-            for entry in ifta_data.data:
-                all_entries.append({
-                    'VIN': vin,
-                    'ReadingDate': entry['ReadingDate'],
-                    'ReadingTime': entry['ReadingTime'],
-                    'Odometer': entry['Odometer'],
-                    'Jurisdiction': entry['Jurisdiction']
-                })
-
-        # Create a DataFrame from the accumulated entries
-        df = pd.DataFrame(all_entries)
+    def to_report(self) -> IftaReport:
+        """
+        Build the full and reduced dataframes, the vehicle stats and the odometer anomalies in one pass over the data,
+            reusing the cached report if the data has not changed since
+        """
+        # imported here, as the anomaly checks build on this module
+        from daily_compliance_job.services.anomalies import find_anomalies
 
-        # Sort the DataFrame by VIN, ReadingDate, and ReadingTime
-        df.sort_values(by=['VIN', 'ReadingDate', 'ReadingTime'], inplace=True)
+        if self._report is not None:
+            return self._report
 
-        # Count number of total vehicles (i.e. number of unique vins)
-        self.total_vehicles = len(df['VIN'].unique())
+        df = self.materialize()
+        vehicle_stats = self.get_vehicle_stats(df)
+        nonmoving_vehicles = vehicle_stats.index[vehicle_stats['nonmoving']]
 
-        # Retrieve list of nonmoving vehicles
-        nonmoving_vehicles = self.get_nonmoving_vehicles(df)
+        # Count number of total vehicles (i.e. number of unique vins) and nonmoving vehicles
+        self.total_vehicles = len(vehicle_stats)
         self.num_nonmoving_vehicles = len(nonmoving_vehicles)
 
-        # Remove entries for vins where the odometer reading does not change
-        if remove_nonmoving_vehicles:
-            self.remove_unchanged(df, nonmoving_vehicles)
+        # Remove entries for vins where the odometer reading does not change, keeping the sorted order
+        reduced_df = df[~df['VIN'].isin(nonmoving_vehicles)] if len(nonmoving_vehicles) else df
 
-        # Return the dataframe
-        return df
-    
-    def get_nonmoving_vehicles(self, df: pd.DataFrame) -> List[str]:
+        self._report = IftaReport(df, reduced_df, set(nonmoving_vehicles), self.total_vehicles, self.num_nonmoving_vehicles, find_anomalies(df))
+        return self._report
+
+    def materialize(self) -> pd.DataFrame:
         """
-        Retrieve all entries where the odometer reading does not change
+        Returns the dataframe of all entries sorted by VIN, ReadingDate, ReadingTime, building it if it is not cached
         """
-        # Group the DataFrame by 'VIN'
-        grouped = df.groupby('VIN')
+        if self._frame is not None:
+            return self._frame
+
+        vins = np.array(list(self.keys()), dtype=object)
+        ifta_data_list = list(self.values())
+        lengths = [len(ifta_data) for ifta_data in ifta_data_list]
+        days = np.concatenate([np.frombuffer(ifta_data.days, dtype=np.intc) for ifta_data in ifta_data_list] + [np.empty(0, dtype=np.intc)])
+        seconds = np.concatenate([np.frombuffer(ifta_data.seconds, dtype=np.intc) for ifta_data in ifta_data_list] + [np.empty(0, dtype=np.intc)])
+        odometers = np.concatenate([np.frombuffer(ifta_data.odometers, dtype=np.intc) for ifta_data in ifta_data_list] + [np.empty(0, dtype=np.intc)])
+        jurisdictions = np.concatenate([np.frombuffer(ifta_data.jurisdictions, dtype=np.uint8) for ifta_data in ifta_data_list] + [np.empty(0, dtype=np.uint8)])
+
+        # Sort by VIN, ReadingDate, and ReadingTime, with missing dates and times last
+        vin_rank = np.repeat(np.argsort(np.argsort(vins)), lengths)
+        day_key = np.where(days == MISSING, np.iinfo(np.intc).max, days)
+        second_key = np.where(seconds == MISSING, np.iinfo(np.intc).max, seconds)
+        order = np.lexsort((second_key, day_key, vin_rank))
+
+        odometers = odometers[order]
+        missing_odometers = odometers == MISSING
+        df = pd.DataFrame({
+            'VIN': np.repeat(vins, lengths)[order],
+            'ReadingDate': to_dates(days[order]),
+            'ReadingTime': to_times(seconds[order]),
+            # unknown odometer readings are NaN, which makes the column float as it was with None readings
+            'Odometer': np.where(missing_odometers, np.nan, odometers) if missing_odometers.any() else odometers.astype(np.int64),
+            'Jurisdiction': np.array(JURISDICTION_TABLE, dtype=object)[jurisdictions[order]],
+        })
 
-        # Find the vins that have exactly two entries and the odometer reading and jurisdiction are the same for both
-        vins_to_remove = [vin for vin, group in grouped if len(group) == 2 and group['Odometer'].nunique() == 1 and group['Jurisdiction'].nunique() == 1]
+        self._frame = df
+        return df
 
-        return vins_to_remove
+    def get_vehicle_stats(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Count the entries, distinct odometer readings and distinct jurisdictions of each VIN,
+            flagging as nonmoving the vins with exactly two entries with the same odometer reading and jurisdiction
+        """
+        vehicle_stats = df.groupby('VIN').agg(
+            entries=('Odometer', 'size'),
+            odometers=('Odometer', 'nunique'),
+            jurisdictions=('Jurisdiction', 'nunique'),
+        )
+        vehicle_stats['nonmoving'] = (vehicle_stats['entries'] == 2) & (vehicle_stats['odometers'] == 1) & (vehicle_stats['jurisdictions'] == 1)
+        return vehicle_stats
+
+    def get_nonmoving_vehicles(self, df: pd.DataFrame) -> List[str]:
+        """
+        Retrieve all vins where the odometer reading does not change
+        """
+        vehicle_stats = self.get_vehicle_stats(df)
+        return vehicle_stats.index[vehicle_stats['nonmoving']].tolist()
 
     def remove_unchanged(self, df: pd.DataFrame, vins_to_remove: List[str]) -> None:
         """
@@ -120,7 +306,7 @@ class FleetDataFrame(pd.DataFrame):
         """
         Reduce the DataFrame to specific columns
         """
-        columns_to_keep = ['FuelTaxVin', 'FuelTaxEnterTime', 'FuelTaxExitTime', 'FuelTaxJurisdiction', 'FuelTaxEnterOdometer', 'FuelTaxExitOdometer']
+        columns_to_keep = FUEL_TAX_COLUMNS
         self[self.columns.intersection(columns_to_keep)]
     
     def split_date_time(self) -> None:
@@ -155,13 +341,39 @@ class FileManager:
         return None
 
     @staticmethod
-    def read_file(input_file: Any, data_type: str = 'path') -> pd.DataFrame:
+    def iter_sheet_rows(input_data: bytes, sheet_name: str) -> Iterator[tuple]:
+        """
+        Stream the rows of a worksheet as tuples of cell values, with None for empty cells
+        input_data: the contents of the input file
+        sheet_name: the name of the worksheet to read
+        """
+        if CalamineWorkbook is not None:
+            wb = CalamineWorkbook.from_filelike(io.BytesIO(input_data))
+            try:
+                for row in wb.get_sheet_by_name(sheet_name).iter_rows():
+                    yield tuple(None if value == '' else value for value in row)
+            finally:
+                wb.close()
+        else:
+            wb = load_workbook(filename=io.BytesIO(input_data), read_only=True, data_only=True)
+            try:
+                yield from wb[sheet_name].iter_rows(values_only=True)
+            finally:
+                wb.close()
+
+    @staticmethod
+    def read_file(input_file: Any, data_type: str = 'path', columns: List[str] = None) -> pd.DataFrame:
         """
         Read data from an Excel file and return a Pandas DataFrame
+        The 'Data' sheet is parsed once: rows before the 'DeviceName' header are skipped
+            and only the requested columns are kept
         input_file: path to the input file or the contents of the input file
         data_type: 'path' if input_file is a path, 'bytes' if input_file is the contents of the file
+        columns: the columns to read, FUEL_TAX_COLUMNS by default
         rtype: Pandas DataFrame
         """
+        if columns is None:
+            columns = FUEL_TAX_COLUMNS
         # If the input file is a path, read the data from the file
         if data_type == 'path':
             with open(input_file, 'rb') as f:
@@ -169,13 +381,30 @@ class FileManager:
         elif data_type != 'bytes':
             raise ValueError(f"Unknown data_type: {data_type}")
 
-        # Rest of the logic for finding the header row and reading data
-        header_row = FileManager.find_header_row(input_file, 'DeviceName')
-        if header_row is None:
+        rows = FileManager.iter_sheet_rows(input_file, 'Data')
+        for row in rows:
+            if 'DeviceName' in row:
+                header = list(row)
+                break
+        else:
             raise ValueError(f"Header 'DeviceName' not found in data")
 
-        df = pd.read_excel(io.BytesIO(input_file), sheet_name='Data', skiprows=header_row)
-        return df
+        missing_columns = [column for column in columns if column not in header]
+        if missing_columns:
+            raise ValueError(f"Columns {missing_columns} not found in data")
+        indexes = [header.index(column) for column in columns]
+
+        values = [[] for _ in columns]
+        for row in rows:
+            # skip blank rows, as pd.read_excel does
+            if not any(value is not None for value in row):
+                continue
+            for column_values, index in zip(values, indexes):
+                column_values.append(row[index] if index < len(row) else None)
+
+        # empty cells are NaN, as pd.read_excel returns them
+        df = pd.DataFrame({column: column_values for column, column_values in zip(columns, values)})
+        return df.fillna(np.nan)
 
 
 class FuelTaxProcessor:
@@ -189,53 +418,63 @@ class FuelTaxProcessor:
         self.data_type = data_type
 
     @staticmethod
-    def to_ifta_data_collection(df: pd.DataFrame) -> IftaDataCollection:
+    def to_ifta_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         """
-        Transform data from the input file into the desired output format
+        Transform data from the input file into the IFTA output format,
+            sorted by VIN, ReadingDate, ReadingTime
         """
-        # Create a dictionary to hold the IftaData objects
-        ifta_data_collection = IftaDataCollection()
-
-        for _, row in df.iterrows():
-            vin = str(row['FuelTaxVin'])
-            # skip rows with potentially empty VINs
-            if vin in ('nan', 'None', ''):
-                continue
-            enter_reading_date = row['EnterReadingDate']
-            enter_reading_time = row['EnterReadingTime']
-            exit_reading_time = row['ExitReadingTime']
-            try:
-                enter_odometer = round(row['FuelTaxEnterOdometer'])  # round to nearest whole number
-            except ValueError:
-                enter_odometer = None  # or some other default value
-            try:
-                exit_odometer = round(row['FuelTaxExitOdometer'])
-            except ValueError:
-                exit_odometer = None
-            jurisdiction = row['FuelTaxJurisdiction']
+        vins = df['FuelTaxVin'].astype(str)
+        jurisdictions = df['FuelTaxJurisdiction'].to_numpy(dtype=object)
+
+        # skip rows with potentially empty VINs or jurisdictions
+        keep = ~vins.isin(EMPTY_VINS).to_numpy()
+        keep &= ~np.equal(jurisdictions, None) & ~pd.Series(jurisdictions).isin(EMPTY_JURISDICTIONS).to_numpy()
+
+        enter_df = pd.DataFrame({
+            'VIN': vins.to_numpy()[keep],
+            'ReadingDate': df['EnterReadingDate'].to_numpy(dtype=object)[keep],
+            'ReadingTime': df['EnterReadingTime'].to_numpy(dtype=object)[keep],
+            'Odometer': FuelTaxProcessor.round_odometer(df['FuelTaxEnterOdometer'])[keep],
+            'Jurisdiction': jurisdictions[keep],
+        })
 
-            # if jurisdiction is empty, skip this row
-            if jurisdiction in ('nan', None, '', ' '):
-                continue
+        # Only add exit time if it is the last entry for this VIN on this day
+        #   (i.e. if the exit time is 00:00, then it is the last entry for the day)
+        last_of_day = np.equal(df['ExitReadingTime'].to_numpy(dtype=object)[keep], MIDNIGHT)
+        exit_df = enter_df[last_of_day].assign(
+            ReadingTime=END_OF_DAY,
+            Odometer=FuelTaxProcessor.round_odometer(df['FuelTaxExitOdometer'])[keep][last_of_day],
+        )
 
-            # Add this VIN to the IftaDataCollection if it doesn't already exist
-            ifta_data_collection.add_ifta_data(vin)
+        # Each exit entry directly follows its enter entry, so ties keep the input order
+        enter_df['_order'] = 2 * np.arange(len(enter_df))
+        exit_df['_order'] = 2 * np.flatnonzero(last_of_day) + 1
+        ifta_df = pd.concat([enter_df, exit_df], ignore_index=True)
+        ifta_df.sort_values(by=['VIN', 'ReadingDate', 'ReadingTime', '_order'], inplace=True)
+        ifta_df.drop(columns='_order', inplace=True)
+        ifta_df.reset_index(drop=True, inplace=True)
 
-            # Get the IftaData object for this VIN
-            ifta_data = ifta_data_collection.get_ifta_data(vin)
+        # Odometers stay integers unless a reading failed to round
+        if not ifta_df['Odometer'].isna().any():
+            ifta_df['Odometer'] = ifta_df['Odometer'].astype('int64')
 
-            # Add vin entry for enter time using enter odometer reading
-            ifta_data.add_entry(enter_reading_date, enter_reading_time, enter_odometer, jurisdiction)
+        return ifta_df
 
-            # Only add exit time if it is the last entry for this VIN on this day
-            #   (i.e. if the exit time is 00:00, then it is the last entry for the day)
-            if exit_reading_time == time(0, 0):
-                # Change time to 23:59 to suit IFTA requirements
-                exit_reading_time = time(23, 59)
-                # In this case, use exit_reading_time and exit_odometer
-                ifta_data.add_entry(enter_reading_date, exit_reading_time, exit_odometer, jurisdiction)
+    @staticmethod
+    def round_odometer(odometer: pd.Series) -> np.ndarray:
+        """
+        Round odometer readings to the nearest whole number, using NaN for readings that cannot be rounded
+        """
+        rounded = np.round(pd.to_numeric(odometer, errors='coerce').to_numpy(dtype='float64'))
+        rounded[~np.isfinite(rounded)] = np.nan
+        return rounded
 
-        return ifta_data_collection
+    @staticmethod
+    def to_ifta_data_collection(df: pd.DataFrame) -> IftaDataCollection:
+        """
+        Transform data from the input file into an IftaDataCollection
+        """
+        return IftaDataCollection.from_dataframe(FuelTaxProcessor.to_ifta_dataframe(df))
 
     def process_data(self) -> IftaDataCollection:
         """
@@ -0,0 +1,206 @@
+import contextvars
+import cProfile
+import datetime
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional: readable call-tree profiles, falls back to cProfile
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# the job run being recorded in this context, so services can add spans without it being passed down
+_current_run = contextvars.ContextVar('current_job_run', default=None)
+
+class Span:
+    """
+    Wall time, CPU time, row count and memory of one stage of a job
+    rss_mb is the resident set size when the stage ended and rss_delta_mb how much it grew (or shrank) during the stage;
+        unlike the process peak RSS, both compare between stages and between runs in a long-lived worker
+    extra: further counts of the stage (e.g. API calls and retries), reported alongside the timings
+    """
+    def __init__(self, stage: str, parent: str = None) -> None:
+        self.stage = stage
+        self.parent = parent
+        self.rows = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_mb = None
+        self.rss_delta_mb = None
+        self.extra: Dict[str, Any] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stage': self.stage,
+            'parent': self.parent,
+            'rows': self.rows,
+            'rows_per_s': round(self.rows / self.wall_seconds, 1) if self.rows and self.wall_seconds else None,
+            'wall_s': round(self.wall_seconds, 4),
+            'cpu_s': round(self.cpu_seconds, 4),
+            'rss_mb': round(self.rss_mb, 1) if self.rss_mb is not None else None,
+            'rss_delta_mb': round(self.rss_delta_mb, 1) if self.rss_delta_mb is not None else None,
+            **self.extra,
+        }
+
+class JobInstrumentation:
+    """
+    Collects the stage spans of a job run, logs each one as a JSON line and stores the run as a JobRun
+
+    Usage:
+        instrumentation = JobInstrumentation('run_daily_job', options)
+        with instrumentation.record(profile=False):
+            with span('fetch') as fetch:
+                ...
+                fetch.rows = len(details)
+    """
+    def __init__(self, command: str, options: Dict[str, Any] = None) -> None:
+        self.command = command
+        self.options = {key: value for key, value in (options or {}).items() if is_json_value(value)}
+        self.spans: List[Span] = []
+        self.open_spans: List[Span] = []
+        self.job_run = None
+        self.report_date = None
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[Span]:
+        current = Span(stage, self.open_spans[-1].stage if self.open_spans else None)
+        self.open_spans.append(current)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_start = get_rss_mb()
+        try:
+            yield current
+        finally:
+            current.wall_seconds = time.perf_counter() - wall_start
+            current.cpu_seconds = time.process_time() - cpu_start
+            current.rss_mb = get_rss_mb()
+            if current.rss_mb is not None and rss_start is not None:
+                current.rss_delta_mb = current.rss_mb - rss_start
+            self.open_spans.remove(current)
+            self.spans.append(current)
+            logger.info(json.dumps({'event': 'job_stage', 'command': self.command, 'job_run': self.job_run.pk if self.job_run else None, **current.to_dict()}))
+
+    @contextmanager
+    def record(self, profile: bool = False) -> Iterator['JobInstrumentation']:
+        '''
+        Makes this the current run, stores it as a JobRun and, if profile is set, profiles it
+        '''
+        from daily_compliance_job.models import JobRun
+
+        self.job_run = save_quietly(JobRun(command=self.command, options=self.options))
+        token = _current_run.set(self)
+        profiler = start_profiler() if profile else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        status, error = JobRun.SUCCEEDED, ''
+        try:
+            yield self
+        except BaseException as e:
+            status, error = JobRun.FAILED, f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            profile_path = stop_profiler(profiler, self.command) if profiler else ''
+            _current_run.reset(token)
+            wall_seconds = time.perf_counter() - wall_start
+            logger.info(json.dumps({'event': 'job_run', 'command': self.command, 'job_run': self.job_run.pk if self.job_run else None,
+                                    'status': status, 'wall_s': round(wall_seconds, 4), 'process_peak_rss_mb': round(get_peak_rss_mb(), 1), 'profile': profile_path}))
+            if self.job_run is not None:
+                self.job_run.status = status
+                self.job_run.error = error
+                self.job_run.report_date = self.report_date
+                self.job_run.finished_at = timezone.now()
+                self.job_run.wall_seconds = wall_seconds
+                self.job_run.cpu_seconds = time.process_time() - cpu_start
+                self.job_run.peak_rss_mb = get_peak_rss_mb()
+                self.job_run.stages = [span.to_dict() for span in self.spans]
+                self.job_run.profile_path = profile_path
+                save_quietly(self.job_run)
+
+@contextmanager
+def span(stage: str) -> Iterator[Span]:
+    '''
+    Times a stage of the current job run, or only measures it if no run is being recorded
+    '''
+    run = _current_run.get()
+    if run is None:
+        yield Span(stage)
+        return
+    with run.span(stage) as current:
+        yield current
+
+def current_run() -> JobInstrumentation:
+    return _current_run.get()
+
+def get_rss_mb() -> float:
+    '''
+    Current resident set size of the process, read from /proc on Linux; None where /proc is not available
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * resource.getpagesize() / (1024 * 1024)
+
+def get_peak_rss_mb() -> float:
+    '''
+    Highest resident set size the process has reached since it started, which in a Celery worker spans every job it ran
+    '''
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+def is_json_value(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+def save_quietly(job_run):
+    '''
+    Saves the JobRun, logging instead of failing the job if the database is unavailable
+    Returns the JobRun, or None if it could not be saved
+    '''
+    try:
+        job_run.save()
+        return job_run
+    except DatabaseError as e:
+        logger.warning(f'Could not save job run: {e}')
+        return None
+
+def start_profiler():
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profiler(profiler, command: str) -> str:
+    '''
+    Stops the profiler and writes its output to JOB_PROFILE_DIR
+    Returns the path of the profile: pyinstrument HTML, or cProfile stats for `python -m pstats` or snakeviz
+    '''
+    os.makedirs(settings.JOB_PROFILE_DIR, exist_ok=True)
+    base_path = os.path.join(settings.JOB_PROFILE_DIR, f'{command}_{datetime.datetime.now():%Y%m%d_%H%M%S}')
+    if Profiler is not None and isinstance(profiler, Profiler):
+        profiler.stop()
+        path = f'{base_path}.html'
+        with open(path, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = f'{base_path}.prof'
+        profiler.dump_stats(path)
+    logger.info(f'Wrote profile to {path}')
+    return path
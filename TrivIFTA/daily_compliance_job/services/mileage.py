@@ -0,0 +1,152 @@
+import datetime
+import logging
+from typing import Iterable, List, Tuple
+
+import pandas as pd
+from django.db import connection
+from django.db.models import Sum
+
+logger = logging.getLogger(__name__)
+
+MILEAGE_COLUMNS = ['VIN', 'Jurisdiction', 'Miles']
+DAILY_MILEAGE_COLUMNS = ['Date', 'VIN', 'Jurisdiction', 'Miles']
+# first key of the Postgres advisory locks taken on IFTA quarters, so they do not clash with other advisory locks
+QUARTER_LOCK_NAMESPACE = 1_722_000
+
+def quarter_dates(year: int, quarter: int) -> Tuple[datetime.date, datetime.date]:
+    '''
+    Returns the first and last day of an IFTA quarter (1: January to March, ..., 4: October to December)
+    '''
+    if quarter not in (1, 2, 3, 4):
+        raise ValueError(f'quarter must be 1, 2, 3 or 4, got {quarter}')
+    first_day = datetime.date(year, 3 * quarter - 2, 1)
+    next_quarter = datetime.date(year + 1, 1, 1) if quarter == 4 else datetime.date(year, 3 * quarter + 1, 1)
+    return first_day, next_quarter - datetime.timedelta(days=1)
+
+def get_quarter(date: datetime.date) -> Tuple[int, int]:
+    return date.year, (date.month - 1) // 3 + 1
+
+def parse_quarter(value: str) -> Tuple[int, int]:
+    '''
+    Parses a quarter written as YYYY-Q<n> or YYYYQ<n>, e.g. 2024-Q1
+    '''
+    year, separator, quarter = value.upper().replace('-', '').partition('Q')
+    if not separator or not year.isdigit() or not quarter.isdigit():
+        raise ValueError(f'Invalid quarter {value}, expected YYYY-Q<n>')
+    quarter_dates(int(year), int(quarter))
+    return int(year), int(quarter)
+
+def lock_quarter(year: int, quarter: int) -> None:
+    '''
+    Locks an IFTA quarter's rollups until the end of the current transaction, so their refreshes run one at a time
+    Only Postgres has advisory locks; SQLite already lets a single transaction write at a time
+    '''
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [QUARTER_LOCK_NAMESPACE, year * 10 + quarter])
+
+def get_mileage(from_date: datetime.date, to_date: datetime.date, vin: str = None, jurisdiction: str = None, by_date: bool = False) -> pd.DataFrame:
+    '''
+    Miles driven per VIN per jurisdiction between from_date and to_date (inclusive), computed in the database
+        from the raw IftaEntry readings
+
+    Each entry is a reading taken when a vehicle entered a jurisdiction, so the miles of a segment are the
+        odometer change from one reading of a VIN to the next (ordered by time), driven in the jurisdiction of the
+        first reading. LAG pairs every reading with the one before it on the same day: every day ends with a 23:59
+        reading at the midnight odometer, so segments never need to cross days, and the miles of a day only depend
+        on the entries of that day. Consecutive ranges add up to the total.
+    Segments whose odometer goes backwards are left out and logged.
+
+    by_date: also group by the day of the segment (the DailyMileage rollup)
+    Returns a frame with MILEAGE_COLUMNS (DAILY_MILEAGE_COLUMNS if by_date), sorted by date, VIN and jurisdiction
+    '''
+    from daily_compliance_job.models import IftaEntry
+
+    table = connection.ops.quote_name(IftaEntry._meta.db_table)
+    vin_filter = 'AND vin = %s' if vin else ''
+    jurisdiction_filter = 'AND jurisdiction = %s' if jurisdiction else ''
+    group_by = 'reading_date, vin, jurisdiction' if by_date else 'vin, jurisdiction'
+    # the VIN filter can go inside the window, as segments never span VINs; the jurisdiction is the segment's start
+    sql = f'''
+        WITH segments AS (
+            SELECT vin,
+                   reading_date,
+                   LAG(jurisdiction) OVER readings AS jurisdiction,
+                   odometer - LAG(odometer) OVER readings AS miles
+            FROM {table}
+            WHERE reading_date >= %s AND reading_date <= %s {vin_filter}
+            WINDOW readings AS (PARTITION BY vin, reading_date ORDER BY reading_time)
+        )
+        SELECT {group_by}, SUM(CASE WHEN miles >= 0 THEN miles ELSE 0 END), SUM(CASE WHEN miles < 0 THEN 1 ELSE 0 END)
+        FROM segments
+        WHERE miles IS NOT NULL {jurisdiction_filter}
+        GROUP BY {group_by}
+        ORDER BY {group_by}
+    '''
+    params = [from_date, to_date]
+    if vin:
+        params.append(vin)
+    if jurisdiction:
+        params.append(jurisdiction)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    num_backwards = sum(row[-1] for row in rows)
+    if num_backwards:
+        logger.warning(f'Skipped {num_backwards} segments with a decreasing odometer between {from_date} and {to_date}')
+    columns = DAILY_MILEAGE_COLUMNS if by_date else MILEAGE_COLUMNS
+    mileage = pd.DataFrame([row[:-1] for row in rows], columns=columns).astype({'Miles': 'int64'})
+    if by_date:
+        # SQLite returns dates as strings
+        mileage['Date'] = pd.to_datetime(mileage['Date']).dt.date
+    return mileage
+
+def get_quarter_mileage(year: int, quarter: int, vin: str = None, jurisdiction: str = None) -> pd.DataFrame:
+    '''
+    Miles driven per VIN per jurisdiction in an IFTA quarter, read from the DailyMileage rollup
+    Returns a frame with MILEAGE_COLUMNS, sorted by VIN and jurisdiction
+    '''
+    from daily_compliance_job.models import DailyMileage
+
+    from_date, to_date = quarter_dates(year, quarter)
+    rollups = DailyMileage.objects.filter(date__gte=from_date, date__lte=to_date)
+    if vin:
+        rollups = rollups.filter(vin=vin)
+    if jurisdiction:
+        rollups = rollups.filter(jurisdiction=jurisdiction)
+    rows = rollups.values_list('vin', 'jurisdiction').annotate(total=Sum('miles')).order_by('vin', 'jurisdiction')
+    return pd.DataFrame(list(rows), columns=MILEAGE_COLUMNS).astype({'Miles': 'int64'})
+
+def get_quarter_totals(year: int, quarter: int, jurisdiction: str = None) -> pd.DataFrame:
+    '''
+    Fleet miles per jurisdiction in an IFTA quarter, read from the QuarterlyMileage rollup
+    '''
+    from daily_compliance_job.models import QuarterlyMileage
+
+    totals = QuarterlyMileage.objects.filter(year=year, quarter=quarter)
+    if jurisdiction:
+        totals = totals.filter(jurisdiction=jurisdiction)
+    return pd.DataFrame(list(totals.order_by('jurisdiction').values_list('jurisdiction', 'miles')), columns=['Jurisdiction', 'Miles']).astype({'Miles': 'int64'})
+
+def get_jurisdiction_totals(mileage: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Fleet miles per jurisdiction, the figures that go on the IFTA return
+    '''
+    return mileage.groupby('Jurisdiction', as_index=False)['Miles'].sum().sort_values('Jurisdiction', ignore_index=True)
+
+def to_date_ranges(dates: Iterable[datetime.date]) -> List[Tuple[datetime.date, datetime.date]]:
+    '''
+    Groups dates into runs of consecutive days, returned as (first, last) pairs
+    '''
+    ranges = []
+    for date in sorted(set(dates)):
+        if ranges and date - ranges[-1][1] == datetime.timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], date)
+        else:
+            ranges.append((date, date))
+    return ranges
+
+def to_records(mileage: pd.DataFrame) -> List[dict]:
+    return [{'vin': vin, 'jurisdiction': jurisdiction, 'miles': int(miles)} for vin, jurisdiction, miles in mileage[MILEAGE_COLUMNS].itertuples(index=False, name=None)]
@@ -0,0 +1,190 @@
+import datetime
+import logging
+import threading
+from typing import Iterable, List
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from fsspec.core import url_to_fs
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ['id', 'vin', 'reading_date', 'reading_time', 'odometer', 'jurisdiction']
+ARCHIVE_COMPRESSION = 'zstd'
+
+# months whose partition this process has already created, so saves do not repeat the DDL
+_created_months = set()
+_created_months_lock = threading.Lock()
+
+class ArchivedMonthException(Exception):
+    """
+    Raised when entries are saved to a month that was archived, as its rollups and rows would go out of sync
+    """
+
+def is_partitioned() -> bool:
+    '''
+    IftaEntry is range partitioned by month on Postgres (see migration 0008); other databases keep a single table
+    '''
+    return connection.vendor == 'postgresql'
+
+def month_start(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+def parse_month(value: str) -> datetime.date:
+    '''
+    Parses a month written as YYYY-MM
+    '''
+    return datetime.datetime.strptime(value, '%Y-%m').date()
+
+def partition_name(table: str, month: datetime.date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+def create_partition(month: datetime.date, table: str = None) -> bool:
+    '''
+    Creates the partition of IftaEntry holding the month's entries, if it does not exist yet
+    Returns False without doing anything when the database is not partitioned
+    '''
+    from daily_compliance_job.models import IftaEntry
+
+    if not is_partitioned():
+        return False
+    table = table or IftaEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {connection.ops.quote_name(partition_name(IftaEntry._meta.db_table, month))} '
+            f'PARTITION OF {connection.ops.quote_name(table)} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    return True
+
+def create_partitions(from_month: datetime.date, to_month: datetime.date, table: str = None) -> List[datetime.date]:
+    '''
+    Creates the partitions of every month from from_month to to_month (inclusive)
+    Returns the months created or already there
+    '''
+    months = []
+    month = month_start(from_month)
+    while month <= to_month:
+        if create_partition(month, table):
+            months.append(month)
+        month = add_months(month, 1)
+    return months
+
+def create_future_partitions(months_ahead: int = None) -> List[datetime.date]:
+    '''
+    Creates the partitions of the current month and the IFTA_PARTITION_MONTHS_AHEAD months after it
+    '''
+    months_ahead = months_ahead if months_ahead is not None else settings.IFTA_PARTITION_MONTHS_AHEAD
+    this_month = month_start(datetime.date.today())
+    return create_partitions(this_month, add_months(this_month, months_ahead))
+
+def prepare_months(dates: Iterable[datetime.date]) -> None:
+    '''
+    Makes sure entries can be saved for the dates: their months are not archived and have a partition
+    Raises ArchivedMonthException if a month is archived
+    '''
+    from daily_compliance_job.models import ArchivedMonth
+
+    months = {month_start(date) for date in dates}
+    archived = sorted(ArchivedMonth.objects.filter(month__in=months).values_list('month', flat=True))
+    if archived:
+        raise ArchivedMonthException(f'Entries of archived months {", ".join(f"{month:%Y-%m}" for month in archived)} cannot be saved, '
+                                     f'reload them first with manage.py ifta_partitions --reload')
+    with _created_months_lock:
+        new_months = sorted(months - _created_months)
+        for month in new_months:
+            create_partition(month)
+    if new_months:
+        # a rolled back transaction takes the CREATE TABLE with it, so the months are only remembered once it commits
+        transaction.on_commit(lambda: remember_months(new_months))
+
+def remember_months(months: Iterable[datetime.date]) -> None:
+    with _created_months_lock:
+        _created_months.update(months)
+
+def get_archive_path(month: datetime.date) -> str:
+    return f"{str(settings.IFTA_ARCHIVE_DIR).rstrip('/')}/iftaentry_{month:%Y_%m}.parquet"
+
+def get_cold_months(hot_months: int = None) -> List[datetime.date]:
+    '''
+    Returns the months with entries that are older than the IFTA_ENTRY_HOT_MONTHS months up to and including this one
+    '''
+    from daily_compliance_job.models import IftaEntry
+
+    hot_months = hot_months if hot_months is not None else settings.IFTA_ENTRY_HOT_MONTHS
+    first_hot_month = add_months(month_start(datetime.date.today()), 1 - hot_months)
+    return [month for month in IftaEntry.objects.filter(reading_date__lt=first_hot_month).dates('reading_date', 'month')]
+
+def archive_month(month: datetime.date) -> int:
+    '''
+    Moves the month's entries to a zstd-compressed Parquet file under IFTA_ARCHIVE_DIR, then drops its partition
+        (or deletes its rows when the database is not partitioned)
+    The mileage rollups of the month are kept, so quarterly reports still cover it
+    Returns the number of entries archived
+    '''
+    from daily_compliance_job.models import ArchivedMonth, IftaEntry
+    from daily_compliance_job.services.entry_cache import EntryCache
+
+    next_month = add_months(month, 1)
+    partition = connection.ops.quote_name(partition_name(IftaEntry._meta.db_table, month))
+    entries = IftaEntry.objects.filter(reading_date__gte=month, reading_date__lt=next_month)
+    with transaction.atomic():
+        if is_partitioned():
+            # entries saved to the month while it is archived would be dropped with the partition
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {partition} IN SHARE MODE')
+        df = pd.DataFrame(list(entries.order_by('reading_date', 'vin', 'reading_time').values_list(*ARCHIVE_COLUMNS)), columns=ARCHIVE_COLUMNS)
+
+        path = get_archive_path(month)
+        fs, fs_path = url_to_fs(path)
+        fs.makedirs(fs_path.rsplit('/', 1)[0], exist_ok=True)
+        # write next to the final file and move it into place, so a failed write never leaves a partial archive
+        fs_temp_path = f'{fs_path}.tmp'
+        with fs.open(fs_temp_path, 'wb') as f:
+            df.to_parquet(f, compression=ARCHIVE_COMPRESSION, index=False)
+        fs.mv(fs_temp_path, fs_path)
+
+        ArchivedMonth.objects.update_or_create(month=month, defaults={'path': path, 'rows': len(df)})
+        if is_partitioned():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {partition}')
+            with _created_months_lock:
+                _created_months.discard(month)
+        else:
+            entries._raw_delete(entries.db)
+
+    EntryCache().invalidate(month + datetime.timedelta(days=offset) for offset in range((next_month - month).days))
+    logger.info(f'Archived {len(df)} entries of {month:%Y-%m} to {path}')
+    return len(df)
+
+def reload_month(month: datetime.date, batch_size: int = None) -> int:
+    '''
+    Loads an archived month's entries back into the database from its Parquet file
+    The archived ids are restored, and were handed out by the id sequence before, so they cannot collide
+    The file is kept, so the month can be archived again without rewriting it
+    Returns the number of entries loaded
+    '''
+    from daily_compliance_job.models import ArchivedMonth, IftaEntry
+    from daily_compliance_job.services.entry_cache import EntryCache
+
+    batch_size = batch_size or settings.IFTA_ENTRY_BATCH_SIZE
+    archived_month = ArchivedMonth.objects.get(month=month)
+    fs, fs_path = url_to_fs(archived_month.path)
+    with fs.open(fs_path, 'rb') as f:
+        df = pd.read_parquet(f)
+
+    create_partition(month)
+    entries = [IftaEntry(**row) for row in df[ARCHIVE_COLUMNS].to_dict('records')]
+    with transaction.atomic():
+        IftaEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+        archived_month.delete()
+
+    next_month = add_months(month, 1)
+    EntryCache().invalidate(month + datetime.timedelta(days=offset) for offset in range((next_month - month).days))
+    logger.info(f'Reloaded {len(entries)} entries of {month:%Y-%m} from {archived_month.path}')
+    return len(entries)
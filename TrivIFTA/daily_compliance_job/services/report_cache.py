@@ -0,0 +1,98 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import List, Optional
+
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the processing pipeline changes the report output, so old entries are ignored
+PROCESSING_VERSION = 1
+
+class ReportCache:
+    """
+    On-disk Parquet cache of processed IFTA report frames
+
+    Entries are content-addressed by report date range, device groups and PROCESSING_VERSION.
+    Entries older than max_age seconds are ignored, and the least recently used entries are
+        evicted once the cache grows past max_bytes.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = None, max_age: int = None) -> None:
+        self.directory = str(directory or settings.REPORT_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else settings.REPORT_CACHE_MAX_BYTES
+        self.max_age = max_age if max_age is not None else settings.REPORT_CACHE_MAX_AGE
+
+    def key(self, from_date: datetime.datetime, to_date: datetime.datetime, group_ids: List[str]) -> str:
+        content = json.dumps({
+            'from_date': from_date.isoformat(),
+            'to_date': to_date.isoformat(),
+            'group_ids': sorted(group_ids),
+            'version': PROCESSING_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def job_key(self) -> str:
+        '''
+        A new key for the report of a single job run, which the job status API reads back
+        '''
+        return uuid.uuid4().hex
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.parquet')
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        '''
+        Returns the cached frame for the key, or None if there is no fresh entry
+        '''
+        path = self.path(key)
+        try:
+            # the modification time is when the entry was written, the access time is when it was last used
+            written_at = os.path.getmtime(path)
+            if time.time() - written_at > self.max_age:
+                return None
+            df = pd.read_parquet(path)
+            os.utime(path, (time.time(), written_at))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f'Ignoring unreadable report cache entry {path}: {e}')
+            return None
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        '''
+        Stores the frame under the key, then evicts old entries if the cache is over its size limit
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        try:
+            # write to a temporary file first so readers never see a partial entry
+            df.to_parquet(f'{path}.{os.getpid()}.tmp', index=False)
+            os.replace(f'{path}.{os.getpid()}.tmp', path)
+        except Exception as e:
+            logger.warning(f'Failed to write report cache entry {path}: {e}')
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.parquet'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_atime, stat.st_size, name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -1,62 +1,360 @@
 import paramiko
 from django.conf import settings
 import socks
+import hashlib
+import logging
 import os
+import queue
+import socket
+import threading
+import time
+import pandas as pd
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Tuple, Union
 from urllib.parse import urlparse
 
-class GeotabSFTP:
-    def __init__(self, host: str = settings.SFTP_HOST, port: int = 22):
+logger = logging.getLogger(__name__)
+
+CSV_CHUNK_ROWS = 50_000 # rows rendered per CSV chunk when streaming a dataframe
+SFTP_BUFFER_SIZE = 1024 * 1024
+UPLOAD_QUEUE_CHUNKS = 4 # rendered chunks waiting to be written, bounding the memory used by an upload
+CONNECT_RETRIES = 3 # attempts per operation, reconnecting in between
+RETRY_BACKOFF = 1.0 # seconds before the first retry, doubled for each one after
+# errors that mean the connection is gone, rather than a problem with the file itself
+CONNECTION_ERRORS = (paramiko.SSHException, socks.ProxyError, ConnectionError, socket.timeout, EOFError)
+
+class UploadResult(NamedTuple):
+    filename: str
+    bytes_written: int
+    sha256: str
+
+class SFTPConnection:
+    """
+    One SSH transport and SFTP session to the server, tunnelled through the QuotaGuard SOCKS5 proxy if one is configured
+    """
+    def __init__(self, host: str, port: int, username: str, password: str, proxy_url: str = None, keepalive: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.proxy_url = proxy_url
+
+        if self.proxy_url:
+            # Parse the proxy URL
+            parsed_url = urlparse(self.proxy_url)
+            proxy_host = parsed_url.hostname
+            proxy_port = parsed_url.port
+            proxy_username = parsed_url.username
+            proxy_password = parsed_url.password
+
+            # Set up the SOCKS5 proxy
+            self.sock = socks.socksocket()
+            self.sock.set_proxy(
+                proxy_type=socks.SOCKS5,
+                addr=proxy_host,
+                port=proxy_port,
+                username=proxy_username,
+                password=proxy_password
+            )
+
+            # Connect to the proxy server
+            logger.info(f'Connecting to {self.host}:{self.port} through proxy server {proxy_host}:{proxy_port}')
+            self.sock.connect((self.host, self.port))
+        else:
+            self.sock = socket.create_connection((self.host, self.port))
+
+        try:
+            # Create a paramiko transport object using the proxy-connected socket
+            self.transport = paramiko.Transport(self.sock)
+
+            # Connect to the SFTP server
+            self.transport.connect(username=username, password=password)
+            if keepalive:
+                # keep the proxy and any NAT from dropping the idle connection
+                self.transport.set_keepalive(keepalive)
+
+            # Open an SFTP session
+            self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+            logger.info(f'Opened SFTP session to {self.host}:{self.port}')
+        except Exception:
+            self.sock.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        '''
+        Checks the connection with a round trip to the server
+        '''
+        if not self.transport.is_active():
+            return False
+        try:
+            self.sftp.normalize('.')
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            self.sftp.close()
+        finally:
+            self.transport.close()
+
+class SFTPConnectionPool:
+    """
+    Keeps SFTP connections open between uploads so each file does not pay the proxy connect and SSH handshake
+
+    Connections idle for more than idle_timeout seconds are closed, and connections idle for more than
+        health_check_after seconds are checked with a round trip before they are reused.
+    Operations that lose their connection are retried on a new one, backing off between attempts.
+    """
+    def __init__(self, host: str, port: int, username: str, password: str, proxy_url: str = None,
+                 max_size: int = None, idle_timeout: int = None, keepalive: int = None, health_check_after: int = 30,
+                 retries: int = CONNECT_RETRIES, backoff: float = RETRY_BACKOFF) -> None:
         self.host = host
         self.port = port
-        self.proxy_url = os.environ.get('QUOTAGUARDSTATIC_URL')
-
-        # Parse the proxy URL
-        parsed_url = urlparse(self.proxy_url)
-        proxy_host = parsed_url.hostname
-        proxy_port = parsed_url.port
-        proxy_username = parsed_url.username
-        proxy_password = parsed_url.password
-
-        print(f"Parsed QuotaGuard URL: host={proxy_host}, port={proxy_port}, username={proxy_username}")
-
-        # Set up the SOCKS5 proxy
-        self.sock = socks.socksocket()
-        self.sock.set_proxy(
-            proxy_type=socks.SOCKS5,
-            addr=proxy_host,
-            port=proxy_port,
-            username=proxy_username,
-            password=proxy_password
-        )
-
-        # Connect to the proxy server
-        print(f"Connecting to proxy server {proxy_host}:{proxy_port}")
-        self.sock.connect((self.host, self.port))
-        print(f"Connected to proxy server {proxy_host}:{proxy_port}")
-
-        # Create a paramiko transport object using the proxy-connected socket
-        self.transport = paramiko.Transport(self.sock)
-
-        # Connect to the SFTP server
-        print(f"Connecting to SFTP server {self.host}:{self.port}")
-        self.transport.connect(username=settings.SFTP_USERNAME, password=settings.SFTP_KEY)
-        print(f"Connected to SFTP server {self.host}:{self.port}")
-
-        # Open an SFTP session
-        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
-        print("Opened SFTP session")
-
-    def send_to_sftp(self, csv_data: str, filename: str) -> None:
+        self.username = username
+        self.password = password
+        self.proxy_url = proxy_url
+        self.max_size = max_size if max_size is not None else settings.SFTP_POOL_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else settings.SFTP_IDLE_TIMEOUT
+        self.keepalive = keepalive if keepalive is not None else settings.SFTP_KEEPALIVE
+        self.health_check_after = health_check_after
+        self.retries = retries
+        self.backoff = backoff
+        self.idle = []
+        self.num_open = 0
+        self.connects = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> SFTPConnection:
+        '''
+        Returns a healthy idle connection, or a new one if none is idle and the pool is not full
+        '''
+        with self.condition:
+            self.close_idle()
+            while not self.idle and self.num_open >= self.max_size:
+                self.condition.wait()
+            if not self.idle:
+                self.num_open += 1
+                connection = None
+            else:
+                connection = self.idle.pop()
+
+        if connection is not None:
+            if time.monotonic() - connection.last_used < self.health_check_after or connection.is_healthy():
+                return connection
+            logger.info(f'Reconnecting stale SFTP connection to {self.host}:{self.port}')
+            connection.close()
+
+        try:
+            self.connects += 1
+            return SFTPConnection(self.host, self.port, self.username, self.password, self.proxy_url, self.keepalive)
+        except Exception:
+            self.discard(None)
+            raise
+
+    def release(self, connection: SFTPConnection) -> None:
+        connection.last_used = time.monotonic()
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection: SFTPConnection) -> None:
+        '''
+        Closes a broken connection and frees its place in the pool
+        '''
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        with self.condition:
+            self.num_open -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[SFTPConnection]:
+        connection = self.acquire()
+        try:
+            yield connection
+        except CONNECTION_ERRORS:
+            self.discard(connection)
+            raise
+        except BaseException:
+            # the operation failed but the connection may still be fine
+            if connection.transport.is_active():
+                self.release(connection)
+            else:
+                self.discard(connection)
+            raise
+        self.release(connection)
+
+    def run(self, operation: Callable[[SFTPConnection], Any]) -> Any:
+        '''
+        Runs the operation with a pooled connection, retrying on a new connection if the connection fails
+        '''
+        for attempt in range(self.retries):
+            try:
+                with self.connection() as connection:
+                    return operation(connection)
+            except CONNECTION_ERRORS as e:
+                if attempt == self.retries - 1:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f'SFTP connection to {self.host}:{self.port} failed ({e}), retrying in {delay}s')
+                time.sleep(delay)
+
+    def close_idle(self, max_idle: float = None) -> None:
+        '''
+        Closes connections idle for longer than max_idle seconds (the idle timeout by default)
+        '''
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        with self.condition:
+            now = time.monotonic()
+            expired = [connection for connection in self.idle if now - connection.last_used > max_idle]
+            self.idle = [connection for connection in self.idle if connection not in expired]
+            self.num_open -= len(expired)
+        for connection in expired:
+            connection.close()
+
+    def close(self) -> None:
+        self.close_idle(max_idle=-1)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host: str, port: int, username: str, password: str, proxy_url: str = None) -> SFTPConnectionPool:
+    '''
+    Returns the process-wide pool for the server and credentials
+    '''
+    key = (host, port, username, password, proxy_url)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SFTPConnectionPool(host, port, username, password, proxy_url)
+        return _pools[key]
+
+def close_pools() -> None:
+    '''
+    Closes the idle connections of every pool, so they do not stay open through the proxy between jobs
+    '''
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+class GeotabSFTP:
+    """
+    Uploads reports to the SFTP server over pooled connections
+    The server, credentials and QUOTAGUARDSTATIC_URL proxy default to the current settings and environment;
+        pass proxy_url='' to connect without the proxy
+    """
+    def __init__(self, host: str = None, port: int = 22, username: str = None, password: str = None, proxy_url: str = None, pool: SFTPConnectionPool = None):
+        self.host = host if host is not None else settings.SFTP_HOST
+        self.port = port
+        username = username if username is not None else settings.SFTP_USERNAME
+        password = password if password is not None else settings.SFTP_KEY
+        proxy_url = proxy_url if proxy_url is not None else os.environ.get('QUOTAGUARDSTATIC_URL')
+        self.pool = pool or get_pool(self.host, self.port, username, password, proxy_url)
+
+    def send_to_sftp(self, csv_data: str, filename: str) -> UploadResult:
         '''
         Sends the data to the SFTP server
         '''
         try:
-            with self.sftp.open(filename, 'w') as file:
-                file.write(csv_data)
-        except Exception as e:
-            # if unsuccessful, show an error message
-            print(f'Failed to send {filename} to SFTP server.\n\t{e}')
+            return self.pool.run(lambda connection: write_file(connection, filename, [csv_data.encode('utf-8')]))
+        except Exception:
+            logger.exception(f'Failed to send {filename} to SFTP server')
             raise
-        finally:
-            self.sftp.close()
-            self.transport.close()
\ No newline at end of file
+
+    def send_dataframe_to_sftp(self, df: pd.DataFrame, filename: str, chunk_rows: int = CSV_CHUNK_ROWS) -> UploadResult:
+        '''
+        Streams the dataframe to the SFTP server as CSV, without rendering the whole file in memory
+        The CSV is rendered in chunks on a background thread while earlier chunks are written through a pipelined file
+        Returns the size and SHA-256 checksum of the uploaded file
+        '''
+        try:
+            return self.pool.run(lambda connection: upload_dataframe(connection, df, filename, chunk_rows))
+        except Exception:
+            logger.exception(f'Failed to send {filename} to SFTP server')
+            raise
+
+    def send_files(self, files: Iterable[Tuple[str, Union[pd.DataFrame, str]]]) -> List[UploadResult]:
+        '''
+        Sends many (filename, dataframe or CSV text) files, reusing one pooled session for all of them
+        '''
+        return [
+            self.send_dataframe_to_sftp(data, filename) if isinstance(data, pd.DataFrame) else self.send_to_sftp(data, filename)
+            for filename, data in files
+        ]
+
+def write_file(connection: SFTPConnection, filename: str, chunks: Iterable[bytes]) -> UploadResult:
+    '''
+    Writes the chunks to the file through a pipelined handle and verifies the upload against the remote file size
+    '''
+    digest = hashlib.sha256()
+    bytes_written = 0
+    with connection.sftp.open(filename, 'wb', bufsize=SFTP_BUFFER_SIZE) as file:
+        # don't wait for the server to acknowledge each write
+        file.set_pipelined(True)
+        for chunk in chunks:
+            file.write(chunk)
+            digest.update(chunk)
+            bytes_written += len(chunk)
+
+    remote_size = connection.sftp.stat(filename).st_size
+    if remote_size != bytes_written:
+        raise IOError(f'Uploaded {bytes_written} bytes of {filename} but the server has {remote_size}')
+    result = UploadResult(filename, bytes_written, digest.hexdigest())
+    logger.info(f'Uploaded {filename}: {result.bytes_written} bytes, sha256 {result.sha256}')
+    return result
+
+def upload_dataframe(connection: SFTPConnection, df: pd.DataFrame, filename: str, chunk_rows: int = CSV_CHUNK_ROWS) -> UploadResult:
+    chunks = queue.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+    stop = threading.Event()
+    renderer = threading.Thread(target=render_csv_chunks, args=(df, chunk_rows, chunks, stop), daemon=True)
+    renderer.start()
+    try:
+        return write_file(connection, filename, iter_queue(chunks))
+    finally:
+        stop.set()
+        renderer.join()
+
+def iter_csv_chunks(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[bytes]:
+    '''
+    Renders the dataframe as UTF-8 CSV, chunk_rows rows at a time, matching df.to_csv(index=False)
+    '''
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode('utf-8')
+
+def render_csv_chunks(df: pd.DataFrame, chunk_rows: int, chunks: queue.Queue, stop: threading.Event) -> None:
+    '''
+    Puts the CSV chunks of the dataframe on the queue, followed by None, or the exception if rendering fails
+    Gives up as soon as stop is set, so a failed upload does not leave this thread blocked on a full queue
+    '''
+    try:
+        for chunk in iter_csv_chunks(df, chunk_rows):
+            if not put_unless_stopped(chunks, chunk, stop):
+                return
+    except Exception as e:
+        put_unless_stopped(chunks, e, stop)
+        return
+    put_unless_stopped(chunks, None, stop)
+
+def put_unless_stopped(chunks: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def iter_queue(chunks: queue.Queue) -> Iterator[bytes]:
+    '''
+    Yields the chunks put by render_csv_chunks until the final None, re-raising a rendering error
+    '''
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
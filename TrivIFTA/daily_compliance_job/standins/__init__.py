@@ -0,0 +1,4 @@
+"""
+Local stand-ins for the external services the daily compliance job talks to,
+for exercising the services without production credentials or network access
+"""
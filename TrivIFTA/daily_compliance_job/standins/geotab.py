@@ -0,0 +1,206 @@
+import datetime
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+from daily_compliance_job.benchmarks.fleet import SyntheticFleet
+from daily_compliance_job.standins.tls import make_tls_context
+
+# search parameters sent as ISO 8601 strings that the fleet needs as datetimes
+DATE_PARAMETERS = ('fromDate', 'toDate')
+
+class GeotabError(Exception):
+    """
+    Error returned to the client as a MyGeotab JSON-RPC error, which mygeotab raises as MyGeotabException
+    """
+    def __init__(self, name: str, message: str) -> None:
+        super().__init__(message)
+        self.name = name
+        self.message = message
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'name': 'JSONRPCError', 'message': self.message, 'errors': [{'name': self.name, 'message': self.message}]}
+
+class GeotabRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers JSON-RPC calls posted to /apiv1
+    """
+    server_version = 'GeotabStandIn/1.0'
+
+    def do_POST(self) -> None:
+        if self.path.rstrip('/') != '/apiv1':
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        standin = self.server.standin
+        status, body = standin.handle(request.get('method', None), request.get('params', None) or {})
+        content = json.dumps({'id': request.get('id', -1), 'jsonrpc': '2.0', **body}, default=to_iso_datetime).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        # keep benchmark output clean
+        pass
+
+class GeotabStandIn:
+    """
+    Local MyGeotab JSON-RPC server over HTTPS answering Authenticate, Get (Device, FuelTaxDetail, Group),
+        GetFeed (Device, FuelTaxDetail) and ExecuteMultiCall from a SyntheticFleet, for load testing the ingestion path offline
+
+    latency: seconds added to every call, plus up to jitter seconds at random
+    rate_limit: calls allowed per user in any rate_limit_period seconds, answered with OverLimitException beyond that
+        (each call of an ExecuteMultiCall counts)
+    error_rate: share of calls answered with error_name instead of a result
+    http_error_rate: share of calls answered with an HTTP 503 instead of a result
+
+    mygeotab only speaks HTTPS, so the stand-in serves a self-signed certificate written to server.ca_bundle.
+        Point MyGeotabAPI at it with MYGEOTAB_SERVER=<server.server> and MYGEOTAB_CA_BUNDLE=<server.ca_bundle>,
+        or MyGeotabAPI(server=server.server, ca_bundle=server.ca_bundle).
+
+    Usage:
+        with GeotabStandIn(SyntheticFleet(1000), latency=0.05, rate_limit=100) as server:
+            api = MyGeotabAPI(server.username, server.password, server.database, server=server.server, ca_bundle=server.ca_bundle)
+            ...
+            server.calls, server.throttled, server.errors
+    """
+    def __init__(self, fleet: SyntheticFleet = None, username: str = 'ifta@example.com', password: str = 'ifta', database: str = 'trivista',
+                 host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0, rate_limit: int = None, rate_limit_period: float = 60.0,
+                 error_rate: float = 0.0, error_name: str = 'DbUnavailableException', http_error_rate: float = 0.0, seed: int = 0) -> None:
+        self.fleet = fleet or SyntheticFleet(100)
+        self.username = username
+        self.password = password
+        self.database = database
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        self.error_rate = error_rate
+        self.error_name = error_name
+        self.http_error_rate = http_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.recent_calls = {}  # username -> times of the calls in the current rate limit period
+        self.calls = Counter()  # 'Method' or 'Method:TypeName' -> calls answered with a result
+        self.throttled = 0
+        self.errors = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), GeotabRequestHandler)
+        self.httpd.daemon_threads = True
+        self.tls_dir = tempfile.TemporaryDirectory()
+        self.ca_bundle = os.path.join(self.tls_dir.name, 'geotab-standin.pem')
+        self.httpd.socket = make_tls_context(host, self.ca_bundle).wrap_socket(self.httpd.socket, server_side=True)
+        self.httpd.standin = self
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = None
+
+    def __enter__(self) -> 'GeotabStandIn':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def server(self) -> str:
+        return f'{self.host}:{self.port}'
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.tls_dir.cleanup()
+
+    def handle(self, method: str, params: Dict[str, Any]):
+        '''
+        Returns the HTTP status and the JSON-RPC result or error of a call
+        '''
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        try:
+            if method == 'Authenticate':
+                return 200, {'result': self.authenticate(params)}
+
+            credentials = params.get('credentials', None) or {}
+            if credentials.get('sessionId', None) not in self.sessions:
+                raise GeotabError('InvalidUserException', 'Incorrect login credentials')
+            calls = (params.get('calls', None) or []) if method == 'ExecuteMultiCall' else [{'method': method, 'params': params}]
+            self.check_rate_limit(credentials.get('userName', None), len(calls))
+            with self.lock:
+                if self.random.random() < self.http_error_rate:
+                    self.errors += 1
+                    return 503, {'error': {'name': 'ServiceUnavailable', 'message': 'Service unavailable', 'errors': []}}
+                if self.random.random() < self.error_rate:
+                    self.errors += 1
+                    raise GeotabError(self.error_name, 'Injected error')
+
+            # a multi-call fails as a whole if any of its calls fails
+            results = [self.dispatch(call.get('method', None), call.get('params', None) or {}) for call in calls]
+        except GeotabError as e:
+            return 200, {'error': e.to_json()}
+        except ValueError as e:
+            return 200, {'error': GeotabError('ArgumentException', str(e)).to_json()}
+
+        with self.lock:
+            for call in calls:
+                self.calls[f"{call.get('method', None)}:{(call.get('params', None) or {}).get('typeName', None)}"] += 1
+        return 200, {'result': results if method == 'ExecuteMultiCall' else results[0]}
+
+    def dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        search = to_datetimes(params.get('search', None) or {})
+        if method == 'Get':
+            return self.fleet.get(params.get('typeName', None), search, params.get('resultsLimit', None))
+        if method == 'GetFeed':
+            return self.fleet.get_feed(params.get('typeName', None), search, params.get('fromVersion', None), params.get('resultsLimit', None))
+        raise GeotabError('MissingMethodException', f'The method "{method}" could not be found')
+
+    def authenticate(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if (params.get('userName', None), params.get('password', None), params.get('database', None)) != (self.username, self.password, self.database):
+            raise GeotabError('InvalidUserException', 'Incorrect login credentials')
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions.add(session_id)
+            self.calls['Authenticate'] += 1
+        return {'credentials': {'userName': self.username, 'sessionId': session_id, 'database': self.database}, 'path': 'ThisServer'}
+
+    def check_rate_limit(self, username: str, num_calls: int = 1) -> None:
+        if self.rate_limit is None:
+            return
+        now = time.monotonic()
+        with self.lock:
+            recent_calls = self.recent_calls.setdefault(username, deque())
+            while recent_calls and now - recent_calls[0] >= self.rate_limit_period:
+                recent_calls.popleft()
+            if len(recent_calls) + num_calls > self.rate_limit:
+                self.throttled += 1
+                raise GeotabError('OverLimitException', f'API calls quota exceeded. Maximum admitted {self.rate_limit} per {self.rate_limit_period:g}s.')
+            recent_calls.extend([now] * num_calls)
+
+    def expire_sessions(self) -> None:
+        '''
+        Forgets every session, as the MyGeotab server does when sessions time out
+        '''
+        with self.lock:
+            self.sessions.clear()
+
+def to_iso_datetime(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def to_datetimes(search: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: datetime.datetime.fromisoformat(value) if key in DATE_PARAMETERS and isinstance(value, str) else value
+            for key, value in search.items()}
@@ -0,0 +1,154 @@
+import os
+import socket
+import threading
+from typing import Tuple
+
+import paramiko
+
+class StandInServer(paramiko.ServerInterface):
+    """
+    Accepts a single username and password
+    """
+    def __init__(self, username: str, password: str) -> None:
+        self.username = username
+        self.password = password
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username: str) -> str:
+        return 'password'
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+class StandInSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+class StandInSFTPInterface(paramiko.SFTPServerInterface):
+    """
+    Serves the files of a local root directory
+    """
+    root = None
+
+    def to_local(self, path: str) -> str:
+        return os.path.join(self.root, os.path.normpath('/' + path).lstrip('/'))
+
+    def open(self, path: str, flags: int, attr):
+        local_path = self.to_local(path)
+        try:
+            fd = os.open(local_path, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = StandInSFTPHandle(flags)
+        handle.filename = local_path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def stat(self, path: str):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.to_local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def list_folder(self, path: str):
+        local_path = self.to_local(path)
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local_path, name)), name) for name in os.listdir(local_path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def remove(self, path: str) -> int:
+        try:
+            os.remove(self.to_local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str) -> int:
+        try:
+            os.replace(self.to_local(oldpath), self.to_local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+class SFTPStandIn:
+    """
+    Local SFTP server backed by a directory, for exercising GeotabSFTP without the QuotaGuard proxy or the real server
+
+    Usage:
+        with SFTPStandIn(root_dir) as server:
+            sftp = GeotabSFTP(host=server.host, port=server.port, username=server.username, password=server.password, proxy_url='')
+    """
+    def __init__(self, root: str, username: str = 'ifta', password: str = 'ifta', host: str = '127.0.0.1', port: int = 0) -> None:
+        self.root = root
+        self.username = username
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.host, self.port = self.listener.getsockname()
+        self.transports = []
+        self.connections = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self) -> 'SFTPStandIn':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def start(self) -> None:
+        self.listener.listen(16)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self) -> None:
+        interface = type('RootedSFTPInterface', (StandInSFTPInterface,), {'root': self.root})
+        while not self.stopped.is_set():
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, interface)
+            transport.start_server(server=StandInServer(self.username, self.password))
+            self.transports.append(transport)
+
+    def drop_connections(self) -> None:
+        '''
+        Closes every open client connection, as a server restart or network failure would
+        '''
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.listener.close()
+        self.drop_connections()
@@ -0,0 +1,81 @@
+import warnings
+from email import message_from_bytes
+from email.message import Message
+from typing import List
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult, LoginPassword
+
+from daily_compliance_job.standins.tls import make_tls_context
+
+# raised from inside aiosmtpd's own AUTH handling
+warnings.filterwarnings('ignore', message='Session.login_data is deprecated')
+
+class RecordingHandler:
+    """
+    Keeps every message the stand-in accepts
+    """
+    def __init__(self) -> None:
+        self.messages: List[Message] = []
+
+    async def handle_DATA(self, server, session, envelope) -> str:
+        self.messages.append(message_from_bytes(envelope.original_content))
+        return '250 Message accepted for delivery'
+
+class PasswordAuthenticator:
+    """
+    Accepts a single username and password, counting successful logins (one per SMTP session)
+    """
+    def __init__(self, username: str, password: str) -> None:
+        self.username = username
+        self.password = password
+        self.logins = 0
+
+    def __call__(self, server, session, envelope, mechanism, auth_data) -> AuthResult:
+        if isinstance(auth_data, LoginPassword) and auth_data.login.decode() == self.username and auth_data.password.decode() == self.password:
+            self.logins += 1
+            return AuthResult(success=True)
+        return AuthResult(success=False, handled=False)
+
+class SMTPStandIn:
+    """
+    Local aiosmtpd server with STARTTLS and password login, for exercising EmailService and EmailBatch
+        without a real mail server
+
+    Usage:
+        with SMTPStandIn() as server:
+            EmailSender(email=server.username, smtp_server=server.host, smtp_port=server.port, smtp_password=server.password, ...)
+            ...
+            server.messages, server.logins
+    """
+    def __init__(self, username: str = 'ifta@example.com', password: str = 'ifta', host: str = '127.0.0.1', port: int = 8025) -> None:
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.handler = RecordingHandler()
+        self.authenticator = PasswordAuthenticator(username, password)
+        self.controller = Controller(
+            self.handler,
+            hostname=host,
+            port=port,
+            tls_context=make_tls_context(host),
+            require_starttls=True,
+            authenticator=self.authenticator,
+            auth_require_tls=True,
+        )
+
+    def __enter__(self) -> 'SMTPStandIn':
+        self.controller.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.controller.stop()
+
+    @property
+    def messages(self) -> List[Message]:
+        return self.handler.messages
+
+    @property
+    def logins(self) -> int:
+        return self.authenticator.logins
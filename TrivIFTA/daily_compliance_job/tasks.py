@@ -2,11 +2,13 @@
 
 from celery import shared_task
 from django.core.management import call_command
+from daily_compliance_job.management.commands.run_daily_job import Command as RunDailyJobCommand
 import datetime
 
-@shared_task
-def run_daily_job_task(date: datetime.date, remove_unchanged:bool = False, send_email:bool = False, save_to_db:bool = False, send_to_ftp:bool = False) -> str:
-    command_options = [date]
+@shared_task(bind=True)
+def run_daily_job_task(self, date: datetime.date = None, remove_unchanged:bool = False, send_email:bool = False, save_to_db:bool = False, send_to_ftp:bool = False, refresh:bool = False, incremental:bool = False) -> dict:
+    # the command defaults to its usual date when none is given (e.g. from celery beat)
+    command_options = [date] if date else []
     if remove_unchanged:
         command_options.append('--remove-unchanged')
     if send_email:
@@ -15,6 +17,22 @@ def run_daily_job_task(date: datetime.date, remove_unchanged:bool = False, send_
         command_options.append('--save-to-db')
     if send_to_ftp:
         command_options.append('--send-to-ftp')
+    if refresh:
+        command_options.append('--refresh')
+    if incremental:
+        command_options.append('--incremental')
+
+    command = RunDailyJobCommand()
+    # Publish each stage of the job to the result backend so the API can report progress
+    if self.request.id:
+        command.progress_callback = lambda stage: self.update_state(state='PROGRESS', meta={'stage': stage})
 
     # Run the command with the date argument and the specified options
-    return call_command('run_daily_job', *command_options)
\ No newline at end of file
+    summary = call_command(command, *command_options)
+    # the report itself stays in the ReportCache; the result backend only keeps its key
+    return {'summary': summary, 'report_key': command.report_key}
+
+@shared_task
+def maintain_partitions_task(archive: bool = True) -> str:
+    # create next months' IftaEntry partitions and move cold months out of the database
+    return call_command('ifta_partitions', *(['--archive'] if archive else []))
\ No newline at end of file
@@ -1,3 +1,461 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import paramiko
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .benchmarks.ifta import legacy_to_ifta_data_collection, make_fuel_tax_frame
+from .models import DailyMileage, EmailRecipient, EmailSender, IftaEntry, QuarterlyMileage, VinDayFingerprint
+from .services.anomalies import JUMP, MISSING_ODOMETER, ROLLBACK, TELEPORT, count_anomalies, find_anomalies
+from .services.detail_buffer import KILO_TO_MILES, FuelTaxDetailBuffer
+from .services.email import EmailBatch, EmailService, clear_sender_config
+from .services.fingerprints import ADDED, CHANGED, REMOVED, UNCHANGED, count_changes, diff_fingerprints, fingerprint_vin_days, is_first_run, select_changed
+from .services.ifta import IFTA_COLUMNS, FuelTaxProcessor
+from .services.mileage import get_quarter_mileage, get_quarter_totals
+from .services.report_cache import ReportCache
+from .services.sftp import GeotabSFTP, SFTPConnectionPool
+from .standins.sftp import SFTPStandIn
+from .standins.smtp import SMTPStandIn
+
+# save_all_entries invalidates the /api/ cache, which defaults to redis
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+API_SETTINGS = {'CACHES': LOCAL_CACHE, 'ALLOWED_HOSTS': ['testserver'], 'SECURE_SSL_REDIRECT': False}
+
+DAY = datetime.date(2024, 1, 2)
+NEXT_DAY = datetime.date(2024, 1, 3)
+
+def make_entries(rows) -> pd.DataFrame:
+    return pd.DataFrame([(vin, date, datetime.time.fromisoformat(reading_time), odometer, jurisdiction)
+                         for vin, date, reading_time, odometer, jurisdiction in rows], columns=IFTA_COLUMNS)
+
+def stored_entries() -> list:
+    return list(IftaEntry.objects.order_by('reading_date', 'vin', 'reading_time').values_list('vin', 'reading_date', 'reading_time', 'odometer', 'jurisdiction'))
+
+class FuelTaxProcessorTests(SimpleTestCase):
+    def test_csv_matches_row_by_row_transform(self):
+        for seed in (0, 1):
+            df = make_fuel_tax_frame(2_000, seed=seed)
+            expected = legacy_to_ifta_data_collection(df).to_dataframe().to_csv(index=False)
+            self.assertEqual(FuelTaxProcessor.to_ifta_dataframe(df).to_csv(index=False), expected)
+
+def make_detail(detail_id, version, enter_time, exit_time, enter_odometer, exit_odometer, jurisdiction='IL', device_id='b1'):
+    return {'id': detail_id, 'version': version, 'device': {'id': device_id},
+            'enterTime': datetime.datetime.fromisoformat(f'{DAY}T{enter_time}'), 'exitTime': datetime.datetime.fromisoformat(f'{DAY}T{exit_time}'),
+            'enterOdometer': enter_odometer, 'exitOdometer': exit_odometer, 'jurisdiction': jurisdiction}
+
+class DetailBufferTests(SimpleTestCase):
+    def test_feed_keeps_the_latest_version_in_time_order(self):
+        detail_map = FuelTaxDetailBuffer(feed=True)
+        detail_map.add_details([
+            make_detail('a1', '0000000000000001', '08:00:00', '12:00:00', 100, 200),
+            make_detail('a2', '0000000000000002', '12:00:00', '23:00:00', 200, 300, 'IN'),
+        ], {'b1': 'VIN1'})
+        # Geotab revised a1, and a detail from earlier in the day arrives after the others
+        detail_map.add_details([
+            make_detail('a0', '0000000000000003', '00:00:00', '08:00:00', 50, 100),
+            make_detail('a1', '000000000000000a', '08:00:00', '12:30:00', 100, 210),
+        ], {'b1': 'VIN1'})
+        # an older version arriving late does not replace the revision
+        detail_map.add_details([make_detail('a1', '0000000000000005', '08:00:00', '12:00:00', 100, 200)], {'b1': 'VIN1'})
+
+        df = detail_map.to_dataframe()
+
+        self.assertEqual(df['EnterReadingTime'].tolist(), [datetime.time(0, 0), datetime.time(8, 0), datetime.time(12, 0)])
+        # only the day's last segment is closed at midnight
+        self.assertEqual(df['ExitReadingTime'].tolist(), [datetime.time(8, 0), datetime.time(12, 30), datetime.time(0, 0)])
+        self.assertEqual((df['FuelTaxExitOdometer'] / KILO_TO_MILES).round(6).tolist(), [100, 210, 300])
+
+    def test_other_buffers_keep_the_order_details_were_added(self):
+        detail_map = FuelTaxDetailBuffer()
+        detail_map.add_details([
+            make_detail('a1', '0000000000000001', '08:00:00', '12:00:00', 100, 200),
+            make_detail('a0', '0000000000000002', '00:00:00', '08:00:00', 50, 100),
+        ], {'b1': 'VIN1'})
+        self.assertEqual(detail_map.to_dataframe()['EnterReadingTime'].tolist(), [datetime.time(8, 0), datetime.time(0, 0)])
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SaveAllEntriesTests(TestCase):
+    def test_upserts_existing_entries(self):
+        IftaEntry.save_all_entries(make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+        ]))
+        num_saved = IftaEntry.save_all_entries(make_entries([
+            ('VIN1', DAY, '23:59:00', 160, 'IN'),
+            ('VIN2', DAY, '09:00:00', 500, 'WI'),
+            # later readings of the same key win
+            ('VIN2', DAY, '09:00:00', 510, 'WI'),
+        ]), batch_size=2)
+
+        self.assertEqual(num_saved, 2)
+        self.assertEqual(stored_entries(), [
+            ('VIN1', DAY, datetime.time(8, 0), 100, 'IL'),
+            ('VIN1', DAY, datetime.time(23, 59), 160, 'IN'),
+            ('VIN2', DAY, datetime.time(9, 0), 510, 'WI'),
+        ])
+
+    def test_skips_rows_that_cannot_be_saved(self):
+        entries = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+        ])
+        entries.loc[len(entries)] = ['VIN2', DAY, None, 200, 'IL']
+        entries.loc[len(entries)] = ['VIN3', DAY, datetime.time(9, 0), np.nan, 'IL']
+
+        with self.assertLogs('daily_compliance_job.models', 'WARNING') as logs:
+            num_saved = IftaEntry.save_all_entries(entries)
+
+        # the batch is rejected for the missing time and saved row by row instead
+        self.assertTrue(any('retrying row by row' in line for line in logs.output))
+        self.assertEqual(num_saved, 2)
+        self.assertEqual([entry[0] for entry in stored_entries()], ['VIN1', 'VIN1'])
+
+@override_settings(**API_SETTINGS)
+class EntriesApiTests(TestCase):
+    def setUp(self):
+        IftaEntry.save_all_entries(make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '12:00:00', 130, 'IN'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+            ('VIN2', DAY, '09:00:00', 500, 'WI'),
+            ('VIN2', DAY, '23:59:00', 540, 'WI'),
+            ('VIN1', NEXT_DAY, '23:59:00', 170, 'IN'),
+        ]))
+
+    def test_pages_follow_the_cursor(self):
+        pages = []
+        params = {'limit': 2}
+        while True:
+            response = self.client.get(f'/api/entries/{DAY}/', params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([(entry['vin'], entry['reading_time']) for entry in response.json()['results']])
+            if not response.json()['next']:
+                break
+            params['cursor'] = response.json()['next']
+
+        self.assertEqual(pages, [
+            [('VIN1', '08:00:00'), ('VIN1', '12:00:00')],
+            [('VIN1', '23:59:00'), ('VIN2', '09:00:00')],
+            [('VIN2', '23:59:00')],
+        ])
+
+    def test_range_and_filters(self):
+        response = self.client.get('/api/entries/', {'from': DAY, 'to': NEXT_DAY, 'vin': 'VIN1', 'jurisdiction': 'IN'})
+        self.assertEqual([(entry['reading_date'], entry['odometer']) for entry in response.json()['results']],
+                         [(str(DAY), 130), (str(DAY), 150), (str(NEXT_DAY), 170)])
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(f'/api/entries/{DAY}/')
+        etag = response['ETag']
+
+        response = self.client.get(f'/api/entries/{DAY}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # saving an entry of the date changes the ETag
+        IftaEntry.save_all_entries(make_entries([('VIN1', DAY, '23:59:00', 155, 'IN')]))
+        response = self.client.get(f'/api/entries/{DAY}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][2]['odometer'], 155)
+
+        # other dates keep theirs
+        response = self.client.get(f'/api/entries/{NEXT_DAY}/')
+        self.assertEqual(self.client.get(f'/api/entries/{NEXT_DAY}/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_rejects_invalid_queries(self):
+        self.assertEqual(self.client.get(f'/api/entries/{DAY}/', {'cursor': 'not a cursor'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/entries/', {'from': NEXT_DAY, 'to': DAY}).status_code, 400)
+
+@override_settings(**API_SETTINGS)
+class JobStatusApiTests(SimpleTestCase):
+    def setUp(self):
+        self.report_dir = tempfile.TemporaryDirectory()
+        self.report_cache = ReportCache(self.report_dir.name)
+
+    def tearDown(self):
+        self.report_dir.cleanup()
+
+    def get_status(self, job_result):
+        result = mock.Mock(state='SUCCESS', result=job_result, **{'ready.return_value': True, 'successful.return_value': True})
+        with mock.patch('daily_compliance_job.views.AsyncResult', return_value=result), self.settings(REPORT_CACHE_DIR=self.report_dir.name):
+            response = self.client.get('/api/jobs/job-1/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_finished_job_serves_its_report(self):
+        report_df = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+        ])
+        key = self.report_cache.job_key()
+        self.report_cache.put(key, report_df)
+
+        status = self.get_status({'summary': 'Ohalloran_2024_01_02.csv: 2 rows', 'report_key': key})
+
+        self.assertEqual(status['summary'], 'Ohalloran_2024_01_02.csv: 2 rows')
+        self.assertEqual(status['text'], report_df.to_csv(index=False))
+
+    def test_expired_report_is_an_error(self):
+        status = self.get_status({'summary': 'Ohalloran_2024_01_02.csv: 2 rows', 'report_key': self.report_cache.job_key()})
+        self.assertNotIn('text', status)
+        self.assertIn('no longer cached', status['error'])
+
+        # other tasks only return a summary
+        self.assertEqual(self.get_status('Created 3 partitions'), {'job_id': 'job-1', 'state': 'SUCCESS', 'stage': 'done', 'ready': True, 'summary': 'Created 3 partitions'})
+
+class SFTPTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.server = SFTPStandIn(self.root.name)
+        self.server.start()
+        self.pool = SFTPConnectionPool(self.server.host, self.server.port, self.server.username, self.server.password, proxy_url='',
+                                       max_size=1, idle_timeout=60, keepalive=0, backoff=0)
+        self.sftp = GeotabSFTP(pool=self.pool)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+        self.root.cleanup()
+
+    def test_upload_matches_the_csv(self):
+        df = FuelTaxProcessor.to_ifta_dataframe(make_fuel_tax_frame(500))
+        expected = df.to_csv(index=False).encode('utf-8')
+
+        result = self.sftp.send_dataframe_to_sftp(df, 'report.csv', chunk_rows=64)
+
+        with open(os.path.join(self.root.name, 'report.csv'), 'rb') as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual(result.bytes_written, len(expected))
+        self.assertEqual(result.sha256, hashlib.sha256(expected).hexdigest())
+
+    def test_size_mismatch_fails_the_upload(self):
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = 1
+        with mock.patch.object(paramiko.SFTPClient, 'stat', return_value=attributes), self.assertLogs('daily_compliance_job.services.sftp', 'ERROR'):
+            with self.assertRaisesRegex(IOError, 'the server has 1'):
+                self.sftp.send_to_sftp('VIN,Odometer\n1,2\n', 'report.csv')
+
+    def test_files_share_a_connection_and_reconnect_when_dropped(self):
+        results = self.sftp.send_files([('a.csv', 'a\n1\n'), ('b.csv', pd.DataFrame({'b': [2]}))])
+        self.assertEqual([result.bytes_written for result in results], [4, 4])
+        self.assertEqual(self.server.connections, 1)
+
+        self.server.drop_connections()
+        with self.assertLogs('daily_compliance_job.services.sftp', 'WARNING'):
+            self.sftp.send_to_sftp('c\n3\n', 'c.csv')
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(sorted(os.listdir(self.root.name)), ['a.csv', 'b.csv', 'c.csv'])
+
+        self.pool.close()
+        self.assertEqual((self.pool.num_open, self.pool.idle), (0, []))
+
+class EmailBatchTests(TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+        self.server.__enter__()
+        EmailSender.objects.create(email=self.server.username, smtp_server=self.server.host, smtp_port=self.server.port,
+                                   smtp_user=self.server.username, smtp_password=self.server.password)
+        EmailRecipient.objects.create(email='compliance@example.com')
+        clear_sender_config()
+
+    def tearDown(self):
+        self.server.__exit__()
+        clear_sender_config()
+
+    def test_batch_logs_in_once(self):
+        with EmailBatch() as batch:
+            for i in range(5):
+                batch.add(EmailService(f'IFTA Backfill {i}', f'Day {i} complete'))
+            sent = batch.flush()
+            batch.send(EmailService('IFTA Backfill Success', 'All days complete'))
+
+        self.assertEqual(sent, [True] * 5)
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual([message['Subject'] for message in self.server.messages],
+                         [f'IFTA Backfill {i}' for i in range(5)] + ['IFTA Backfill Success'])
+        self.assertEqual(self.server.messages[0]['To'], 'compliance@example.com')
+
+    def test_each_send_outside_a_batch_logs_in(self):
+        self.assertTrue(EmailService('First', 'body').send())
+        self.assertTrue(EmailService('Second', 'body').send())
+        self.assertEqual(self.server.logins, 2)
+
+    @override_settings(EMAIL_ATTACHMENT_COMPRESSION='zip', EMAIL_COMPRESS_THRESHOLD=100)
+    def test_large_attachments_are_zipped(self):
+        csv_data = 'VIN,Odometer\n' + ''.join(f'VIN{i},{i}\n' for i in range(100))
+        self.assertTrue(EmailService('IFTA Report', 'Attached', attachment=csv_data, attachment_name='report.csv').send())
+
+        attachment = self.server.messages[-1].get_payload()[1]
+        self.assertEqual(attachment.get_filename(), 'report.csv.zip')
+        with zipfile.ZipFile(io.BytesIO(attachment.get_payload(decode=True))) as archive:
+            self.assertEqual(archive.read('report.csv').decode('utf-8'), csv_data)
+
+@override_settings(**API_SETTINGS)
+class MileageTests(TestCase):
+    def setUp(self):
+        IftaEntry.save_all_entries(make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '10:00:00', 150, 'IN'),
+            ('VIN1', DAY, '23:59:00', 180, 'IN'),
+            ('VIN1', NEXT_DAY, '07:00:00', 180, 'IN'),
+            ('VIN1', NEXT_DAY, '23:59:00', 200, 'IL'),
+            ('VIN2', DAY, '09:00:00', 500, 'IL'),
+            ('VIN2', DAY, '23:59:00', 560, 'IL'),
+            ('VIN2', NEXT_DAY, '09:00:00', 560, 'IL'),
+            # the odometer going backwards is left out of the miles
+            ('VIN2', NEXT_DAY, '12:00:00', 550, 'IL'),
+            ('VIN2', NEXT_DAY, '23:59:00', 600, 'IL'),
+        ]))
+
+    def assert_rollups(self, daily, quarter_totals):
+        self.assertEqual(list(DailyMileage.objects.order_by('date', 'vin', 'jurisdiction').values_list('date', 'vin', 'jurisdiction', 'miles')), daily)
+        self.assertEqual(list(QuarterlyMileage.objects.filter(year=2024, quarter=1).order_by('jurisdiction').values_list('jurisdiction', 'miles')), quarter_totals)
+
+    def test_rollups_of_saved_days(self):
+        self.assert_rollups([
+            (DAY, 'VIN1', 'IL', 50),
+            (DAY, 'VIN1', 'IN', 30),
+            (DAY, 'VIN2', 'IL', 60),
+            (NEXT_DAY, 'VIN1', 'IN', 20),
+            (NEXT_DAY, 'VIN2', 'IL', 50),
+        ], [('IL', 160), ('IN', 50)])
+        self.assertEqual(get_quarter_mileage(2024, 1).values.tolist(), [['VIN1', 'IL', 50], ['VIN1', 'IN', 50], ['VIN2', 'IL', 110]])
+        self.assertEqual(get_quarter_totals(2024, 1).values.tolist(), [['IL', 160], ['IN', 50]])
+
+    def test_resaving_a_day_updates_its_rollups(self):
+        IftaEntry.save_all_entries(make_entries([
+            ('VIN1', NEXT_DAY, '12:00:00', 190, 'WI'),
+            ('VIN1', NEXT_DAY, '23:59:00', 230, 'WI'),
+        ]))
+        self.assert_rollups([
+            (DAY, 'VIN1', 'IL', 50),
+            (DAY, 'VIN1', 'IN', 30),
+            (DAY, 'VIN2', 'IL', 60),
+            (NEXT_DAY, 'VIN1', 'IN', 10),
+            (NEXT_DAY, 'VIN1', 'WI', 40),
+            (NEXT_DAY, 'VIN2', 'IL', 50),
+        ], [('IL', 160), ('IN', 40), ('WI', 40)])
+
+    def test_quarters_refreshed_once_after_saving_days(self):
+        IftaEntry.save_all_entries(make_entries([('VIN2', NEXT_DAY, '23:59:00', 700, 'IL')]), refresh_quarters=False)
+        self.assertEqual(get_quarter_totals(2024, 1).values.tolist(), [['IL', 160], ['IN', 50]])
+
+        QuarterlyMileage.refresh({(2024, 1)})
+        self.assertEqual(get_quarter_totals(2024, 1).values.tolist(), [['IL', 260], ['IN', 50]])
+
+    def test_quarter_mileage_api(self):
+        response = self.client.get('/api/mileage/2024-Q1/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totals'], [{'jurisdiction': 'IL', 'miles': 160}, {'jurisdiction': 'IN', 'miles': 50}])
+
+        response = self.client.get('/api/mileage/2024-Q1/', {'vin': 'VIN1'})
+        self.assertEqual(response.json()['totals'], [{'jurisdiction': 'IL', 'miles': 50}, {'jurisdiction': 'IN', 'miles': 50}])
+        self.assertEqual(self.client.get('/api/mileage/2024-Q5/').status_code, 400)
+
+class AnomalyTests(SimpleTestCase):
+    def test_flags_each_anomaly_type(self):
+        df = make_entries([
+            ('VIN1', DAY, '08:00:00', 1000, 'IL'),
+            ('VIN1', DAY, '09:00:00', 990, 'IL'),
+            ('VIN1', DAY, '10:00:00', 2000, 'IL'),
+            ('VIN1', DAY, '11:00:00', 2050, 'CA'),
+            ('VIN1', DAY, '12:00:00', np.nan, 'CA'),
+            # a new VIN is not compared with the readings of the one before
+            ('VIN2', DAY, '08:00:00', 100, 'WA'),
+            ('VIN2', DAY, '09:00:00', 150, 'OR'),
+            ('VIN2', DAY, '23:59:00', 200, 'OR'),
+        ])
+
+        anomalies = find_anomalies(df, max_mph=90, jump_slack_miles=5, rollback_tolerance_miles=1)
+
+        self.assertEqual(anomalies[['ReadingTime', 'Anomaly']].values.tolist(), [
+            [datetime.time(9, 0), ROLLBACK],
+            [datetime.time(10, 0), JUMP],
+            [datetime.time(11, 0), TELEPORT],
+            [datetime.time(12, 0), MISSING_ODOMETER],
+        ])
+        self.assertEqual(anomalies['PreviousJurisdiction'].tolist(), ['IL', 'IL', 'IL', 'CA'])
+        self.assertEqual(anomalies['Miles'].tolist()[:3], [-10, 1010, 50])
+        self.assertEqual(count_anomalies(anomalies), {MISSING_ODOMETER: 1, ROLLBACK: 1, JUMP: 1, TELEPORT: 1})
+
+    def test_within_tolerances_is_not_flagged(self):
+        df = make_entries([
+            ('VIN1', DAY, '08:00:00', 1000, 'IL'),
+            ('VIN1', DAY, '09:00:00', 999.5, 'IL'),
+            ('VIN1', DAY, '10:00:00', 1090, 'IN'),
+            ('VIN1', DAY, '23:59:00', 1200, 'IN'),
+        ])
+        self.assertEqual(len(find_anomalies(df, max_mph=90, jump_slack_miles=5, rollback_tolerance_miles=1)), 0)
+
+class FingerprintTests(TestCase):
+    def test_diff_against_the_last_run(self):
+        first = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+            ('VIN2', DAY, '09:00:00', 500, 'IL'),
+            ('VIN2', DAY, '23:59:00', 560, 'IL'),
+            ('VIN3', DAY, '23:59:00', 900, 'WI'),
+        ])
+        delta = diff_fingerprints(fingerprint_vin_days(first), [DAY])
+        self.assertTrue(is_first_run(delta))
+        self.assertEqual(VinDayFingerprint.save_delta(delta), 3)
+
+        second = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+            ('VIN2', DAY, '09:00:00', 500, 'IL'),
+            ('VIN2', DAY, '23:59:00', 565, 'IL'),
+            ('VIN4', DAY, '23:59:00', 50, 'IA'),
+        ])
+        delta = diff_fingerprints(fingerprint_vin_days(second), [DAY])
+
+        self.assertFalse(is_first_run(delta))
+        self.assertEqual(dict(zip(delta['VIN'], delta['Change'])), {'VIN1': UNCHANGED, 'VIN2': CHANGED, 'VIN3': REMOVED, 'VIN4': ADDED})
+        self.assertEqual(count_changes(delta), {ADDED: 1, CHANGED: 1, UNCHANGED: 1, REMOVED: 1})
+        self.assertEqual(select_changed(second, delta)['VIN'].tolist(), ['VIN2', 'VIN2', 'VIN4'])
+
+        VinDayFingerprint.save_delta(delta)
+        self.assertEqual(sorted(VinDayFingerprint.objects.values_list('vin', flat=True)), ['VIN1', 'VIN2', 'VIN4'])
+        self.assertEqual(count_changes(diff_fingerprints(fingerprint_vin_days(second), [DAY]))[UNCHANGED], 3)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_removed_vin_days_are_deleted_from_the_database(self):
+        first = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+            ('VIN2', DAY, '09:00:00', 500, 'IL'),
+            ('VIN2', DAY, '23:59:00', 560, 'IL'),
+        ])
+        IftaEntry.save_all_entries(first)
+        VinDayFingerprint.save_delta(diff_fingerprints(fingerprint_vin_days(first), [DAY]), delete_entries=True)
+        self.assertEqual(get_quarter_totals(2024, 1).values.tolist(), [['IL', 110]])
+
+        # Geotab no longer returns VIN2's readings
+        delta = diff_fingerprints(fingerprint_vin_days(first[first['VIN'] == 'VIN1']), [DAY])
+        with self.captureOnCommitCallbacks(execute=True):
+            VinDayFingerprint.save_delta(delta, delete_entries=True)
+
+        self.assertEqual([entry[0] for entry in stored_entries()], ['VIN1', 'VIN1'])
+        self.assertEqual(list(DailyMileage.objects.values_list('vin', flat=True).distinct()), ['VIN1'])
+        self.assertEqual(get_quarter_totals(2024, 1).values.tolist(), [['IL', 50]])
+        self.assertEqual(list(VinDayFingerprint.objects.values_list('vin', flat=True)), ['VIN1'])
+
+    def test_fingerprint_ignores_row_order_and_odometer_type(self):
+        df = make_entries([
+            ('VIN1', DAY, '08:00:00', 100, 'IL'),
+            ('VIN1', DAY, '12:00:00', 130, 'IN'),
+            ('VIN1', DAY, '23:59:00', 150, 'IN'),
+        ])
+        shuffled = df.iloc[[2, 0, 1]].astype({'Odometer': 'float64'})
+        self.assertEqual(fingerprint_vin_days(df)['Fingerprint'].tolist(), fingerprint_vin_days(shuffled)['Fingerprint'].tolist())
+
+        corrected = df.copy()
+        corrected.loc[1, 'Jurisdiction'] = 'WI'
+        self.assertNotEqual(fingerprint_vin_days(df)['Fingerprint'].tolist(), fingerprint_vin_days(corrected)['Fingerprint'].tolist())
@@ -1,7 +1,6 @@
 from cryptography.fernet import Fernet
 from django.conf import settings
 import csv
-import json
 
 def get_fernet():
     # Generate a key if it doesn't exist
@@ -17,6 +16,10 @@ def decrypt_data(data):
     f = get_fernet()
     return f.decrypt(data.encode()).decode()
 
-def convert_csv_to_json(csv_data: str) -> str:
-    # return the csv data as a json object of the form: {"text": csv_data}
-    return json.dumps({"text": csv_data})
\ No newline at end of file
+def get_report_file_name(date) -> str:
+    # name of the IFTA report CSV for a given date, e.g. Ohalloran_2024_01_31.csv
+    return f'Ohalloran_{date.year}_{date.month:02d}_{date.day:02d}.csv'
+
+def get_update_file_name(date, generated_at) -> str:
+    # name of a CSV re-sending the VIN-days that changed since the report for a given date, e.g. Ohalloran_2024_01_31_update_20240204_120000.csv
+    return f'Ohalloran_{date.year}_{date.month:02d}_{date.day:02d}_update_{generated_at:%Y%m%d_%H%M%S}.csv'
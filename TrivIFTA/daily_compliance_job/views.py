@@ -1,15 +1,29 @@
+from celery.result import AsyncResult
+from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .tasks import run_daily_job_task
-from .utils import convert_csv_to_json
 from django.http import JsonResponse, HttpResponseServerError
 from .models import IftaEntry
+from .services.entry_cache import EntryCache
+from .services.report_cache import ReportCache
+from .services.mileage import get_jurisdiction_totals, get_quarter_mileage, get_quarter_totals, parse_quarter, quarter_dates, to_records
+import base64
+import datetime
+import json
 import logging
 import os
-from .serializers import IftaEntrySerializer
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_ENTRIES_PAGE_SIZE = 1000
+MAX_ENTRIES_PAGE_SIZE = 10000
+MAX_ENTRIES_RANGE_DAYS = 366
+ENTRY_FIELDS = ['id', 'vin', 'reading_date', 'reading_time', 'odometer', 'jurisdiction']
+
 @api_view(['GET'])
 def get_config(request) -> JsonResponse:
     API_BASE_URL = os.environ.get('API_BASE_URL', 'http://localhost:8000')
@@ -24,22 +38,172 @@ def run_job(request) -> JsonResponse | HttpResponseServerError:
         send_email = request.data.get('send_email', False)
         save_to_db = request.data.get('save_to_db', False)
         send_to_ftp = request.data.get('send_to_ftp', False)
+        refresh = request.data.get('refresh', False)
+        incremental = request.data.get('incremental', False)
 
-        # Run the job and get the CSV data
-        csv_data = run_daily_job_task(date, remove_unchanged, send_email, save_to_db, send_to_ftp)
-
-        # Convert the CSV data to JSON
-        json_data = convert_csv_to_json(csv_data)
+        # Queue the job on the Celery worker; the result is fetched from get_job_status
+        task = run_daily_job_task.delay(date, remove_unchanged, send_email, save_to_db, send_to_ftp, refresh, incremental)
 
-        # Return the data in the response
-        return Response(json_data, content_type='application/json')
+        return Response({'job_id': task.id}, status=status.HTTP_202_ACCEPTED, content_type='application/json')
     
     except Exception as e:
         logger.exception(e)
         return HttpResponseServerError(e)
+
+@api_view(['GET'])
+def get_job_status(request, job_id):
+    """
+    Report the current state of a queued job, and its result once it has finished
+    A finished daily job also returns the report it produced as CSV 'text', read from the ReportCache
+    Answers right away, so a request never holds a web worker while the job runs; clients poll at an interval
+    """
+    result = AsyncResult(job_id)
+    job_status = {'job_id': job_id, 'state': result.state, 'stage': get_job_stage(result), 'ready': result.ready()}
+    if result.successful():
+        job_status.update(get_job_report(result.result))
+    elif result.failed():
+        job_status['error'] = str(result.result)
+    return Response(job_status)
+
+def get_job_report(job_result) -> dict:
+    # other tasks return their summary as is
+    if not isinstance(job_result, dict):
+        return {'summary': job_result}
+    job_report = {'summary': job_result['summary']}
+    if job_result['report_key']:
+        report_df = ReportCache().get(job_result['report_key'])
+        if report_df is None:
+            job_report['error'] = 'The report of this job is no longer cached; run the job again'
+        else:
+            job_report['text'] = report_df.to_csv(index=False)
+    return job_report
+
+def get_job_stage(result: AsyncResult) -> str:
+    if result.state == 'PROGRESS' and isinstance(result.info, dict):
+        return result.info.get('stage', None)
+    return {'PENDING': 'queued', 'STARTED': 'started', 'SUCCESS': 'done', 'FAILURE': 'failed'}.get(result.state, result.state.lower())
     
 @api_view(['GET'])
-def get_entries_by_date(request, date):
-    entries = IftaEntry.objects.filter(reading_date=date)
-    serializer = IftaEntrySerializer(entries, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+def get_entries(request, date: str = None):
+    """
+    List entries ordered by date, VIN and time
+    Filter with ?from=&to= (inclusive dates, or the date in the URL), ?vin= and ?jurisdiction=
+    Pages hold ?limit= entries; pass a page's next cursor as ?cursor= to get the page after it
+    Responses carry an ETag, and a matching If-None-Match is answered with 304 without querying the database
+    """
+    try:
+        from_date = datetime.date.fromisoformat(date or request.query_params['from'])
+        to_date = datetime.date.fromisoformat(date or request.query_params.get('to', from_date.isoformat()))
+        limit = min(int(request.query_params.get('limit', DEFAULT_ENTRIES_PAGE_SIZE)), MAX_ENTRIES_PAGE_SIZE)
+        cursor = request.query_params.get('cursor', None)
+        after = decode_cursor(cursor) if cursor else None
+    except (KeyError, ValueError) as e:
+        return Response({'error': f'Invalid entries query: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    num_days = (to_date - from_date).days + 1
+    if num_days < 1 or num_days > MAX_ENTRIES_RANGE_DAYS or limit < 1:
+        return Response({'error': f'Query at most {MAX_ENTRIES_RANGE_DAYS} days and at least 1 entry per page'}, status=status.HTTP_400_BAD_REQUEST)
+
+    query = {
+        'from': from_date,
+        'to': to_date,
+        'vin': request.query_params.get('vin', None),
+        'jurisdiction': request.query_params.get('jurisdiction', None),
+        'cursor': cursor,
+        'limit': limit,
+    }
+    entry_cache = EntryCache()
+    etag = quote_etag(entry_cache.etag([from_date + datetime.timedelta(days=i) for i in range(num_days)], query))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    page = entry_cache.get_page(etag)
+    if page is None:
+        page = get_entries_page(from_date, to_date, query['vin'], query['jurisdiction'], after, limit)
+        entry_cache.put_page(etag, page)
+
+    response = Response(page)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def get_entries_page(from_date: datetime.date, to_date: datetime.date, vin: str, jurisdiction: str, after: tuple, limit: int) -> dict:
+    entries = IftaEntry.objects.filter(reading_date__gte=from_date, reading_date__lte=to_date)
+    if vin:
+        entries = entries.filter(vin=vin)
+    if jurisdiction:
+        entries = entries.filter(jurisdiction=jurisdiction)
+    if after:
+        # keyset pagination over the (reading_date, vin, reading_time) index
+        after_date, after_vin, after_time = after
+        entries = entries.filter(
+            Q(reading_date__gt=after_date)
+            | Q(reading_date=after_date, vin__gt=after_vin)
+            | Q(reading_date=after_date, vin=after_vin, reading_time__gt=after_time)
+        )
+
+    # fetch one extra row to know whether there is a next page
+    results = list(entries.order_by('reading_date', 'vin', 'reading_time').values(*ENTRY_FIELDS)[:limit + 1])
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor((last['reading_date'], last['vin'], last['reading_time']))
+    return {'results': results, 'next': next_cursor}
+
+@api_view(['GET'])
+def get_quarter_mileage_view(request, quarter: str):
+    """
+    Miles driven per VIN per jurisdiction in an IFTA quarter (format YYYY-Q<n>), with the fleet totals per jurisdiction
+    Filter with ?vin= and ?jurisdiction=
+    Read from the DailyMileage and QuarterlyMileage rollups, so the cost does not grow with the history kept
+    Responses are cached and carry an ETag like /api/entries/, changing whenever an entry of the quarter is saved
+    """
+    try:
+        year, quarter_number = parse_quarter(quarter)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    from_date, to_date = quarter_dates(year, quarter_number)
+
+    query = {
+        'mileage': f'{year}-Q{quarter_number}',
+        'vin': request.query_params.get('vin', None),
+        'jurisdiction': request.query_params.get('jurisdiction', None),
+    }
+    dates = [from_date + datetime.timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+    entry_cache = EntryCache()
+    etag = quote_etag(entry_cache.etag(dates, query))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    page = entry_cache.get_page(etag)
+    if page is None:
+        mileage = get_quarter_mileage(year, quarter_number, query['vin'], query['jurisdiction'])
+        # the fleet totals are kept per quarter, but a single VIN's are summed from its rows
+        totals = get_jurisdiction_totals(mileage) if query['vin'] else get_quarter_totals(year, quarter_number, query['jurisdiction'])
+        page = {
+            'quarter': query['mileage'],
+            'from': from_date,
+            'to': to_date,
+            'totals': [{'jurisdiction': jurisdiction, 'miles': int(miles)} for jurisdiction, miles in totals.itertuples(index=False, name=None)],
+            'results': to_records(mileage),
+        }
+        entry_cache.put_page(etag, page)
+
+    response = Response(page)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def encode_cursor(position: tuple) -> str:
+    reading_date, vin, reading_time = position
+    content = json.dumps([reading_date.isoformat(), vin, reading_time.isoformat()])
+    return base64.urlsafe_b64encode(content.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        reading_date, vin, reading_time = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.date.fromisoformat(reading_date), vin, datetime.time.fromisoformat(reading_time)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f'bad cursor {cursor}') from e
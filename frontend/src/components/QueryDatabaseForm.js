@@ -43,9 +43,20 @@ function QueryDatabaseForm() {
     const handleDayClick = async (day) => {
         setDay(day);
         const formattedDate = `${year}-${String(month).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
-        const response = await fetch(new URL(`api/entries/${formattedDate}/`, API_BASE_URL).toString());
-        const jsonData = await response.json();
-        setData(jsonData);
+        // Follow the cursor through every page of the day's entries
+        const entries = [];
+        let cursor = null;
+        do {
+            const url = new URL(`api/entries/${formattedDate}/`, API_BASE_URL);
+            if (cursor) {
+                url.searchParams.set('cursor', cursor);
+            }
+            const response = await fetch(url.toString());
+            const page = await response.json();
+            entries.push(...page.results);
+            cursor = page.next;
+        } while (cursor);
+        setData(entries);
     };
 
   const downloadCSV = () => {
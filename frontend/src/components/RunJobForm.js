@@ -7,6 +7,19 @@ import './RunJobForm.css';
 import ReactDOM from 'react-dom';
 import API_BASE_URL from '../config';
 
+// Milliseconds between two job status requests
+const JOB_STATUS_POLL_INTERVAL_MS = 2000;
+
+const STAGE_LABELS = {
+  queued: 'Queued',
+  started: 'Starting',
+  fetching: 'Fetching from Geotab',
+  processing: 'Processing',
+  uploading: 'Uploading to FTP',
+  emailing: 'Sending email',
+  saving: 'Saving to database',
+};
+
 function RunJobForm() {
 
   const [date, setDate] = useState(null);
@@ -17,6 +30,7 @@ function RunJobForm() {
     send_to_ftp: false,
   });
   const [loading, setLoading] = useState(false);
+  const [stage, setStage] = useState(null);
   const [csvData, setCsvData] = useState(null);
   const [csvString, setCsvString] = useState(null);
   const [dataLoaded, setDataLoaded] = useState(false);
@@ -61,19 +75,33 @@ function RunJobForm() {
         }
       });
   
-      const csvString = JSON.parse(response.data).text; // Extract CSV string from API response
-      setCsvString(csvString);
-  
-      if (csvString) {
-        const parsedData = await parseCSVData(csvString);
-        setCsvData(parsedData);
-      } else {
-        throw new Error("CSV data is undefined or empty");
+      const job = await waitForJob(response.data.job_id); // The finished job serves the report it produced as CSV
+      if (!job.text) {
+        throw new Error(job.error || `No report rows for ${formattedDate}: ${job.summary}`);
       }
+      setCsvString(job.text);
+      setCsvData(await parseCSVData(job.text));
     } catch (error) {
       console.error('There was an error!', error);
     } finally {
       setLoading(false);
+      setStage(null);
+    }
+  };
+
+  // Poll the job status every JOB_STATUS_POLL_INTERVAL_MS until the job finishes, returning its status
+  const waitForJob = async (jobId) => {
+    const jobStatusUrl = new URL(`api/jobs/${jobId}/`, API_BASE_URL).toString();
+    while (true) {
+      const { data } = await axios.get(jobStatusUrl);
+      if (data.ready) {
+        if (data.state !== 'SUCCESS') {
+          throw new Error(data.error || `Job ${jobId} ended in state ${data.state}`);
+        }
+        return data;
+      }
+      setStage(data.stage);
+      await new Promise(resolve => setTimeout(resolve, JOB_STATUS_POLL_INTERVAL_MS));
     }
   };
   
@@ -151,6 +179,7 @@ function RunJobForm() {
             <div className="submit-button-wrapper">
                 <button type="submit" className="submit-button">Go</button>
                 {loading && <div className="loader"></div>}
+                {loading && stage && <span className="job-stage">{STAGE_LABELS[stage] || stage}...</span>}
             </div>
         </form>
         {dataLoaded && (